@@ -0,0 +1,89 @@
+# autosell.py
+# 自動売却ルール。
+# 1ルール = 「キャラ」「ティア」「ミューテーション（mut_id のビットマスク）」「価値が N cats 未満」の AND 条件。
+# 未指定（None）の条件は「すべて」。ユーザーのルールは複数あれば OR。
+# ユーザーごとに Matcher へまとめ、ティアごとに「売る装飾名」の frozenset へコンパイルしておく。
+# 抽選結果の振り分けは集合の所属判定だけで済む（db のユーザーキャッシュに載り、ルール編集で無効化される）。
+from typing import Dict, FrozenSet, Iterable, List, NamedTuple, Optional, Tuple
+from constants import TIERS
+import catalog
+
+MUT_NONE_ONLY = 1                              # mut_id 0（ミューテーションなし）だけ
+MUT_ALL = (1 << len(catalog.MUT_NAMES)) - 1    # すべて
+
+def mut_bit(mut_name: Optional[str]) -> int:
+    return 1 << (catalog.MUT_ID[mut_name] if mut_name else 0)
+
+class Rule(NamedTuple):
+    rule_id: int
+    char_id: Optional[int]     # None=全キャラ
+    tier: Optional[str]        # None=全ティア
+    mut_mask: int              # 対象の mut_id のビット
+    max_value: Optional[int]   # None=上限なし（価値がこれ未満なら売る）
+
+    def describe(self) -> str:
+        parts = []
+        if self.char_id is not None:
+            parts.append(catalog.CHAR_NAMES[self.char_id] or f"#{self.char_id}")
+        if self.tier is not None:
+            parts.append(f"{self.tier} ブロック")
+        if self.mut_mask == MUT_ALL:
+            parts.append("ミューテーション問わず")
+        elif self.mut_mask == MUT_NONE_ONLY:
+            parts.append("ミューテーションなし")
+        else:
+            names = [catalog.MUT_NAMES[m] or "なし" for m in range(len(catalog.MUT_NAMES)) if self.mut_mask >> m & 1]
+            parts.append("/".join(names))
+        if self.max_value is not None:
+            parts.append(f"{self.max_value:,} cats 未満")
+        return "・".join(parts)
+
+    @property
+    def is_char_only(self) -> bool:
+        """/autosell（キャラ選択UI）で作った形のルールか"""
+        return (self.char_id is not None and self.tier is None
+                and self.mut_mask == MUT_NONE_ONLY and self.max_value is None)
+
+class Matcher:
+    """ユーザー1人分のルール。ティアごとの売却対象を遅延コンパイルして持つ"""
+    __slots__ = ("rules", "_by_tier")
+
+    def __init__(self, rules: Iterable[Rule]):
+        self.rules: Tuple[Rule, ...] = tuple(rules)
+        self._by_tier: Dict[str, FrozenSet[str]] = {}
+
+    def __bool__(self) -> bool:
+        return bool(self.rules)
+
+    def _compile(self, tier_name: str) -> FrozenSet[str]:
+        chars = [catalog.CHAR_ID[n] for n, _ in TIERS[tier_name]["entries"]]
+        out = set()
+        for r in self.rules:
+            if r.tier is not None and r.tier != tier_name:
+                continue
+            for cid in chars:
+                if r.char_id is not None and r.char_id != cid:
+                    continue
+                for mid, v in enumerate(catalog.VALUES[cid]):
+                    if r.mut_mask >> mid & 1 and (r.max_value is None or v < r.max_value):
+                        out.add(catalog.NAMES[cid][mid])
+        return frozenset(out)
+
+    def for_tier(self, tier_name: str) -> FrozenSet[str]:
+        """tier_name のブロックから出たときに売る装飾名の集合"""
+        s = self._by_tier.get(tier_name)
+        if s is None:
+            s = self._by_tier[tier_name] = self._compile(tier_name) if self.rules else frozenset()
+        return s
+
+    def split(self, tier_name: str, pulls: Iterable[Tuple[str, int]]) -> Tuple[List[Tuple[str, int]], List[Tuple[str, int]]]:
+        """抽選結果 [(装飾名, 価値), ...] を (残す, 売る) に振り分ける"""
+        sell = self.for_tier(tier_name)
+        keep, sold = [], []
+        for p in pulls:
+            (sold if p[0] in sell else keep).append(p)
+        return keep, sold
+
+    def char_names(self) -> List[str]:
+        """キャラ単位のルール（/autosell で追加したもの）のキャラ名"""
+        return [catalog.CHAR_NAMES[r.char_id] for r in self.rules if r.is_char_only]
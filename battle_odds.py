@@ -0,0 +1,87 @@
+# battle_odds.py
+# /luckyblock_battle の勝敗確率を解析的に求める。
+# 1回の開封価値の分布（キャラ確率 × ミューテーション確率）を count 回畳み込んで合計価値の分布を作る。
+# 両者は同じ分布の独立な和なので P(引き分け)=Σ P(S=s)²、P(勝ち)=P(負け)=(1−P(引き分け))/2。
+# 合計価値の取りうる値は count とともに急増する（Spooky ×5 で約170万通り）ため、
+# 畳み込みのたびに確率 PRUNE_EPS 未満の値を捨てる。捨てた確率の合計は lost に残る（0 なら厳密値）。
+# 引き分け確率はほぼ大きい確率の値だけで決まるので、PRUNE_EPS=1e-6 での誤差は相対 1% 未満。
+# 計算は要求された (tier, count) の分だけ行う（重いティアの ×10 は数秒かかるので、bot からはプロセスプールで流す）。
+import threading
+from typing import Dict, List, NamedTuple, Optional, Tuple
+import pull_engine
+import sampler
+
+MAX_COUNT = 10
+PRUNE_EPS = 1e-6
+
+class BattleOdds(NamedTuple):
+    tier: str
+    count: int
+    p_win: float       # 招待した側から見た勝ち（= 負け）
+    p_draw: float
+    expected_pot: int  # 両者の合計価値の期待値
+    lost: float        # 枝刈りで捨てた確率
+
+    @property
+    def exact(self) -> bool:
+        return self.lost == 0.0
+
+_ODDS: Dict[Tuple[str, int], BattleOdds] = {}
+_lock = threading.Lock()
+
+def value_distribution(tier_name: str) -> Dict[int, float]:
+    """1回開けたときの {価値: 確率}"""
+    tp = sampler.TIER_TABLES[tier_name].probabilities()
+    mp = sampler.MUTATION_TABLE.probabilities()
+    out: Dict[int, float] = {}
+    for row, p in zip(pull_engine.VALUE_MATRIX[tier_name], tp):
+        for v, q in zip(row, mp):
+            out[v] = out.get(v, 0.0) + p * q
+    return out
+
+def _convolve(dist: Dict[int, float], base: List[Tuple[int, float]]) -> Tuple[Dict[int, float], float]:
+    """dist と1回分の分布 base の畳み込み。PRUNE_EPS 未満を捨て、(結果, 捨てた確率) を返す"""
+    out: Dict[int, float] = {}
+    get = out.get
+    items = list(dist.items())
+    for y, q in base:
+        for x, p in items:
+            s = x + y
+            out[s] = get(s, 0.0) + p * q
+    small = [s for s, p in out.items() if p < PRUNE_EPS]
+    lost = sum(out.pop(s) for s in small)
+    return out, lost
+
+def compute(tier_name: str, count: int) -> List[BattleOdds]:
+    """(tier, 1)〜(tier, count) の勝敗確率を計算する（重い。プロセスプールへ投げられるよう結果だけを返す）"""
+    if not 1 <= count <= MAX_COUNT:
+        raise ValueError(f"count は 1〜{MAX_COUNT}: {count}")
+    base = sorted(value_distribution(tier_name).items())
+    mean = sum(v * p for v, p in base)
+    dist, lost = dict(base), 0.0
+    out: List[BattleOdds] = []
+    for c in range(1, count + 1):
+        if c > 1:
+            dist, dropped = _convolve(dist, base)
+            lost += dropped
+        p_draw = sum(p * p for p in dist.values())
+        out.append(BattleOdds(tier_name, c, (1.0 - p_draw) / 2, p_draw, int(round(2 * c * mean)), lost))
+    return out
+
+def store(rows: List[BattleOdds]):
+    """compute の結果をキャッシュに入れる"""
+    for o in rows:
+        _ODDS[(o.tier, o.count)] = o
+
+def battle_odds(tier_name: str, count: int) -> BattleOdds:
+    """(tier, count) の勝敗確率。未計算ならこのスレッドで count まで計算する（重い）"""
+    key = (tier_name, count)
+    if key not in _ODDS:
+        with _lock:
+            if key not in _ODDS:
+                store(compute(tier_name, count))
+    return _ODDS[key]
+
+def cached_odds(tier_name: str, count: int) -> Optional[BattleOdds]:
+    """計算済みなら返す（イベントループ上から待たずに引く用）"""
+    return _ODDS.get((tier_name, count))
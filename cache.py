@@ -0,0 +1,70 @@
+# cache.py
+# プロセス内の小さなキャッシュ
+import time
+from collections import OrderedDict
+from typing import Any, Hashable, Optional
+
+class LRUCache:
+    """上限つきの LRU。上限を超えたら最も長く使われていないものから捨てる"""
+    def __init__(self, maxsize: int):
+        self.maxsize = maxsize
+        self._data: "OrderedDict[Hashable, Any]" = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key: Hashable, default: Any = None) -> Any:
+        try:
+            value = self._data[key]
+        except KeyError:
+            self.misses += 1
+            return default
+        self._data.move_to_end(key)
+        self.hits += 1
+        return value
+
+    def put(self, key: Hashable, value: Any):
+        self._data[key] = value
+        self._data.move_to_end(key)
+        while len(self._data) > self.maxsize:
+            self._data.popitem(last=False)
+
+    def pop(self, key: Hashable, default: Any = None) -> Optional[Any]:
+        return self._data.pop(key, default)
+
+    def clear(self):
+        self._data.clear()
+
+    def __contains__(self, key: Hashable) -> bool:
+        return key in self._data
+
+    def __len__(self) -> int:
+        return len(self._data)
+
+class TTLCache(LRUCache):
+    """LRU に有効期限をつけたもの。put から ttl 秒を過ぎた値は無いものとして扱う"""
+    def __init__(self, maxsize: int, ttl: float):
+        super().__init__(maxsize)
+        self.ttl = ttl
+
+    def get(self, key: Hashable, default: Any = None) -> Any:
+        item = super().get(key)
+        if item is None:
+            return default
+        expires, value = item
+        if expires <= time.monotonic():
+            self._data.pop(key, None)
+            self.hits -= 1
+            self.misses += 1
+            return default
+        return value
+
+    def put(self, key: Hashable, value: Any, ttl: Optional[float] = None):
+        super().put(key, (time.monotonic() + (self.ttl if ttl is None else ttl), value))
+
+    def pop(self, key: Hashable, default: Any = None) -> Optional[Any]:
+        item = self._data.pop(key, None)
+        return default if item is None else item[1]
+
+    def __contains__(self, key: Hashable) -> bool:
+        item = self._data.get(key)
+        return item is not None and item[0] > time.monotonic()
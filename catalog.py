@@ -0,0 +1,110 @@
+# catalog.py
+# キャラ/ミューテーションの整数ID表。
+# DB には装飾名（"X (Gold)"）ではなく (char_id, mut_id) を保存し、表示時にだけ名前へ戻す。
+# char_id は DB の catalog テーブルが正。起動時に db.init_db から load() で同期する。
+import sys
+from typing import Dict, List, Optional, Tuple, Iterable
+from constants import TIERS, CHAR_VALUES, MUTATIONS, MUTATION_INDEX
+
+# ===== ミューテーション（0=なし、以降は MUTATION_INDEX と同じ1始まり） =====
+MUT_NAMES: List[Optional[str]] = [None] + [n for n, _, _ in MUTATIONS]
+MUT_MULT: List[float] = [1.0] + [m for _, m, _ in MUTATIONS]
+MUT_ID: Dict[str, int] = dict(MUTATION_INDEX)
+
+# ===== キャラ（char_id 0 は欠番） =====
+CHAR_NAMES: List[Optional[str]] = [None]
+CHAR_ID: Dict[str, int] = {}
+
+# VALUES[char_id][mut_id] = 価値、NAMES[char_id][mut_id] = 装飾名
+VALUES: List[List[int]] = [[]]
+NAMES: List[List[str]] = [[]]
+# 装飾名 → (char_id, mut_id)
+_ENCODED: Dict[str, Tuple[int, int]] = {}
+# 装飾名 → 価値（utils.base_value の表引き用）
+VALUE_BY_NAME: Dict[str, int] = {}
+
+def _decorated(base: str, mut: Optional[str]) -> str:
+    # intern しておくと、sampler が返す同じ名前とは同一オブジェクトになり辞書引きが速い
+    return sys.intern(f"{base} ({mut})" if mut else base)
+
+def _compile(cid: int, name: str):
+    """1キャラ分の価値行・名前行を組み立てる"""
+    while len(VALUES) <= cid:
+        VALUES.append([])
+        NAMES.append([])
+    if name not in CHAR_VALUES:
+        print(f"[catalog] 価値が未定義のキャラ（0 として扱う）: {name!r}", file=sys.stderr)
+    v = int(CHAR_VALUES.get(name, 0))
+    VALUES[cid] = [v] + [int(v * m) for m in MUT_MULT[1:]]
+    NAMES[cid] = [_decorated(name, m) for m in MUT_NAMES]
+    for mid, dn in enumerate(NAMES[cid]):
+        _ENCODED[dn] = (cid, mid)
+        VALUE_BY_NAME[dn] = VALUES[cid][mid]
+
+def register(name: str, cid: Optional[int] = None) -> int:
+    """キャラ名を登録して char_id を返す（登録済みならそのID）"""
+    if name in CHAR_ID:
+        return CHAR_ID[name]
+    if cid is None:
+        cid = len(CHAR_NAMES)
+    while len(CHAR_NAMES) <= cid:
+        CHAR_NAMES.append(None)
+    CHAR_NAMES[cid] = name
+    CHAR_ID[name] = cid
+    _compile(cid, name)
+    return cid
+
+def check_names():
+    """TIERS と CHAR_VALUES の名前の食い違いを検出する（価値の無いキャラが抽選されるならエラー）"""
+    pulled = {n for t in TIERS.values() for n, _ in t["entries"]}
+    missing = sorted(pulled - set(CHAR_VALUES))
+    if missing:
+        raise ValueError(f"CHAR_VALUES に価値が無いキャラが TIERS にあります: {missing}")
+    orphans = sorted(set(CHAR_VALUES) - pulled)
+    if orphans:
+        print(f"[catalog] TIERS に無いキャラ（抽選されない表記ゆれ？）: {orphans}", file=sys.stderr)
+
+def default_names() -> List[str]:
+    """新規DBで採番する順（TIERS の出現順 → 残りの CHAR_VALUES）"""
+    out: List[str] = []
+    for t in TIERS.values():
+        for n, _ in t["entries"]:
+            if n not in out:
+                out.append(n)
+    for n in CHAR_VALUES:
+        if n not in out:
+            out.append(n)
+    return out
+
+def load(rows: Iterable[Tuple[int, str]]):
+    """DB の catalog テーブル (char_id, name) で置き換える"""
+    CHAR_NAMES[:] = [None]
+    CHAR_ID.clear()
+    VALUES[:] = [[]]
+    NAMES[:] = [[]]
+    _ENCODED.clear()
+    VALUE_BY_NAME.clear()
+    for cid, name in sorted(rows):
+        register(name, cid)
+
+def encode(name: str) -> Optional[Tuple[int, int]]:
+    """装飾名 → (char_id, mut_id)。未登録のキャラなら None"""
+    return _ENCODED.get(name)
+
+def split(name: str) -> Tuple[str, int]:
+    """装飾名 → (キャラ名, mut_id)。未知のミューテーションは名前の一部として扱う"""
+    if name.endswith(")"):
+        i = name.rfind(" (")
+        if i != -1 and name[i+2:-1] in MUT_ID:
+            return name[:i], MUT_ID[name[i+2:-1]]
+    return name, 0
+
+def decode(cid: int, mid: int) -> str:
+    return NAMES[cid][mid]
+
+def value(cid: int, mid: int) -> int:
+    return VALUES[cid][mid]
+
+check_names()
+for _n in default_names():
+    register(_n)
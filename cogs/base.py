@@ -2,69 +2,18 @@
 import discord
 from discord.ext import commands
 from discord import app_commands
-import aiosqlite
 
-from constants import GUILD_ID
-from db import get_user_row, update_user, list_base, remove_from_slot
-from utils import fmt_compact, base_value
-
-DB_PATH = "luckyblock.db"
+from constants import GUILD_ID, BASE_SLOTS
+from db import list_base, get_favorites, add_favorite, remove_favorite, economy_tx
+from utils import fmt_compact, base_value, parse_slots
+from locks import user_locks
+from ratelimit import limited
 
 
 def guild_decorator():
     return app_commands.guilds(discord.Object(id=int(GUILD_ID))) if GUILD_ID else (lambda f: f)
 
 
-# ===== お気に入りスロット用テーブル =====
-async def ensure_favorite_table():
-    async with aiosqlite.connect(DB_PATH) as db:
-        await db.execute(
-            """
-            CREATE TABLE IF NOT EXISTS favorites (
-                user_id INTEGER NOT NULL,
-                slot    INTEGER NOT NULL,
-                PRIMARY KEY(user_id, slot)
-            )
-            """
-        )
-        await db.commit()
-
-
-async def get_favorites(uid: int):
-    await ensure_favorite_table()
-    async with aiosqlite.connect(DB_PATH) as db:
-        cur = await db.execute("SELECT slot FROM favorites WHERE user_id=?", (uid,))
-        rows = await cur.fetchall()
-        return [r[0] for r in rows]
-
-
-async def add_favorite(uid: int, slot: int):
-    await ensure_favorite_table()
-    async with aiosqlite.connect(DB_PATH) as db:
-        await db.execute(
-            "INSERT OR IGNORE INTO favorites(user_id, slot) VALUES(?, ?)",
-            (uid, slot),
-        )
-        await db.commit()
-
-
-async def remove_favorite(uid: int, slot: int):
-    await ensure_favorite_table()
-    async with aiosqlite.connect(DB_PATH) as db:
-        await db.execute(
-            "DELETE FROM favorites WHERE user_id=? AND slot=?",
-            (uid, slot),
-        )
-        await db.commit()
-
-
-async def clear_favorites(uid: int):
-    await ensure_favorite_table()
-    async with aiosqlite.connect(DB_PATH) as db:
-        await db.execute("DELETE FROM favorites WHERE user_id=?", (uid,))
-        await db.commit()
-
-
 class BaseCog(commands.Cog):
     def __init__(self, bot: commands.Bot):
         self.bot = bot
@@ -72,7 +21,7 @@ class BaseCog(commands.Cog):
     # --- /base : ベース表示（公開・価値つき・⭐はお気に入り） ---
     @app_commands.command(
         name="base",
-        description="ベース（1〜25スロット）を表示します。"
+        description=f"ベース（1〜{BASE_SLOTS}スロット）を表示します。"
     )
     @app_commands.describe(user="相手）")
     @guild_decorator()
@@ -102,7 +51,7 @@ class BaseCog(commands.Cog):
             description="\n".join(lines),
             color=discord.Color.blue(),
         )
-        embed.set_footer(text=f"合計価値：{fmt_compact(total_value)} cats｜空き：{empty_count}/25")
+        embed.set_footer(text=f"合計価値：{fmt_compact(total_value)} cats｜空き：{empty_count}/{BASE_SLOTS}")
         # 公開送信
         await interaction.response.send_message(embed=embed, ephemeral=False)
 
@@ -111,13 +60,13 @@ class BaseCog(commands.Cog):
         name="favorite",
         description="好きなブレインロットをお気に入り登録します。"
     )
-    @app_commands.describe(slot="お気に入り登録したいスロット番号（1〜25）")
+    @app_commands.describe(slot=f"お気に入り登録したいスロット番号（1〜{BASE_SLOTS}）")
     @guild_decorator()
     async def favorite(self, interaction: discord.Interaction, slot: int):
         uid = interaction.user.id
-        if not (1 <= slot <= 25):
+        if not (1 <= slot <= BASE_SLOTS):
             await interaction.response.send_message(
-                "❌ スロット番号は **1〜25** で指定してください。", ephemeral=True
+                f"❌ スロット番号は **1〜{BASE_SLOTS}** で指定してください。", ephemeral=True
             )
             return
 
@@ -143,7 +92,7 @@ class BaseCog(commands.Cog):
         name="unfavorite",
         description="指定したスロットにいるブレインロットのお気に入り登録を解除します。"
     )
-    @app_commands.describe(slot="解除したいスロット番号（1〜25）")
+    @app_commands.describe(slot=f"解除したいスロット番号（1〜{BASE_SLOTS}）")
     @guild_decorator()
     async def unfavorite(self, interaction: discord.Interaction, slot: int):
         uid = interaction.user.id
@@ -161,50 +110,50 @@ class BaseCog(commands.Cog):
             ephemeral=True,
         )
 
-    # --- /sell : 単体売却（お気に入りは売れない） ---
+    # --- /sell : スロット指定で売却（お気に入りは売れない） ---
     @app_commands.command(
         name="sell",
         description="指定したスロットのブレインロットを売却します。"
     )
-    @app_commands.describe(slot="売却したいスロット番号（1〜25）")
+    @app_commands.describe(slots=f"売却したいスロット番号（1〜{BASE_SLOTS}）。「1,3,5-8」のように複数・範囲も指定できます")
     @guild_decorator()
-    async def sell(self, interaction: discord.Interaction, slot: int):
+    @limited()
+    async def sell(self, interaction: discord.Interaction, slots: str):
         uid = interaction.user.id
-        if not (1 <= slot <= 25):
+        targets = parse_slots(slots, BASE_SLOTS)
+        if targets is None:
             await interaction.response.send_message(
-                "❌ スロット番号は **1〜25** で指定してください。",
+                f"❌ スロット番号は **1〜{BASE_SLOTS}** で指定してください（例：`3` / `1,3,5-8`）。",
                 ephemeral=True,
             )
             return
 
-        favs = await get_favorites(uid)
-        if slot in favs:
-            await interaction.response.send_message(
-                "🚫 このブレインロットはお気に入り登録されているため売却できません。",
-                ephemeral=True,
-            )
+        # お気に入りを除いた取り出し → 入金 を1文ずつ・1トランザクションで
+        async with user_locks.hold(uid), economy_tx() as tx:
+            sold, new_credits = await tx.sell_slots(uid, targets)
+
+        if not sold:
+            favs = set(await get_favorites(uid))
+            if favs.issuperset(targets):
+                msg = "🚫 このブレインロットはお気に入り登録されているため売却できません。"
+            else:
+                msg = "❌ このスロットは空です。" if len(targets) == 1 else "⚠️ 売却できるブレインロットがありません（すべて空 or お気に入り）。"
+            await interaction.response.send_message(msg, ephemeral=True)
             return
 
-        rows = await list_base(uid)
-        name_by_slot = {s: n for s, n in rows}
-        name = name_by_slot.get(slot)
-        if not name:
+        total_value = sum(v for _, _, v in sold)
+        if len(sold) == 1:
+            _, name, _ = sold[0]
             await interaction.response.send_message(
-                "❌ このスロットは空です。",
+                f"✅ **{name}** を売却しました。\n"
+                f"受取：**{fmt_compact(total_value)} cats**\n"
+                f"新残高：**{fmt_compact(new_credits)} cats**",
                 ephemeral=True,
             )
             return
 
-        val = base_value(name)
-        await remove_from_slot(uid, slot)
-        credits, _, _ = await get_user_row(uid)
-        new_credits = credits + val
-        await update_user(uid, credits=new_credits)
-
         await interaction.response.send_message(
-            f"✅ **{name}** を売却しました。\n"
-            f"受取：**{fmt_compact(val)} cats**\n"
-            f"新残高：**{fmt_compact(new_credits)} cats**",
+            embed=self._sold_embed("💸 売却完了", sold, total_value, new_credits),
             ephemeral=True,
         )
 
@@ -214,50 +163,42 @@ class BaseCog(commands.Cog):
         description="お気に入り登録されていないブレインロットを全て売却します。"
     )
     @guild_decorator()
+    @limited()
     async def sell_all(self, interaction: discord.Interaction):
         uid = interaction.user.id
-        rows = await list_base(uid)
-        favs = await get_favorites(uid)
-
-        total_value = 0
-        sold_names = []
-
-        for slot, name in rows:
-            if not name:
-                continue
-            if slot in favs:
-                continue  # お気に入りはスキップ
-            total_value += base_value(name)
-            sold_names.append(name)
-            await remove_from_slot(uid, slot)
+        async with user_locks.hold(uid), economy_tx() as tx:
+            sold, new_credits = await tx.sell_slots(uid)
 
-        if not sold_names:
+        if not sold:
             await interaction.response.send_message(
                 "⚠️ 売却できるブレインロットがありません（すべて空 or お気に入り）。",
                 ephemeral=True,
             )
             return
 
-        credits, _, _ = await get_user_row(uid)
-        new_credits = credits + total_value
-        await update_user(uid, credits=new_credits)
+        total_value = sum(v for _, _, v in sold)
+        await interaction.response.send_message(
+            embed=self._sold_embed("💸 一括売却完了", sold, total_value, new_credits),
+            ephemeral=True,
+        )
 
-        listed = ", ".join(sold_names[:10])
-        if len(sold_names) > 10:
+    @staticmethod
+    def _sold_embed(title: str, sold, total_value: int, new_credits: int) -> discord.Embed:
+        listed = ", ".join(name for _, name, _ in sold[:10])
+        if len(sold) > 10:
             listed += " 他..."
 
         embed = discord.Embed(
-            title="💸 一括売却完了",
+            title=title,
             description=(
-                f"お気に入りを除くブレインロットを売却しました。\n"
+                f"お気に入りを除くブレインロットを {len(sold)} 体売却しました。\n"
                 f"合計：**{fmt_compact(total_value)} cats** を獲得\n"
                 f"新残高：**{fmt_compact(new_credits)} cats**"
             ),
             color=discord.Color.gold(),
         )
         embed.add_field(name="売却したブレインロット", value=listed, inline=False)
-
-        await interaction.response.send_message(embed=embed, ephemeral=True)
+        return embed
 
 
 async def setup(bot: commands.Bot):
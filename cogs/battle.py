@@ -1,11 +1,20 @@
 # cogs/battle.py
-import discord, random
+import asyncio
+import functools
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+import discord
 from discord.ext import commands
 from discord import app_commands
 
 from constants import GUILD_ID, TIERS
-from db import get_user_row, update_user
-from utils import fmt_compact, pull_once, base_value
+from db import get_user_row, adjust_credits, economy_tx
+from utils import fmt_compact
+from pull_engine import open_many
+import battle_odds
+import rng
+from locks import user_locks
+from ratelimit import limited
 
 def guild_decorator():
     return app_commands.guilds(discord.Object(id=int(GUILD_ID))) if GUILD_ID else (lambda f: f)
@@ -64,9 +73,68 @@ class BattleRequestView(discord.ui.View):
         )
 
 
+def odds_field(tier_name: str, count: int) -> str:
+    """招待に出す理論値（未計算なら計算中と表示）"""
+    o = battle_odds.cached_odds(tier_name, count)
+    if o is None:
+        return "（計算中…）"
+    approx = "" if o.exact else "≈ "
+    return (
+        f"勝ち {approx}{o.p_win:.2%} / 引き分け {approx}{o.p_draw:.2%} / 負け {approx}{o.p_win:.2%}\n"
+        f"期待ポット **{fmt_compact(o.expected_pot)} cats**"
+    )
+
+
 class BattleCog(commands.Cog):
     def __init__(self, bot: commands.Bot):
         self.bot = bot
+        # 勝敗確率は重い（CPU を握る）ので、使われた (tier, count) だけを別プロセスで計算する
+        self._pool: ProcessPoolExecutor | None = None
+        self._pending: dict[tuple[str, int], asyncio.Future] = {}
+
+    async def cog_unload(self):
+        if self._pool is not None:
+            self._pool.shutdown(wait=False, cancel_futures=True)
+            self._pool = None
+
+    def _request_odds(self, tier_name: str, count: int) -> asyncio.Future | None:
+        """未計算なら計算を始めて Future を返す（同じキーは1本にまとめる）。計算済みなら None"""
+        if battle_odds.cached_odds(tier_name, count) is not None:
+            return None
+        key = (tier_name, count)
+        fut = self._pending.get(key)
+        if fut is None:
+            if self._pool is None:
+                # fork だとイベントループや DB スレッドごと複製されるので spawn
+                self._pool = ProcessPoolExecutor(max_workers=1, mp_context=multiprocessing.get_context("spawn"))
+            fut = asyncio.get_running_loop().run_in_executor(self._pool, battle_odds.compute, tier_name, count)
+            fut.add_done_callback(functools.partial(self._odds_done, key))
+            self._pending[key] = fut
+        return fut
+
+    def _odds_done(self, key: tuple[str, int], fut: asyncio.Future):
+        self._pending.pop(key, None)
+        if fut.cancelled():
+            return
+        if fut.exception() is not None:
+            print(f"[battle] odds {key} failed: {fut.exception()!r}")
+            return
+        battle_odds.store(fut.result())
+
+    async def _fill_odds(self, interaction: discord.Interaction, view: discord.ui.View,
+                         invite: discord.Embed, fut: asyncio.Future, tier_name: str, count: int):
+        """計算が終わったら、まだ承認待ちの招待の理論値を差し替える"""
+        try:
+            await asyncio.shield(fut)
+        except Exception:
+            return
+        if view.is_finished() or any(c.disabled for c in view.children):
+            return
+        invite.set_field_at(0, name=invite.fields[0].name, value=odds_field(tier_name, count), inline=False)
+        try:
+            await interaction.edit_original_response(embed=invite)
+        except discord.HTTPException:
+            pass
 
     @app_commands.command(
         name="luckyblock_battle",
@@ -80,6 +148,7 @@ class BattleCog(commands.Cog):
     )
     @app_commands.choices(mode=MODE_CHOICES, tier=TIER_CHOICES)
     @guild_decorator()
+    @limited()
     async def luckyblock_battle(
         self,
         interaction: discord.Interaction,
@@ -88,6 +157,7 @@ class BattleCog(commands.Cog):
         count: int = 1,
         opponent: discord.User | None = None
     ):
+        r, seed = rng.for_interaction(interaction)
         mode_val = mode.value            # "npc" or "player"
         tier_name = tier.value
         count = max(1, min(10, count))
@@ -127,34 +197,41 @@ class BattleCog(commands.Cog):
 
         # ---- NPC モード ---------------------------------------------------
         if mode_val == "npc":
-            # 先に自分のコストだけ徴収
-            await update_user(uid, credits=my_cats - cost_each)
-
-            # 開封（ベースには入れない。対戦用の一時結果）
-            my_list  = [pull_once(tier_name) for _ in range(count)]
-            npc_list = [pull_once(tier_name) for _ in range(count)]
-            my_total  = sum(base_value(n) for n in my_list)
-            npc_total = sum(base_value(n) for n in npc_list)
-            pot = my_total + npc_total
-
-            # 決着
-            if my_total > npc_total:
-                cur, _, _ = await get_user_row(uid)
-                await update_user(uid, credits=cur + pot)
-                result = f"🏆 **{user.display_name} の勝ち！** 〔+{fmt_compact(pot)} cats〕"
-            elif my_total < npc_total:
-                result = f"🤖 **NPC の勝ち！** あなたのお金は没収されました！"
-            else:
-                # 引き分け：半分返金（NPCは受け取りなし）
-                half = pot // 2
-                cur, _, _ = await get_user_row(uid)
-                await update_user(uid, credits=cur + half)
-                result = f"🤝 **引き分け**：あなたに **{fmt_compact(half)} cats** を返金"
+            # 徴収 → 開封 → 決着 のあいだは同じユーザーの他の経済操作を待たせる
+            async with user_locks.hold(uid):
+                # 先に自分のコストだけ徴収（直前の確認から残高が減っていたら中止）
+                paid = await adjust_credits(uid, -cost_each) is not None
+                if paid:
+                    # 開封（ベースには入れない。対戦用の一時結果）
+                    my_list  = open_many(tier_name, count, r)
+                    npc_list = open_many(tier_name, count, r)
+                    my_total  = sum(v for _, v in my_list)
+                    npc_total = sum(v for _, v in npc_list)
+                    pot = my_total + npc_total
+
+                    # 決着
+                    if my_total > npc_total:
+                        await adjust_credits(uid, pot)
+                        result = f"🏆 **{user.display_name} の勝ち！** 〔+{fmt_compact(pot)} cats〕"
+                    elif my_total < npc_total:
+                        result = f"🤖 **NPC の勝ち！** あなたのお金は没収されました！"
+                    else:
+                        # 引き分け：半分返金（NPCは受け取りなし）
+                        half = pot // 2
+                        await adjust_credits(uid, half)
+                        result = f"🤝 **引き分け**：あなたに **{fmt_compact(half)} cats** を返金"
+
+            if not paid:
+                await interaction.response.send_message(
+                    f"💸 あなたの残高不足：必要 **{fmt_compact(cost_each)} cats**",
+                    ephemeral=True
+                )
+                return
 
             # 表示
-            def fmt_lines(owner, names, total):
+            def fmt_lines(owner, pulls, total):
                 head = f"**{owner}**（合計 {fmt_compact(total)} cats）"
-                body = "\n".join([f"- {n} 〔{fmt_compact(base_value(n))}〕" for n in names])
+                body = "\n".join([f"- {n} 〔{fmt_compact(v)}〕" for n, v in pulls])
                 return head + "\n" + body
 
             desc = (
@@ -162,12 +239,12 @@ class BattleCog(commands.Cog):
                 f"{fmt_lines('NPC', npc_list, npc_total)}\n\n"
                 f"{result}"
             )
-            await interaction.response.send_message(
-                embed=discord.Embed(
-                    title=f"⚔️ LuckyBlock Battle — NPC / {tier_name} ×{count}",
-                    description=desc, color=0x2ecc71
-                )
+            embed = discord.Embed(
+                title=f"⚔️ LuckyBlock Battle — NPC / {tier_name} ×{count}",
+                description=desc, color=0x2ecc71
             )
+            embed.set_footer(text=f"seed: {rng.fmt_seed(seed)}")
+            await interaction.response.send_message(embed=embed)
             return
 
         # ---- Player モード ------------------------------------------------
@@ -186,75 +263,74 @@ class BattleCog(commands.Cog):
         state = {"accepted": False}
         view = BattleRequestView(user, opponent, state)
 
+        odds_fut = self._request_odds(tier_name, count)
+        invite = discord.Embed(color=TIERS[tier_name]["color"])
+        invite.add_field(name=f"📊 理論値（{tier_name} ×{count}）", value=odds_field(tier_name, count), inline=False)
         await interaction.response.send_message(
             content=(
                 f"🎮 **{user.mention}** が **{opponent.mention}** を対戦に招待しました！\n"
                 f"ルール：{tier_name} ×{count}（参加費：各 **{fmt_compact(cost_each)} cats**）\n"
                 f"※60秒以内に承認してください"
             ),
+            embed=invite,
             view=view
         )
+        fill = None
+        if odds_fut is not None:
+            fill = asyncio.create_task(self._fill_odds(interaction, view, invite, odds_fut, tier_name, count))
         await view.wait()
+        if fill is not None:
+            fill.cancel()
 
         if not state["accepted"]:
             # 未承認 or 拒否 or タイムアウト
             await interaction.edit_original_response(
                 content="⌛ キャンセル：未承認/拒否/タイムアウト。",
-                view=None
-            )
-            return
-
-        # 最終チェック（承認中に残高が動いていないか）
-        my_cats, _, _ = await get_user_row(uid)
-        opp_cats, _, _ = await get_user_row(opp_id)
-        if my_cats < cost_each:
-            await interaction.edit_original_response(
-                content="❗ あなたの残高が不足しました。対戦をキャンセルします。",
-                view=None
-            )
-            return
-        if opp_cats < cost_each:
-            await interaction.edit_original_response(
-                content=f"❗ {opp_name} の残高が不足しました。対戦をキャンセルします。",
-                view=None
+                view=None,
+                embed=None
             )
             return
 
-        # 両者から参加費を徴収
-        await update_user(uid, credits=my_cats - cost_each)
-        await update_user(opp_id, credits=opp_cats - cost_each)
-
         # 開封（ベースには入れない）
         def do_open():
-            names = [pull_once(tier_name) for _ in range(count)]
-            total = sum(base_value(n) for n in names)
-            return names, total
-
-        my_list,  my_total  = do_open()
-        opp_list, opp_total = do_open()
-        pot = my_total + opp_total
-
-        # 勝敗・配分
-        if my_total > opp_total:
-            cur, _, _ = await get_user_row(uid)
-            await update_user(uid, credits=cur + pot)
-            result = f"🏆 **{user.display_name} の勝ち！** 〔+{fmt_compact(pot)} cats〕"
-        elif my_total < opp_total:
-            cur, _, _ = await get_user_row(opp_id)
-            await update_user(opp_id, credits=cur + pot)
-            result = f"🏆 **{opp_name} の勝ち！** 〔+{fmt_compact(pot)} cats〕"
-        else:
-            half = pot // 2
-            cur, _, _ = await get_user_row(uid)
-            await update_user(uid, credits=cur + half)
-            cur, _, _ = await get_user_row(opp_id)
-            await update_user(opp_id, credits=cur + (pot - half))
-            result = f"🤝 **引き分け**：両者に **{fmt_compact(half)} cats** を返金"
+            pulls = open_many(tier_name, count, r)
+            return pulls, sum(v for _, v in pulls)
+
+        # 最終チェック（承認中に残高が動いていないか）→ 徴収 → 配分 を1トランザクションで
+        short = None
+        async with user_locks.hold(uid, opp_id), economy_tx() as tx:
+            # 両者から参加費を徴収（相手が不足なら自分の分も戻す）
+            if await tx.adjust_credits(uid, -cost_each) is None:
+                short = "❗ あなたの残高が不足しました。対戦をキャンセルします。"
+            elif await tx.adjust_credits(opp_id, -cost_each) is None:
+                await tx.adjust_credits(uid, cost_each)
+                short = f"❗ {opp_name} の残高が不足しました。対戦をキャンセルします。"
+            else:
+                my_list,  my_total  = do_open()
+                opp_list, opp_total = do_open()
+                pot = my_total + opp_total
+
+                # 勝敗・配分
+                if my_total > opp_total:
+                    await tx.adjust_credits(uid, pot)
+                    result = f"🏆 **{user.display_name} の勝ち！** 〔+{fmt_compact(pot)} cats〕"
+                elif my_total < opp_total:
+                    await tx.adjust_credits(opp_id, pot)
+                    result = f"🏆 **{opp_name} の勝ち！** 〔+{fmt_compact(pot)} cats〕"
+                else:
+                    half = pot // 2
+                    await tx.adjust_credits(uid, half)
+                    await tx.adjust_credits(opp_id, pot - half)
+                    result = f"🤝 **引き分け**：両者に **{fmt_compact(half)} cats** を返金"
+
+        if short:
+            await interaction.edit_original_response(content=short, view=None, embed=None)
+            return
 
         # 表示
-        def fmt_lines(owner, names, total):
+        def fmt_lines(owner, pulls, total):
             head = f"**{owner}**（合計 {fmt_compact(total)} cats）"
-            body = "\n".join([f"- {n} 〔{fmt_compact(base_value(n))}〕" for n in names])
+            body = "\n".join([f"- {n} 〔{fmt_compact(v)}〕" for n, v in pulls])
             return head + "\n" + body
 
         embed = discord.Embed(
@@ -266,6 +342,7 @@ class BattleCog(commands.Cog):
             ),
             color=0x9b59b6
         )
+        embed.set_footer(text=f"seed: {rng.fmt_seed(seed)}")
         await interaction.edit_original_response(content=None, view=None, embed=embed)
 
 
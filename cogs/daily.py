@@ -3,8 +3,10 @@ import time, discord
 from discord.ext import commands
 from discord import app_commands
 from constants import DAILY_COOLDOWN_SECONDS, DAILY_BASE_INC, GUILD_ID, GIVE_MIN_AMOUNT
-from db import get_user_row, update_user, get_daily_count, increment_daily_count
+from db import get_user_row, economy_tx, transfer_credits
 from utils import fmt_remain, fmt_compact
+from locks import user_locks
+from ratelimit import limited
 
 def guild_decorator():
     return app_commands.guilds(discord.Object(id=int(GUILD_ID))) if GUILD_ID else (lambda f: f)
@@ -20,25 +22,29 @@ class DailyCog(commands.Cog):
     @guild_decorator()
     async def daily(self, interaction: discord.Interaction):
         uid = interaction.user.id
-        cats, _, last = await get_user_row(uid)
         now = int(time.time())
 
+        # 判定・付与・回数更新を1トランザクションで（連打しても二重受取しない）
+        async with user_locks.hold(uid), economy_tx() as tx:
+            _, _, last = await tx.get_user_row(uid)
+            ready = (last + DAILY_COOLDOWN_SECONDS) <= now
+            if ready:
+                # 受取回数に応じて増える報酬
+                current_count = await tx.get_daily_count(uid)
+                reward = (current_count + 1) * DAILY_BASE_INC
+
+                new_cats = await tx.adjust_credits(uid, reward)
+                await tx.update_user(uid, last_daily=now)
+                new_count = await tx.increment_daily_count(uid)
+
         # クールダウン判定
-        if (last + DAILY_COOLDOWN_SECONDS) > now:
+        if not ready:
             await interaction.response.send_message(
                 f"⏳ 次は {fmt_remain(last + DAILY_COOLDOWN_SECONDS - now)} 後に受取できます。",
                 ephemeral=True
             )
             return
 
-        # 受取回数に応じて増える報酬
-        current_count = await get_daily_count(uid)
-        reward = (current_count + 1) * DAILY_BASE_INC
-
-        new_cats = cats + reward
-        await update_user(uid, credits=new_cats, last_daily=now)
-        new_count = await increment_daily_count(uid)
-
         await interaction.response.send_message(
             f"✅ デイリー受取（{new_count} 回目）！ **+{fmt_compact(reward)} cats** を付与。\n"
             f"💳 新残高：**{fmt_compact(new_cats)} cats**"
@@ -47,6 +53,7 @@ class DailyCog(commands.Cog):
     @app_commands.command(name="give", description="他のユーザーに cats を送れます（最低100M cats）")
     @app_commands.describe(user="送り先", amount="送る金額（100M以上）")
     @guild_decorator()
+    @limited()
     async def give(self, interaction:discord.Interaction, user:discord.User, amount:int):
         if amount < GIVE_MIN_AMOUNT:
             await interaction.response.send_message(f"❗ 最低送金額は {fmt_compact(GIVE_MIN_AMOUNT)} cats です。", ephemeral=True); return
@@ -61,21 +68,21 @@ class DailyCog(commands.Cog):
         if user.id == sender.id:
             await interaction.response.send_message("❗ 自分自身には送れません。", ephemeral=True); return
 
-        s_bal,_,_ = await get_user_row(sender.id)
-        if s_bal < amount:
+        # 残高確認と送金を1回の原子的な操作で
+        async with user_locks.hold(sender.id, user.id):
+            res = await transfer_credits(sender.id, user.id, amount)
+        if res is None:
+            s_bal,_,_ = await get_user_row(sender.id)
             await interaction.response.send_message(
                 f"💳 残高不足（所持 {fmt_compact(s_bal)} cats < 送金 {fmt_compact(amount)} cats）",
                 ephemeral=True
             )
             return
-
-        r_bal,_,_ = await get_user_row(user.id)
-        await update_user(sender.id, credits=s_bal-amount)
-        await update_user(user.id, credits=r_bal+amount)
+        s_bal, r_bal = res
 
         await interaction.response.send_message(
             f"✅ {user.mention} に {fmt_compact(amount)} cats を送金しました。\n"
-            f"あなた残高：{fmt_compact(s_bal-amount)} cats / 相手残高：{fmt_compact(r_bal+amount)} cats",
+            f"あなた残高：{fmt_compact(s_bal)} cats / 相手残高：{fmt_compact(r_bal)} cats",
             ephemeral=True
         )
 
@@ -1,10 +1,12 @@
 # cogs/english.py
-import json, os, random, asyncio, discord
+import json, os, asyncio, discord
 from discord.ext import commands
 from discord import app_commands
-from db import get_user_row, update_user
+from db import adjust_credits
 from constants import GUILD_ID, QUIZ_REWARD_MIN, QUIZ_REWARD_MAX
 from utils import fmt_compact, sanitize_to_hiragana_core, is_hiragana_strict_after_sanitize
+import rng
+from ratelimit import limited
 
 # 実行パスに関係なく読み込めるよう、絶対パスを使用
 DATA_PATH = os.path.join(os.path.dirname(__file__), "..", "data", "english_easy.json")
@@ -46,7 +48,7 @@ class EnglishCog(commands.Cog):
         description="英語の問題に正解したら cats をゲット！"
     )
     @guild_decorator()
-    @app_commands.checks.cooldown(1, 10.0, key=lambda i: i.user.id)
+    @limited()
     async def english(self, interaction: discord.Interaction):
         if not interaction.client.intents.message_content:
             await interaction.response.send_message(
@@ -57,7 +59,8 @@ class EnglishCog(commands.Cog):
 
         user = interaction.user
         uid = user.id
-        q = random.choice(self.qa)
+        r, _ = rng.for_interaction(interaction)
+        q = r.choice(self.qa)
         word, hira = q["en"], q["ja"]
 
         await interaction.response.send_message(
@@ -103,12 +106,11 @@ class EnglishCog(commands.Cog):
             return
 
         if user_san == hira_san:
-            reward = random.randint(QUIZ_REWARD_MIN, QUIZ_REWARD_MAX)
-            c, _, _ = await get_user_row(uid)
-            await update_user(uid, credits=c + reward)
+            reward = r.randint(QUIZ_REWARD_MIN, QUIZ_REWARD_MAX)
+            new_bal = await adjust_credits(uid, reward)
             await interaction.channel.send(
                 f"✅ **正解！** {user.mention} に **+{fmt_compact(reward)} cats** を付与。"
-                f" 新残高：**{fmt_compact(c + reward)} cats**"
+                f" 新残高：**{fmt_compact(new_bal)} cats**"
             )
         else:
             await interaction.channel.send(f"❌ **不正解！** 正解は **{hira}** でした。")
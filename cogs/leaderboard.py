@@ -1,80 +1,305 @@
 # cogs/leaderboard.py
+import asyncio
 import discord
-from discord.ext import commands
+from discord.ext import commands, tasks
 from discord import app_commands
-from typing import Optional
-from constants import GUILD_ID
-from db import top_base_values, top_credits
+from typing import Dict, Iterable, List, Optional, Tuple
+from constants import (
+    GUILD_ID, LEADERBOARD_SIZE, LEADERBOARD_REFRESH_SECONDS,
+    DISPLAY_NAME_TTL_SECONDS, NEGATIVE_NAME_TTL_SECONDS, MEMBER_FETCH_CONCURRENCY,
+)
+from db import board_page, board_rank, rebuild_base_value_totals, commit_seq
 from utils import fmt_compact
+from cache import TTLCache
 
 def guild_decorator():
     return app_commands.guilds(discord.Object(id=int(GUILD_ID))) if GUILD_ID else (lambda f: f)
 
-async def resolve_display_name(bot: commands.Bot, guild: Optional[discord.Guild], user_id: int) -> Optional[str]:
-    if guild:
-        member = guild.get_member(user_id)
-        if member:
-            if member.bot:  # BOT除外
-                return None
-            return member.display_name
-        try:
-            member = await guild.fetch_member(user_id)
-            if member and not member.bot:
-                return member.display_name
-            return None
-        except Exception:
-            pass
-
-    user = bot.get_user(user_id)
-    if user:
-        if user.bot:
-            return None
-        return user.name
-    try:
-        user = await bot.fetch_user(user_id)
-        if user and not user.bot:
-            return user.name
-        return None
-    except Exception:
-        return None
+NOT_SHOWN = ""  # 否定結果（BOT・サーバーにいない・存在しないユーザー）の印
+QUERY_MEMBERS_MAX = 100  # gateway の query_members で一度に問い合わせられる user_id の数
+
+async def _fetch_many(fetch, user_ids: List[int]) -> Dict[int, object]:
+    """fetch(user_id) を同時 MEMBER_FETCH_CONCURRENCY 本までで並行に。結果か例外を返す"""
+    sem = asyncio.Semaphore(MEMBER_FETCH_CONCURRENCY)
+
+    async def one(uid: int):
+        async with sem:
+            try:
+                return await fetch(uid)
+            except Exception as e:
+                return e
+
+    return dict(zip(user_ids, await asyncio.gather(*(one(u) for u in user_ids))))
+
+async def resolve_display_names(bot: commands.Bot, guild: Optional[discord.Guild], user_ids: Iterable[int],
+                                names: TTLCache) -> Dict[int, Optional[str]]:
+    """
+    user_ids の表示名をまとめて引く（None=表示しない）。
+    メモリ上のメンバー → names キャッシュ → 残りだけ gateway へ1回（query_members）か REST を並行で。
+    query_members で返らなかった分は REST で確かめてから否定結果にする。
+    BOT は永久に、サーバーにいない・存在しないユーザーは NEGATIVE_NAME_TTL_SECONDS のあいだ否定結果として覚える。
+    否定結果は REST を引かないためだけに使う（再参加してメモリ上にいれば、そちらが優先される）。
+    """
+    gid = guild.id if guild else None
+    out: Dict[int, Optional[str]] = {}
+
+    def remember(uid: int, user):
+        if user is None:
+            names.put((gid, uid), NOT_SHOWN, NEGATIVE_NAME_TTL_SECONDS)
+        elif user.bot:
+            names.put((gid, uid), NOT_SHOWN, float("inf"))
+        else:
+            names.put((gid, uid), user.display_name if guild else user.name)
+        out[uid] = names.get((gid, uid)) or None
+
+    misses = []
+    for uid in dict.fromkeys(user_ids):
+        user = guild.get_member(uid) if guild else bot.get_user(uid)
+        if user is not None:
+            remember(uid, user)
+            continue
+        cached = names.get((gid, uid))
+        if cached is not None:
+            out[uid] = cached or None
+        else:
+            misses.append(uid)
+    if not misses:
+        return out
+
+    if guild is None:
+        for uid, r in (await _fetch_many(bot.fetch_user, misses)).items():
+            if isinstance(r, discord.User):
+                remember(uid, r)
+            elif isinstance(r, discord.NotFound):
+                remember(uid, None)
+        return out
+
+    async def via_rest(uids: List[int]) -> Tuple[List[discord.Member], List[int]]:
+        """REST で1人ずつ引く → (見つかったメンバー, 結果が確定した user_id)"""
+        results = await _fetch_many(guild.fetch_member, uids)
+        # NotFound 以外の失敗（レート制限など）は確定にせず、次回また引く
+        return ([r for r in results.values() if isinstance(r, discord.Member)],
+                [u for u, r in results.items() if isinstance(r, (discord.Member, discord.NotFound))])
+
+    found: List[discord.Member] = []
+    if guild.chunked:
+        # メンバー一覧を全部持っている → いなければ退出済み
+        pass
+    elif bot.intents.members:
+        for i in range(0, len(misses), QUERY_MEMBERS_MAX):
+            batch = misses[i:i + QUERY_MEMBERS_MAX]
+            try:
+                found += await guild.query_members(user_ids=batch, limit=len(batch), presences=False)
+            except asyncio.TimeoutError:
+                return out  # 今回は諦める（否定結果にはしない）
+        # gateway が返さなかった分はそれだけで退出扱いにせず、REST で確かめる
+        got = {m.id for m in found}
+        rest = [u for u in misses if u not in got]
+        if rest:
+            more, settled = await via_rest(rest)
+            found += more
+            misses = [u for u in misses if u in got] + settled
+    else:
+        found, misses = await via_rest(misses)
+
+    by_id = {m.id: m for m in found}
+    for uid in misses:
+        remember(uid, by_id.get(uid))
+    return out
+
+# ランキングの種類（db.BOARDS のキー）→ (タイトル, 色)
+BOARD_STYLE = {
+    "base": ("🏆 Base Value ランキング", discord.Color.blurple()),
+    "cats": ("💰 Cats ランキング", discord.Color.gold()),
+}
+BOARD_CHOICES = [
+    app_commands.Choice(name="ベース合計価値", value="base"),
+    app_commands.Choice(name="所持 cats", value="cats"),
+]
+RANK_NEIGHBOURS = 2  # /rank で上下に出す人数
+
+def _key(row: Tuple[int, int]) -> Tuple[int, int]:
+    """board_page の行 (user_id, 値) → キーセットのキー (値, user_id)"""
+    return row[1], row[0]
+
+class LeaderboardService:
+    """
+    ランキングのスナップショット。1ページ目の行と、ギルドごとに組み立て済みの embed を持つ。
+    refresh はバックグラウンドのループから呼ばれ、前回から書き込み（コミット）が無ければ何もしない。
+    1ページ目はここから embed を返すだけ（DB にも Discord API にも行かない）。2ページ目以降はキーセットで都度引く。
+    順位は DB 上の並び（BOT・サーバーにいない人は行を出さないが順位は詰めない。/rank と同じ番号になる）。
+    """
+    def __init__(self, bot: commands.Bot):
+        self.bot = bot
+        self.names = TTLCache(4096, DISPLAY_NAME_TTL_SECONDS)  # (guild_id, user_id) → 表示名（NOT_SHOWN=表示しない）
+        self.rows: Dict[str, List[Tuple[int, int]]] = {}
+        self.embeds: Dict[Tuple[str, Optional[int]], discord.Embed] = {}
+        self.seq = -1
+        self._lock = asyncio.Lock()
+
+    async def render(self, kind: str, guild: Optional[discord.Guild], rows: List[Tuple[int, int]],
+                     first_rank: int, page: int) -> discord.Embed:
+        title, color = BOARD_STYLE[kind]
+        embed = discord.Embed(title=title, color=color, timestamp=discord.utils.utcnow())
+
+        names = await resolve_display_names(self.bot, guild, [uid for uid, _ in rows], self.names)
+        desc_lines = []
+        for rank, (uid, total) in enumerate(rows, start=first_rank):
+            name = names.get(uid)
+            if not name:
+                continue
+            desc_lines.append(f"{rank}. **{name}**\n{fmt_compact(total)} cats")
+
+        embed.description = "\n".join(desc_lines) if desc_lines else "（Bot以外のデータなし）"
+        embed.set_footer(text=f"{page} ページ｜更新")
+        return embed
+
+    async def refresh(self, *, force: bool = False):
+        async with self._lock:
+            # 先に番号を取る（集計中のコミットは次回の refresh で拾う）
+            seq = commit_seq()
+            if seq == self.seq and not force:
+                return
+            for kind in BOARD_STYLE:
+                self.rows[kind] = list(await board_page(kind, limit=LEADERBOARD_SIZE))
+            embeds = {}
+            for guild in self.bot.guilds:
+                for kind in BOARD_STYLE:
+                    embeds[(kind, guild.id)] = await self.render(kind, guild, self.rows[kind], 1, 1)
+            self.embeds = embeds
+            self.seq = seq
+
+    async def first_page(self, kind: str, guild: Optional[discord.Guild]) -> Tuple[discord.Embed, List[Tuple[int, int]]]:
+        key = (kind, guild.id if guild else None)
+        embed = self.embeds.get(key)
+        if embed is None:
+            # 起動直後・DM・refresh 後に参加したギルドなど
+            if self.seq < 0:
+                await self.refresh()
+            embed = self.embeds.get(key) or await self.render(kind, guild, self.rows[kind], 1, 1)
+            self.embeds[key] = embed
+        return embed, self.rows[kind]
+
+class LeaderboardView(discord.ui.View):
+    """前後ページのボタン。表示中の先頭・末尾の (値, user_id) から続きを引く"""
+    def __init__(self, service: LeaderboardService, kind: str, guild: Optional[discord.Guild],
+                 rows: List[Tuple[int, int]], first_rank: int = 1, page: int = 1):
+        super().__init__(timeout=120)
+        self.service = service
+        self.kind = kind
+        self.guild = guild
+        self._set(rows, first_rank, page)
+
+    def _set(self, rows: List[Tuple[int, int]], first_rank: int, page: int):
+        self.rows = rows
+        self.first_rank = first_rank
+        self.page = page
+        self.prev_page.disabled = page <= 1
+        # 満杯でなければ最後のページ（満杯でちょうど最後のときは押すと「これ以上ない」と返す）
+        self.next_page.disabled = len(rows) < LEADERBOARD_SIZE
+
+    async def _show(self, interaction: discord.Interaction, rows, first_rank: int, page: int):
+        if not rows:
+            self.next_page.disabled = True
+            await interaction.response.edit_message(view=self)
+            return
+        self._set(rows, first_rank, page)
+        embed = await self.service.render(self.kind, self.guild, rows, first_rank, page)
+        await interaction.response.edit_message(embed=embed, view=self)
+
+    @discord.ui.button(label="◀ 前へ", style=discord.ButtonStyle.secondary)
+    async def prev_page(self, interaction: discord.Interaction, button: discord.ui.Button):
+        rows = await board_page(self.kind, before=_key(self.rows[0]), limit=LEADERBOARD_SIZE) if self.rows else []
+        await self._show(interaction, rows, max(1, self.first_rank - len(rows)), self.page - 1)
+
+    @discord.ui.button(label="次へ ▶", style=discord.ButtonStyle.secondary)
+    async def next_page(self, interaction: discord.Interaction, button: discord.ui.Button):
+        rows = await board_page(self.kind, after=_key(self.rows[-1]), limit=LEADERBOARD_SIZE) if self.rows else []
+        await self._show(interaction, rows, self.first_rank + len(self.rows), self.page + 1)
 
 class LeaderboardCog(commands.Cog):
     def __init__(self, bot:commands.Bot):
         self.bot = bot
+        self.service = LeaderboardService(bot)
+
+    async def cog_load(self):
+        self.refresher.start()
+
+    async def cog_unload(self):
+        self.refresher.cancel()
+
+    @tasks.loop(seconds=LEADERBOARD_REFRESH_SECONDS)
+    async def refresher(self):
+        try:
+            await self.service.refresh()
+        except Exception as e:
+            # ループを止めない（次の周期でやり直す）
+            print(f"[leaderboard] refresh failed: {e!r}")
+
+    @refresher.before_loop
+    async def before_refresher(self):
+        await self.bot.wait_until_ready()
+
+    async def _send_board(self, interaction: discord.Interaction, kind: str):
+        embed, rows = await self.service.first_page(kind, interaction.guild)
+        view = LeaderboardView(self.service, kind, interaction.guild, rows)
+        await interaction.response.send_message(embed=embed, view=view)
 
     @app_commands.command(name="leaderboard_base", description="ベースの合計価値ランキング")
     @guild_decorator()
     async def leaderboard_base(self, interaction:discord.Interaction):
-        rows = await top_base_values(20)
-        embed = discord.Embed(title="🏆 Base Value TOP10", color=discord.Color.blurple())
-
-        desc_lines=[]; rank=0
-        for uid, total in rows:
-            name = await resolve_display_name(self.bot, interaction.guild, uid)
-            if not name: continue
-            rank += 1
-            desc_lines.append(f"{rank}. **{name}**\n{fmt_compact(total)} cats")
-            if rank >= 10: break
-
-        embed.description = "\n".join(desc_lines) if desc_lines else "（Bot以外のデータなし）"
-        await interaction.response.send_message(embed=embed)
+        await self._send_board(interaction, "base")
 
     @app_commands.command(name="leaderboard_cats", description="所持 cats ランキング")
     @guild_decorator()
     async def leaderboard_kits(self, interaction:discord.Interaction):
-        rows = await top_credits(20)
-        embed = discord.Embed(title="💰 Cats TOP10", color=discord.Color.gold())
+        await self._send_board(interaction, "cats")
+
+    # --- /rank : 自分（または相手）の順位と前後 ---
+    @app_commands.command(name="rank", description="ランキングでの順位と前後の人を表示します")
+    @app_commands.describe(board="ランキングの種類", user="相手")
+    @app_commands.choices(board=BOARD_CHOICES)
+    @guild_decorator()
+    async def rank(self, interaction:discord.Interaction, board:app_commands.Choice[str],
+                   user:discord.Member | None = None):
+        kind = board.value
+        target = user or interaction.user
+        r = await board_rank(kind, target.id)
+        if r is None:
+            await interaction.response.send_message(
+                f"⚠️ {target.display_name} はまだ「{board.name}」のランキングに載っていません。", ephemeral=True
+            )
+            return
 
-        desc_lines=[]; rank=0
-        for uid, bal in rows:
-            name = await resolve_display_name(self.bot, interaction.guild, uid)
-            if not name: continue
-            rank += 1
-            desc_lines.append(f"{rank}. **{name}**\n{fmt_compact(bal)} cats")
-            if rank >= 10: break
+        pos, value = r
+        key = (value, target.id)
+        above = await board_page(kind, before=key, limit=RANK_NEIGHBOURS)
+        below = await board_page(kind, after=key, limit=RANK_NEIGHBOURS)
+        rows = above + [(target.id, value)] + below
+        names = await resolve_display_names(self.bot, interaction.guild, [uid for uid, _ in rows], self.service.names)
 
-        embed.description = "\n".join(desc_lines) if desc_lines else "（Bot以外のデータなし）"
+        lines = []
+        for i, (uid, total) in enumerate(rows, start=pos - len(above)):
+            name = target.display_name if uid == target.id else names.get(uid)
+            if not name:
+                continue
+            mark = "▶ " if uid == target.id else ""
+            lines.append(f"{mark}{i}. **{name}** 〔{fmt_compact(total)} cats〕")
+
+        title, color = BOARD_STYLE[kind]
+        embed = discord.Embed(title=f"{title}：{target.display_name}", description="\n".join(lines), color=color)
+        embed.set_footer(text=f"{pos:,} 位")
         await interaction.response.send_message(embed=embed)
 
+    # 管理者用：ベース合計価値を base_slots から数え直す（価値表を変えた後など）
+    @app_commands.command(name="leaderboard_rebuild", description="ベース合計価値を再計算します（管理者用）")
+    @app_commands.default_permissions(administrator=True)
+    @guild_decorator()
+    async def leaderboard_rebuild(self, interaction:discord.Interaction):
+        await interaction.response.defer(ephemeral=True, thinking=True)
+        n = await rebuild_base_value_totals()
+        await self.service.refresh(force=True)
+        await interaction.followup.send(f"✅ {n} 人分のベース合計価値を再計算しました。", ephemeral=True)
+
 async def setup(bot:commands.Bot):
     await bot.add_cog(LeaderboardCog(bot))
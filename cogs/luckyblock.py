@@ -1,15 +1,23 @@
 # cogs/luckyblock.py
+from collections import Counter
+
 import discord
 from discord.ext import commands
 from discord import app_commands
 from discord.ui import View, Select, Button
-import aiosqlite
-
-from constants import GUILD_ID, TIERS
-from db import get_user_row, update_user, place_in_first_free, free_slots
-from utils import fmt_compact, pull_once, base_value
 
-DB_PATH = "luckyblock.db"
+from constants import GUILD_ID, TIERS, LUCKY_BULK_MAX
+from db import (
+    economy_tx, get_user_row, get_autosell_list, get_autosell_matcher,
+    add_autosell, remove_autosell, clear_autosell, add_autosell_rule, remove_autosell_rule,
+)
+from utils import fmt_compact, base_value
+from pull_engine import open_many
+import rng
+from locks import user_locks
+import catalog
+from autosell import MUT_ALL, MUT_NONE_ONLY, mut_bit
+from ratelimit import limited
 
 # ===== ティア別キャラ一覧 =====
 CHARACTERS_BY_TIER = {
@@ -40,7 +48,7 @@ CHARACTERS_BY_TIER = {
     ],
     "Los Taco": [
         "Los Chihuahinis", "Los Gattitos", "Los Cucarachas",
-        "Los Quesadillas", "Los Burritos"
+        "Los Quesadillos", "Los Burritos"
     ],
     "Spooky": [
         "Mummy Ambalabu", "Cappucino Clownino", "Jackorilla",
@@ -95,31 +103,6 @@ CHARACTERS_BY_TIER = {
 def guild_decorator():
     return app_commands.guilds(discord.Object(id=int(GUILD_ID))) if GUILD_ID else (lambda f: f)
 
-# ===== autosell テーブル操作 =====
-async def get_autosell_list(uid: int):
-    async with aiosqlite.connect(DB_PATH) as db:
-        await db.execute(
-            "CREATE TABLE IF NOT EXISTS autosell (user_id INTEGER, name TEXT, PRIMARY KEY(user_id, name))"
-        )
-        cur = await db.execute("SELECT name FROM autosell WHERE user_id=?", (uid,))
-        rows = await cur.fetchall()
-        return [r[0] for r in rows]
-
-async def add_autosell(uid: int, name: str):
-    async with aiosqlite.connect(DB_PATH) as db:
-        await db.execute("INSERT OR IGNORE INTO autosell(user_id, name) VALUES(?, ?)", (uid, name))
-        await db.commit()
-
-async def remove_autosell(uid: int, name: str):
-    async with aiosqlite.connect(DB_PATH) as db:
-        await db.execute("DELETE FROM autosell WHERE user_id=? AND name=?", (uid, name))
-        await db.commit()
-
-async def clear_autosell(uid: int):
-    async with aiosqlite.connect(DB_PATH) as db:
-        await db.execute("DELETE FROM autosell WHERE user_id=?", (uid,))
-        await db.commit()
-
 # ===== 追加UI（/autosell） =====
 class TierSelect(Select):
     def __init__(self, user_id: int):
@@ -243,6 +226,17 @@ class TierSelectDisableView(View):
         super().__init__(timeout=60)
         self.add_item(TierSelectDisable(user_id, enabled_by_tier))
 
+# ===== 条件つきルール（/autosell_rule） =====
+# ミューテーション条件の選択肢 → mut_id のビットマスク
+MUT_RULE_CHOICES = {
+    "none": ("ミューテーションなしのみ", MUT_NONE_ONLY),
+    "all": ("すべて", MUT_ALL),
+    "mutated": ("ミューテーションありのみ", MUT_ALL & ~MUT_NONE_ONLY),
+    **{m: (m, mut_bit(m)) for m in catalog.MUT_NAMES[1:]},
+}
+# 抽選されうるキャラ名（autocomplete 用）
+PULLABLE_NAMES = sorted({n for t in TIERS.values() for n, _ in t["entries"]})
+
 # ===== Cog 本体 =====
 class LuckyBlockCog(commands.Cog):
     def __init__(self, bot: commands.Bot):
@@ -296,6 +290,92 @@ class LuckyBlockCog(commands.Cog):
             ephemeral=True
         )
 
+    # --- /autosell_rule（条件つきルールの追加） ---
+    @app_commands.command(
+        name="autosell_rule",
+        description="条件（キャラ・ブロック・ミューテーション・価値）で自動売却ルールを追加します。"
+    )
+    @app_commands.describe(
+        tier="このラッキーブロックから出たものだけ（省略ですべて）",
+        character="このキャラだけ（省略ですべて）",
+        mutation="対象のミューテーション（省略でミューテーションなしのみ）",
+        below="価値がこの cats 未満のものだけ（省略で上限なし）"
+    )
+    @app_commands.choices(
+        tier=[app_commands.Choice(name=n, value=n) for n in TIERS.keys()],
+        mutation=[app_commands.Choice(name=label, value=k) for k, (label, _) in MUT_RULE_CHOICES.items()]
+    )
+    @guild_decorator()
+    async def autosell_rule(
+        self,
+        interaction: discord.Interaction,
+        tier: app_commands.Choice[str] | None = None,
+        character: str | None = None,
+        mutation: app_commands.Choice[str] | None = None,
+        below: app_commands.Range[int, 1] | None = None
+    ):
+        if tier is None and character is None and below is None:
+            await interaction.response.send_message(
+                "❗ `tier` / `character` / `below` のどれかは指定してください（全部売るルールになってしまうため）。",
+                ephemeral=True
+            )
+            return
+        char_id = None
+        if character is not None:
+            char_id = catalog.CHAR_ID.get(character)
+            if char_id is None or character not in PULLABLE_NAMES:
+                await interaction.response.send_message(f"❗ キャラ **{character}** が見つかりません。", ephemeral=True)
+                return
+        mask = MUT_RULE_CHOICES[mutation.value if mutation else "none"][1]
+
+        rule_id = await add_autosell_rule(
+            interaction.user.id, char_id=char_id, tier=tier.value if tier else None, mut_mask=mask, max_value=below
+        )
+        rule = next(r for r in (await get_autosell_matcher(interaction.user.id)).rules if r.rule_id == rule_id)
+        await interaction.response.send_message(
+            f"✅ ルール **#{rule_id}** を追加しました：{rule.describe()}",
+            ephemeral=True
+        )
+
+    @autosell_rule.autocomplete("character")
+    async def autosell_rule_character(self, interaction: discord.Interaction, current: str):
+        tier = interaction.namespace.tier
+        names = [n for n, _ in TIERS[tier]["entries"]] if tier in TIERS else PULLABLE_NAMES
+        cur = current.lower()
+        return [app_commands.Choice(name=n, value=n) for n in names if cur in n.lower()][:25]
+
+    # --- /autosell_rules（ルール一覧） ---
+    @app_commands.command(
+        name="autosell_rules",
+        description="自動売却ルールの一覧を表示します。"
+    )
+    @guild_decorator()
+    async def autosell_rules(self, interaction: discord.Interaction):
+        rules = (await get_autosell_matcher(interaction.user.id)).rules
+        lines = [f"**#{r.rule_id}** {r.describe()}" for r in rules[:30]]
+        if len(rules) > 30:
+            lines.append(f"…ほか {len(rules) - 30} 件")
+        embed = discord.Embed(
+            title="🧾 自動売却ルール",
+            description="\n".join(lines) if lines else "ルールはありません。",
+            color=discord.Color.orange()
+        )
+        embed.set_footer(text="解除は /autosell_rule_remove（番号指定）または /autosell_disable_all")
+        await interaction.response.send_message(embed=embed, ephemeral=True)
+
+    # --- /autosell_rule_remove（番号で解除） ---
+    @app_commands.command(
+        name="autosell_rule_remove",
+        description="自動売却ルールを番号で解除します（番号は /autosell_rules で確認）。"
+    )
+    @app_commands.describe(rule_id="ルール番号")
+    @guild_decorator()
+    async def autosell_rule_remove(self, interaction: discord.Interaction, rule_id: int):
+        if await remove_autosell_rule(interaction.user.id, rule_id):
+            await interaction.response.send_message(f"✅ ルール **#{rule_id}** を解除しました。", ephemeral=True)
+        else:
+            await interaction.response.send_message(f"❗ ルール **#{rule_id}** は見つかりません。", ephemeral=True)
+
     # --- /luckyblock（自動売却反映、本番結果のみ表示） ---
     @app_commands.command(
         name="luckyblock",
@@ -312,6 +392,7 @@ class LuckyBlockCog(commands.Cog):
         ]
     )
     @guild_decorator()
+    @limited()
     async def luckyblock(
         self,
         interaction: discord.Interaction,
@@ -323,21 +404,40 @@ class LuckyBlockCog(commands.Cog):
         uid = interaction.user.id
         user = interaction.user
 
-        cats, _, _ = await get_user_row(uid)
-
-        # ベース空きチェック
-        slots = await free_slots(uid)
-        free_count = len(slots)
-        if free_count < count:
-            await interaction.response.send_message(
-                f"📦 ベースの空きが足りません！\n"
-                f"空きスロット：{free_count} / 必要スロット：{count}",
-                ephemeral=True
-            )
-            return
-
         cost = TIERS[tier_name]["cost"] * count
-        if cats < cost:
+        matcher = await get_autosell_matcher(uid)
+        obtained, sold, total_value, sold_value = [], [], 0, 0
+
+        # 事前チェック（キャッシュ上で明らかに足りなければ書き込みを取らずに返す）
+        cats, _, _ = await get_user_row(uid)
+        stored = []  # ベースに入りきらず保管庫へ回した分
+        if cats >= cost:
+            cats = None  # 残高不足のときだけ表示用にセット
+            r, seed = rng.for_interaction(interaction)
+
+            # 徴収 → 開封・収納 → 自動売却の入金 を1トランザクションで（ここが確定）
+            async with user_locks.hold(uid), economy_tx() as tx:
+                # 残高不足なら何も引かれず None
+                cats_after = await tx.adjust_credits(uid, -cost)
+                if cats_after is None:
+                    cats, _, _ = await tx.get_user_row(uid)
+                else:
+                    keep, sold = matcher.split(tier_name, open_many(tier_name, count, r))
+
+                    # 空きスロットへまとめて収納、あふれた分は保管庫へ
+                    placed, stored = await tx.place_many(uid, [name for name, _ in keep])
+                    for name, slot in placed:
+                        val = base_value(name)
+                        obtained.append((name, slot, val))
+                        total_value += val
+                    await tx.vault_add(uid, stored)
+
+                    # 最終残高（表示用）
+                    sold_value = sum(val for _, val in sold)
+                    if sold_value > 0:
+                        cats_after = await tx.adjust_credits(uid, sold_value)
+
+        if cats is not None:
             await interaction.response.send_message(
                 f"💸 残高不足：必要 **{fmt_compact(cost)} cats** / "
                 f"所持 **{fmt_compact(cats)} cats**",
@@ -345,31 +445,6 @@ class LuckyBlockCog(commands.Cog):
             )
             return
 
-        # ここで即座にコストを引く
-        await update_user(uid, credits=cats - cost)
-
-        autosell_list = await get_autosell_list(uid)
-        obtained, sold, total_value, sold_value = [], [], 0, 0
-
-        for _ in range(count):
-            name = pull_once(tier_name)
-            val = base_value(name)
-            if name in autosell_list:
-                sold.append((name, val))
-                sold_value += val
-            else:
-                slot = await place_in_first_free(uid, name)
-                if slot is not None:
-                    obtained.append((name, slot, val))
-                    total_value += val
-
-        if sold_value > 0:
-            cur, _, _ = await get_user_row(uid)
-            await update_user(uid, credits=cur + sold_value)
-
-        # 最終残高（表示用）
-        cats_after = cats - cost + sold_value
-
         # 結果 embed（最初から結果だけ表示）
         embed = discord.Embed(
             title=f"🎁 {user.display_name} の Lucky Block: {tier_name} ×{count}",
@@ -381,6 +456,11 @@ class LuckyBlockCog(commands.Cog):
         for name, slot, val in obtained:
             lines.append(f"- #{slot:>2} **{name}** 〔{fmt_compact(val)} cats〕")
 
+        if stored:
+            lines.append("\n🗄️ **ベースが満杯のため保管庫へ:**")
+            for name in stored:
+                lines.append(f"- **{name}** 〔{fmt_compact(base_value(name))} cats〕")
+
         if sold:
             lines.append("\n💰 **自動売却:**")
             for name, val in sold:
@@ -388,10 +468,126 @@ class LuckyBlockCog(commands.Cog):
 
         embed.description = "\n".join(lines) if lines else "（ベース収納なし：すべて自動売却）"
         embed.set_footer(
-            text=f"消費: {fmt_compact(cost)} cats / 残高: {fmt_compact(cats_after)} cats"
+            text=f"消費: {fmt_compact(cost)} cats / 残高: {fmt_compact(cats_after)} cats / seed: {rng.fmt_seed(seed)}"
         )
 
         await interaction.response.send_message(embed=embed)
 
+    # --- /luckyblock_bulk（大量開封：1行ずつではなく集計して表示） ---
+    @app_commands.command(
+        name="luckyblock_bulk",
+        description=f"ラッキーブロックをまとめて開けます（最大{LUCKY_BULK_MAX}個）。入りきらない分は保管庫へ。"
+    )
+    @app_commands.describe(tier="ラッキーブロックを選択", count=f"開ける数（1〜{LUCKY_BULK_MAX}）")
+    @app_commands.choices(
+        tier=[
+            app_commands.Choice(
+                name=f"{n} ({fmt_compact(TIERS[n]['cost'])} cats)",
+                value=n
+            )
+            for n in TIERS.keys()
+        ]
+    )
+    @guild_decorator()
+    @limited()
+    async def luckyblock_bulk(
+        self,
+        interaction: discord.Interaction,
+        tier: app_commands.Choice[str],
+        count: app_commands.Range[int, 1, LUCKY_BULK_MAX] = 100
+    ):
+        tier_name = tier.value
+        uid = interaction.user.id
+        user = interaction.user
+        cost = TIERS[tier_name]["cost"] * count
+
+        # 事前チェック（キャッシュ）。空き不足は失敗にせず保管庫で吸収する
+        cats, _, _ = await get_user_row(uid)
+        if cats < cost:
+            await interaction.response.send_message(
+                f"💸 残高不足：必要 **{fmt_compact(cost)} cats** / "
+                f"所持 **{fmt_compact(cats)} cats**",
+                ephemeral=True
+            )
+            return
+
+        # 開封・集計に時間がかかっても 3 秒制限に掛からないよう先に defer。
+        # トランザクション内の残高不足は本人にだけ見せたいので defer は ephemeral、結果はチャンネルへ投稿する
+        await interaction.response.defer(ephemeral=True, thinking=True)
+        matcher = await get_autosell_matcher(uid)
+        r, seed = rng.for_interaction(interaction)
+
+        # 一括抽選・振り分け（トランザクションの外で済ませる）
+        pulls = open_many(tier_name, count, r)
+        value_of = dict(pulls)
+        keep, sold = matcher.split(tier_name, pulls)
+        sold_value = sum(v for _, v in sold)
+
+        async with user_locks.hold(uid), economy_tx() as tx:
+            cats_after = await tx.adjust_credits(uid, -cost)
+            if cats_after is not None:
+                placed, stored = await tx.place_many(uid, [name for name, _ in keep])
+                await tx.vault_add(uid, stored)
+                if sold_value > 0:
+                    cats_after = await tx.adjust_credits(uid, sold_value)
+            else:
+                cats, _, _ = await tx.get_user_row(uid)
+
+        if cats_after is None:
+            await interaction.followup.send(
+                f"💸 残高不足：必要 **{fmt_compact(cost)} cats** / "
+                f"所持 **{fmt_compact(cats)} cats**",
+                ephemeral=True
+            )
+            return
+
+        # ===== 集計 =====
+        total_value = sum(v for _, v in pulls)
+        placed_value = sum(value_of[name] for name, _ in placed)
+        by_char = Counter()
+        by_mut = Counter()
+        for name, _ in pulls:
+            base, mid = catalog.split(name)
+            by_char[base] += 1
+            by_mut[mid] += 1
+        best_name, best_value = max(pulls, key=lambda p: p[1])
+
+        embed = discord.Embed(
+            title=f"🎁 {user.display_name} の Lucky Block: {tier_name} ×{count}",
+            color=TIERS[tier_name]["color"]
+        )
+        embed.set_thumbnail(url=TIERS[tier_name]["thumbnail"])
+        embed.description = (
+            f"🏆 ベスト：**{best_name}** 〔{fmt_compact(best_value)} cats〕\n"
+            f"💎 開封価値の合計：**{fmt_compact(total_value)} cats**（コスト {fmt_compact(cost)}）\n"
+            f"📦 ベース収納：**{len(placed)}** 体 〔{fmt_compact(placed_value)} cats〕\n"
+            f"🗄️ 保管庫へ：**{len(stored)}** 体 〔{fmt_compact(sum(value_of[n] for n in stored))} cats〕\n"
+            f"💰 自動売却：**{len(sold)}** 体 → +{fmt_compact(sold_value)} cats"
+        )
+
+        top = by_char.most_common(15)
+        char_lines = [f"- {name} ×{n}" for name, n in top]
+        if len(by_char) > len(top):
+            char_lines.append(f"…ほか {len(by_char) - len(top)} 種")
+        embed.add_field(name="キャラ別", value="\n".join(char_lines), inline=True)
+        mut_lines = [
+            f"- {catalog.MUT_NAMES[mid] or 'なし'} ×{n}"
+            for mid, n in sorted(by_mut.items())
+        ]
+        embed.add_field(name="ミューテーション別", value="\n".join(mut_lines), inline=True)
+        embed.set_footer(
+            text=f"消費: {fmt_compact(cost)} cats / 残高: {fmt_compact(cats_after)} cats / seed: {rng.fmt_seed(seed)}"
+        )
+        if interaction.channel is not None:
+            try:
+                await interaction.channel.send(embed=embed)
+            except discord.Forbidden:
+                pass
+            else:
+                await interaction.followup.send("🎁 結果をチャンネルに投稿しました。", ephemeral=True)
+                return
+        # チャンネルに書けない（権限なし等）ときは本人にだけ見せる
+        await interaction.followup.send(embed=embed, ephemeral=True)
+
 async def setup(bot: commands.Bot):
     await bot.add_cog(LuckyBlockCog(bot))
@@ -1,10 +1,12 @@
 # cogs/math.py
-import random, asyncio, discord
+import asyncio, discord
 from discord.ext import commands
 from discord import app_commands
-from db import get_user_row, update_user
+from db import adjust_credits
 from constants import GUILD_ID, QUIZ_REWARD_MIN, QUIZ_REWARD_MAX
 from utils import fmt_compact, parse_int_loose
+import rng
+from ratelimit import limited
 
 def guild_decorator():
     return app_commands.guilds(discord.Object(id=int(GUILD_ID))) if GUILD_ID else (lambda f: f)
@@ -18,7 +20,7 @@ class MathCog(commands.Cog):
         description="計算問題に正解したら cats がもらえる！"
     )
     @guild_decorator()
-    @app_commands.checks.cooldown(1, 10.0, key=lambda i: i.user.id)
+    @limited()
     async def math(self, interaction:discord.Interaction):
         if not interaction.client.intents.message_content:
             await interaction.response.send_message(
@@ -29,18 +31,19 @@ class MathCog(commands.Cog):
 
         user = interaction.user
         uid = user.id
+        r, _ = rng.for_interaction(interaction)
 
-        kind = random.choice(["add", "sub", "mul"])
+        kind = r.choice(["add", "sub", "mul"])
         if kind == "add":
-            a, b = random.randint(10, 99), random.randint(10, 99)
+            a, b = r.randint(10, 99), r.randint(10, 99)
             q = f"{a}+{b}"
             ans = a + b
         elif kind == "sub":
-            a, b = sorted([random.randint(10, 99), random.randint(10, 99)], reverse=True)
+            a, b = sorted([r.randint(10, 99), r.randint(10, 99)], reverse=True)
             q = f"{a}-{b}"
             ans = a - b
         else:
-            a, b = random.randint(1, 9), random.randint(1, 9)
+            a, b = r.randint(1, 9), r.randint(1, 9)
             q = f"{a}×{b}"
             ans = a * b
 
@@ -83,12 +86,11 @@ class MathCog(commands.Cog):
             return
 
         if answered == ans:
-            reward = random.randint(QUIZ_REWARD_MIN, QUIZ_REWARD_MAX)
-            c, _, _ = await get_user_row(uid)
-            await update_user(uid, credits=c + reward)
+            reward = r.randint(QUIZ_REWARD_MIN, QUIZ_REWARD_MAX)
+            new_bal = await adjust_credits(uid, reward)
             await interaction.channel.send(
                 f"✅ **正解！** {user.mention} に **+{fmt_compact(reward)} cats** を付与。"
-                f" 新残高：**{fmt_compact(c + reward)} cats**"
+                f" 新残高：**{fmt_compact(new_bal)} cats**"
             )
         else:
             await interaction.channel.send(f"❌ **不正解！** 正解は **{ans}** でした。")
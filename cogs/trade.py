@@ -2,39 +2,18 @@
 import discord
 from discord.ext import commands
 from discord import app_commands
-import aiosqlite
 
-from constants import GUILD_ID
-from db import get_slot_name, set_slot_value
+from constants import GUILD_ID, BASE_SLOTS
+from db import get_slot_name, economy_tx
 from utils import base_value, fmt_compact  # base_value が utils にある前提
-
-DB_PATH = "luckyblock.db"
+from locks import user_locks
+from ratelimit import limited
 
 
 def guild_decorator():
     return app_commands.guilds(discord.Object(id=int(GUILD_ID))) if GUILD_ID else (lambda f: f)
 
 
-# ===== お気に入り解除用（base.py と同じテーブルを使う） =====
-async def remove_favorite(uid: int, slot: int):
-    async with aiosqlite.connect(DB_PATH) as db:
-        # 念のためテーブルが無い場合に備えて作成
-        await db.execute(
-            """
-            CREATE TABLE IF NOT EXISTS favorites (
-                user_id INTEGER NOT NULL,
-                slot    INTEGER NOT NULL,
-                PRIMARY KEY(user_id, slot)
-            )
-            """
-        )
-        await db.execute(
-            "DELETE FROM favorites WHERE user_id=? AND slot=?",
-            (uid, slot),
-        )
-        await db.commit()
-
-
 # ====== 受信者側の承認ビュー ======
 class TradeExecuteView(discord.ui.View):
     def __init__(self, requester: discord.User, target: discord.User,
@@ -57,9 +36,19 @@ class TradeExecuteView(discord.ui.View):
             )
             return
 
-        # 最新のスロット状況を確認（途中で変わっていないかチェック）
-        cur_req_name = await get_slot_name(self.requester.id, self.req_slot)
-        cur_tgt_name = await get_slot_name(self.target.id, self.tgt_slot)
+        # 最新のスロット状況の確認とスワップを1トランザクションで
+        async with user_locks.hold(self.requester.id, self.target.id), economy_tx() as tx:
+            cur_req_name = await tx.get_slot_name(self.requester.id, self.req_slot)
+            cur_tgt_name = await tx.get_slot_name(self.target.id, self.tgt_slot)
+
+            if cur_req_name is not None and cur_tgt_name is not None:
+                # スワップ実行
+                await tx.set_slot_value(self.requester.id, self.req_slot, cur_tgt_name)
+                await tx.set_slot_value(self.target.id, self.tgt_slot, cur_req_name)
+
+                # お気に入り解除（仕様：交換後はそのキャラのお気に入りが外れる）
+                await tx.remove_favorite(self.requester.id, self.req_slot)
+                await tx.remove_favorite(self.target.id, self.tgt_slot)
 
         if cur_req_name is None or cur_tgt_name is None:
             for c in self.children:
@@ -71,14 +60,6 @@ class TradeExecuteView(discord.ui.View):
             self.stop()
             return
 
-        # スワップ実行
-        await set_slot_value(self.requester.id, self.req_slot, cur_tgt_name)
-        await set_slot_value(self.target.id, self.tgt_slot, cur_req_name)
-
-        # お気に入り解除（仕様：交換後はそのキャラのお気に入りが外れる）
-        await remove_favorite(self.requester.id, self.req_slot)
-        await remove_favorite(self.target.id, self.tgt_slot)
-
         for c in self.children:
             c.disabled = True
 
@@ -211,10 +192,11 @@ class TradeCog(commands.Cog):
     )
     @app_commands.describe(
         user="交換したい相手",
-        my_slot="自分のベーススロット番号（1〜25）",
-        their_slot="相手のベーススロット番号（1〜25）"
+        my_slot=f"自分のベーススロット番号（1〜{BASE_SLOTS}）",
+        their_slot=f"相手のベーススロット番号（1〜{BASE_SLOTS}）"
     )
     @guild_decorator()
+    @limited()
     async def trade(
         self,
         interaction: discord.Interaction,
@@ -238,9 +220,9 @@ class TradeCog(commands.Cog):
                 ephemeral=True
             )
             return
-        if not (1 <= my_slot <= 25 and 1 <= their_slot <= 25):
+        if not (1 <= my_slot <= BASE_SLOTS and 1 <= their_slot <= BASE_SLOTS):
             await interaction.response.send_message(
-                "❌ スロット番号は **1〜25** の範囲で指定してください。",
+                f"❌ スロット番号は **1〜{BASE_SLOTS}** の範囲で指定してください。",
                 ephemeral=True
             )
             return
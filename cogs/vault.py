@@ -0,0 +1,174 @@
+# cogs/vault.py
+# 保管庫：ベース（BASE_SLOTS 枠）に入りきらないブレインロットを無制限に置いておく場所。
+# 同じ装飾名は「×個数」でまとまる。ページ送りはキーセット（直前ページの最後のキーから続きを読む）。
+import discord
+from discord.ext import commands
+from discord import app_commands
+
+from constants import GUILD_ID, BASE_SLOTS
+from db import (
+    VAULT_PAGE_SIZE, vault_page, vault_page_start, vault_stats, vault_names, vault_store, vault_take,
+)
+from utils import fmt_compact, parse_slots
+from locks import user_locks
+import catalog
+from ratelimit import limited
+
+
+def guild_decorator():
+    return app_commands.guilds(discord.Object(id=int(GUILD_ID))) if GUILD_ID else (lambda f: f)
+
+
+def _pages(kinds: int) -> int:
+    return max(1, -(-kinds // VAULT_PAGE_SIZE))
+
+
+def vault_embed(target: discord.abc.User, rows, page: int, stats) -> discord.Embed:
+    kinds, copies, total_value = stats
+    lines = []
+    for cid, mid, count in rows:
+        val = catalog.value(cid, mid)
+        lines.append(f"- **{catalog.decode(cid, mid)}** ×{count} 〔{fmt_compact(val)} cats〕")
+    embed = discord.Embed(
+        title=f"🗄️ {target.display_name} の保管庫",
+        description="\n".join(lines) if lines else "（空）",
+        color=discord.Color.dark_teal(),
+    )
+    embed.set_footer(
+        text=f"{page}/{_pages(kinds)} ページ｜{kinds} 種・{copies} 体｜合計価値：{fmt_compact(total_value)} cats"
+    )
+    return embed
+
+
+class VaultView(discord.ui.View):
+    """前後ページのボタン。表示中の先頭・末尾のキーを持っておき、そこから続きを読む"""
+    def __init__(self, owner_id: int, target: discord.abc.User, rows, page: int, stats):
+        super().__init__(timeout=120)
+        self.owner_id = owner_id
+        self.target = target
+        self.page = page
+        self.stats = stats
+        self._set_rows(rows)
+
+    def _set_rows(self, rows):
+        self.first = (rows[0][0], rows[0][1]) if rows else None
+        self.last = (rows[-1][0], rows[-1][1]) if rows else None
+        self.prev_page.disabled = self.page <= 1
+        self.next_page.disabled = self.page >= _pages(self.stats[0])
+
+    async def _show(self, interaction: discord.Interaction, rows, page: int):
+        if not rows:
+            # 他の操作で中身が減った
+            await interaction.response.send_message("これ以上ページはありません。", ephemeral=True)
+            return
+        self.page = page
+        self._set_rows(rows)
+        await interaction.response.edit_message(embed=vault_embed(self.target, rows, page, self.stats), view=self)
+
+    async def interaction_check(self, interaction: discord.Interaction) -> bool:
+        if interaction.user.id != self.owner_id:
+            await interaction.response.send_message("このボタンはコマンドを実行した人のみ操作できます。", ephemeral=True)
+            return False
+        return True
+
+    @discord.ui.button(label="◀ 前へ", style=discord.ButtonStyle.secondary)
+    async def prev_page(self, interaction: discord.Interaction, button: discord.ui.Button):
+        rows = await vault_page(self.target.id, before=self.first) if self.first else []
+        await self._show(interaction, rows, self.page - 1)
+
+    @discord.ui.button(label="次へ ▶", style=discord.ButtonStyle.secondary)
+    async def next_page(self, interaction: discord.Interaction, button: discord.ui.Button):
+        rows = await vault_page(self.target.id, after=self.last) if self.last else []
+        await self._show(interaction, rows, self.page + 1)
+
+
+class VaultCog(commands.Cog):
+    def __init__(self, bot: commands.Bot):
+        self.bot = bot
+
+    # --- /vault : 保管庫を表示 ---
+    @app_commands.command(
+        name="vault",
+        description="保管庫（ベースの外に置いたブレインロット）を表示します。"
+    )
+    @app_commands.describe(page="ページ番号（1〜）", user="相手")
+    @guild_decorator()
+    async def vault(self, interaction: discord.Interaction, page: int = 1, user: discord.Member | None = None):
+        target = user or interaction.user
+        stats = await vault_stats(target.id)
+        page = max(1, min(page, _pages(stats[0])))
+        rows = await vault_page(target.id, after=await vault_page_start(target.id, page))
+        view = VaultView(interaction.user.id, target, rows, page, stats)
+        await interaction.response.send_message(embed=vault_embed(target, rows, page, stats), view=view)
+
+    # --- /vault_store : ベース → 保管庫（お気に入りは動かさない） ---
+    @app_commands.command(
+        name="vault_store",
+        description="ベースのブレインロットを保管庫へ移します（お気に入りは除く）。"
+    )
+    @app_commands.describe(slots=f"移すスロット番号（1〜{BASE_SLOTS}）。「1,3,5-8」や「all」で全部")
+    @guild_decorator()
+    @limited()
+    async def vault_store(self, interaction: discord.Interaction, slots: str):
+        uid = interaction.user.id
+        store_all = slots.strip().lower() == "all"
+        targets = None if store_all else parse_slots(slots, BASE_SLOTS)
+        if targets is None and not store_all:
+            await interaction.response.send_message(
+                f"❌ スロット番号は **1〜{BASE_SLOTS}** で指定してください（例：`3` / `1,3,5-8` / `all`）。",
+                ephemeral=True,
+            )
+            return
+
+        async with user_locks.hold(uid):
+            moved = await vault_store(uid, targets)
+        if not moved:
+            await interaction.response.send_message(
+                "⚠️ 移せるブレインロットがありません（すべて空 or お気に入り）。", ephemeral=True
+            )
+            return
+
+        listed = ", ".join(name for _, name in moved[:10])
+        if len(moved) > 10:
+            listed += " 他..."
+        await interaction.response.send_message(
+            f"🗄️ **{len(moved)}** 体を保管庫へ移しました。\n{listed}", ephemeral=True
+        )
+
+    # --- /vault_take : 保管庫 → ベースの空きスロット ---
+    @app_commands.command(
+        name="vault_take",
+        description="保管庫のブレインロットをベースの空きスロットへ移します。"
+    )
+    @app_commands.describe(item="移すブレインロット", count=f"移す数（1〜{BASE_SLOTS}）")
+    @guild_decorator()
+    @limited()
+    async def vault_take(
+        self,
+        interaction: discord.Interaction,
+        item: str,
+        count: app_commands.Range[int, 1, BASE_SLOTS] = 1
+    ):
+        uid = interaction.user.id
+        async with user_locks.hold(uid):
+            placed = await vault_take(uid, item, count)
+        if not placed:
+            await interaction.response.send_message(
+                "⚠️ 移せませんでした（保管庫に無い or ベースに空きがありません）。", ephemeral=True
+            )
+            return
+
+        slots = ", ".join(f"#{slot}" for _, slot in placed)
+        await interaction.response.send_message(
+            f"📦 **{item}** ×{len(placed)} をベースへ移しました（{slots}）。", ephemeral=True
+        )
+
+    @vault_take.autocomplete("item")
+    async def vault_take_item_autocomplete(self, interaction: discord.Interaction, current: str):
+        cur = current.lower()
+        names = await vault_names(interaction.user.id)
+        return [app_commands.Choice(name=n, value=n) for n in names if cur in n.lower()][:25]
+
+
+async def setup(bot: commands.Bot):
+    await bot.add_cog(VaultCog(bot))
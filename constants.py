@@ -3,16 +3,44 @@ from dotenv import load_dotenv
 load_dotenv()
 
 GUILD_ID = os.getenv("GUILD_ID")  # なしならグローバル同期
+RNG_SEED = os.getenv("RNG_SEED")  # 設定すると乱数 seed が interaction.id から決まる（再現・ベンチ用）
 
 # 経済バランス
 COOLDOWN_LUCKY_SECONDS = 10
+LUCKY_BULK_MAX = 1000  # /luckyblock_bulk で一度に開けられる数
 DAILY_COOLDOWN_SECONDS = 12 * 3600
 
+# レート制限（ratelimit.py）：コマンド名 → (1回ぶん回復する秒数, 連続で使える回数)
+RATE_LIMITS = {
+    "luckyblock": (COOLDOWN_LUCKY_SECONDS, 3),
+    "luckyblock_bulk": (60, 1),
+    "luckyblock_battle": (10, 2),
+    "math": (10, 1),
+    "english": (10, 1),
+    "sell": (2, 5),
+    "sell_all": (5, 2),
+    "vault_store": (2, 5),
+    "vault_take": (2, 5),
+    "give": (5, 3),
+    "trade": (10, 2),
+}
+RATE_LIMIT_FLUSH_SECONDS = 30  # 状態を DB へ書き出す間隔（終了時にも書き出す）
+RATE_LIMIT_PURGE_SECONDS = 3600  # 回復しきった行を DB から消す間隔（書き出しのついでに行う）
+
 # /daily：受取回数に応じて 100M ずつ増える（1回目=100M, 2回目=200M, 3回目=300M, ...）
 DAILY_BASE_INC = 100_000_000  # 100M
 
 GIVE_MIN_AMOUNT = 100_000_000   # /give 最低送金 100M
 
+BASE_SLOTS = 25  # ベースのスロット数（1〜25）
+
+# ランキング
+LEADERBOARD_SIZE = 10           # 表示する人数
+LEADERBOARD_REFRESH_SECONDS = 30  # スナップショットを作り直す間隔（書き込みが無ければ作り直さない）
+DISPLAY_NAME_TTL_SECONDS = 600  # user_id → 表示名 キャッシュの有効期限
+NEGATIVE_NAME_TTL_SECONDS = 24 * 3600  # サーバーにいない・存在しないユーザーを覚えておく期間（BOT は無期限）
+MEMBER_FETCH_CONCURRENCY = 5    # REST でメンバーを引くときの同時数
+
 # クイズ報酬（/math & /english）：ランダム 10M〜50M
 QUIZ_REWARD_MIN = 10_000_000
 QUIZ_REWARD_MAX = 50_000_000
@@ -1,40 +1,309 @@
+import asyncio
+import math
 import aiosqlite
+from contextlib import asynccontextmanager
 from typing import List, Tuple, Optional, Dict
-from constants import MUTATION_INDEX
+from constants import MUTATION_INDEX, BASE_SLOTS
+import catalog
+import autosell
+import migrations
+from cache import LRUCache
 
 DB_PATH = "luckyblock.db"
 
-CREATE_USERS = """CREATE TABLE IF NOT EXISTS users (
- user_id INTEGER PRIMARY KEY,
- credits INTEGER NOT NULL DEFAULT 0,
- last_open INTEGER NOT NULL DEFAULT 0,
- last_daily INTEGER NOT NULL DEFAULT 0
-);"""
-
-CREATE_BASE = """CREATE TABLE IF NOT EXISTS base_slots (
- user_id INTEGER NOT NULL,
- slot INTEGER NOT NULL,
- name TEXT, -- NULL=空
- PRIMARY KEY (user_id, slot)
-);"""
-
-CREATE_MUT_INDEX = """CREATE TABLE IF NOT EXISTS mutation_index (
- name TEXT PRIMARY KEY,
- idx INTEGER NOT NULL
-);"""
-
-# /daily の受取回数カウンタを持つ
-CREATE_USER_META = """CREATE TABLE IF NOT EXISTS user_meta (
- user_id INTEGER PRIMARY KEY,
- daily_count INTEGER NOT NULL DEFAULT 0
-);"""
+# ===== 接続マネージャ =====
+# 書き込みは1本の接続に直列化、読み取りは小さなプールから借りる。
+# 起動時（on_ready）に open_db、終了時に close_db を呼ぶ。
+READER_POOL_SIZE = 4
+
+PRAGMAS = (
+    "PRAGMA journal_mode=WAL",
+    "PRAGMA synchronous=NORMAL",   # 読み取り接続用。書き込み接続は WRITER_PRAGMAS で FULL にする
+    "PRAGMA busy_timeout=5000",
+    "PRAGMA temp_store=MEMORY",
+    "PRAGMA cache_size=-8000",     # 約 8MB
+    "PRAGMA mmap_size=67108864",   # 64MB
+)
+# 書き込み接続だけ COMMIT ごとに WAL を fsync する（NORMAL だと COMMIT 直後の電源断で失われうる）。
+# 呼び出し側にはコミットが永続化してから返す。fsync はグループコミットでまとめて1回になる。
+WRITER_PRAGMAS = (
+    "PRAGMA synchronous=FULL",
+)
+
+# 書き込みは専用タスク（書き込みアクター）だけが行う。
+# 各コルーチンの書き込みはキューに積まれ、数ミリ秒ぶんをまとめて1回の COMMIT（グループコミット）にする。
+# 1件ごとに SAVEPOINT を張るので、失敗した操作だけがロールバックされる。
+GROUP_COMMIT_WINDOW = 0.002  # 秒。キューが空のとき、後続の書き込みをこれだけ待ってからまとめる
+GROUP_COMMIT_MAX = 64        # 1コミットにまとめる操作数の上限
+
+_writer: Optional[aiosqlite.Connection] = None
+_write_queue: Optional[asyncio.Queue] = None
+_writer_task: Optional[asyncio.Task] = None
+_readers: Optional[asyncio.Queue] = None
+_open_lock = asyncio.Lock()
+# コミットのたびに増える番号（ランキングなどの「前回から書き込みがあったか」判定用）
+_commit_seq = 0
+
+async def _connect(*, readonly: bool = False) -> aiosqlite.Connection:
+    db = await aiosqlite.connect(DB_PATH)
+    for p in PRAGMAS:
+        await db.execute(p)
+    if readonly:
+        await db.execute("PRAGMA query_only=ON")
+    else:
+        for p in WRITER_PRAGMAS:
+            await db.execute(p)
+    return db
+
+class _WriteOp:
+    """書き込みアクターに渡す1操作。fn(db) を実行し、コミット後に done を解決する"""
+    __slots__ = ("fn", "done", "result", "error")
+
+    def __init__(self, fn, done: asyncio.Future):
+        self.fn = fn
+        self.done = done
+        self.result = None
+        self.error: Optional[BaseException] = None
+
+class _Rollback(Exception):
+    """呼び出し側の with が例外で抜けた（その操作だけ巻き戻す）"""
+
+async def _run_op(db: aiosqlite.Connection, op: _WriteOp):
+    await db.execute("SAVEPOINT op")
+    try:
+        op.result = await op.fn(db)
+    except Exception as e:
+        # 呼び出し側が自分で例外を投げ直しているので _Rollback は伝えない
+        op.error = None if isinstance(e, _Rollback) else e
+        await db.execute("ROLLBACK TO op")
+    await db.execute("RELEASE op")
+
+async def _writer_loop(db: aiosqlite.Connection, q: asyncio.Queue):
+    global _commit_seq
+    running = True
+    while running:
+        op = await q.get()
+        if op is None:
+            break
+        if q.empty():
+            await asyncio.sleep(GROUP_COMMIT_WINDOW)
+        batch: List[_WriteOp] = []
+        try:
+            await db.execute("BEGIN IMMEDIATE")
+            # 実行中に積まれた分も上限まで同じトランザクションに載せる
+            while True:
+                batch.append(op)
+                await _run_op(db, op)
+                if len(batch) >= GROUP_COMMIT_MAX or q.empty():
+                    break
+                op = q.get_nowait()
+                if op is None:
+                    running = False
+                    break
+            await db.commit()
+            _commit_seq += 1
+        except Exception as e:
+            # SAVEPOINT で戻せない失敗や COMMIT 失敗はバッチ全体を失敗にする
+            print(f"[db] group commit failed ({len(batch)} ops): {e!r}")
+            try:
+                await db.rollback()
+            except Exception:
+                pass
+            for o in batch:
+                o.error = o.error or e
+        for o in batch:
+            if o.done.done():
+                continue
+            if o.error is not None:
+                o.done.set_exception(o.error)
+            else:
+                o.done.set_result(o.result)
+
+async def open_db():
+    """共有接続と書き込みアクターを開始する（二重に呼んでも1回だけ）"""
+    global _writer, _write_queue, _writer_task, _readers
+    async with _open_lock:
+        if _writer is not None:
+            return
+        _writer = await _connect()
+        _write_queue = asyncio.Queue()
+        _writer_task = asyncio.create_task(_writer_loop(_writer, _write_queue))
+        q: asyncio.Queue = asyncio.Queue()
+        for _ in range(READER_POOL_SIZE):
+            q.put_nowait(await _connect(readonly=True))
+        _readers = q
+
+async def close_db():
+    """積まれている書き込みをすべてコミットしてから閉じる"""
+    global _writer, _write_queue, _writer_task, _readers
+    async with _open_lock:
+        if _writer is None:
+            return
+        _write_queue.put_nowait(None)
+        await _writer_task
+        await _writer.close()
+        while _readers is not None and not _readers.empty():
+            await _readers.get_nowait().close()
+        _writer, _write_queue, _writer_task, _readers = None, None, None, None
+
+def commit_seq() -> int:
+    return _commit_seq
+
+@asynccontextmanager
+async def writer():
+    """
+    書き込み用接続を借りる。with の中身は書き込みアクターのトランザクション内（SAVEPOINT）で実行され、
+    抜けるとグループコミットで確定するまで待つ。例外で抜けた場合はその分だけロールバックされる。
+    ※ commit は呼ばないこと。with の中で別の書き込み関数（adjust_credits など）を呼ぶと自分の番を待ってデッドロックする
+    """
+    if _write_queue is None:
+        await open_db()
+    loop = asyncio.get_running_loop()
+    granted: asyncio.Future = loop.create_future()
+    released: asyncio.Future = loop.create_future()
+
+    async def handoff(db: aiosqlite.Connection):
+        # アクター側：接続を渡し、呼び出し側が with を抜けるまで待つ
+        granted.set_result(db)
+        if not await released:
+            raise _Rollback()
+
+    op = _WriteOp(handoff, loop.create_future())
+    # 途中で呼び出し側がいなくなっても "exception was never retrieved" を出さない
+    op.done.add_done_callback(lambda f: f.cancelled() or f.exception())
+    _write_queue.put_nowait(op)
+    try:
+        await asyncio.wait((granted, op.done), return_when=asyncio.FIRST_COMPLETED)
+        if not granted.done():
+            op.done.result()
+        yield granted.result()
+    except BaseException:
+        if not released.done():
+            released.set_result(False)
+        raise
+    released.set_result(True)
+    # 自分の分が COMMIT されるまで待つ
+    await op.done
+
+async def _fetchone(db: aiosqlite.Connection, sql: str, params=()):
+    # 共有接続ではカーソルを開きっぱなしにしない（古いスナップショットを掴み続けるため）
+    async with db.execute(sql, params) as cur:
+        return await cur.fetchone()
+
+@asynccontextmanager
+async def reader():
+    """読み取り専用接続をプールから借りる"""
+    if _readers is None:
+        await open_db()
+    db = await _readers.get()
+    try:
+        yield db
+    finally:
+        _readers.put_nowait(db)
+
+# ===== ユーザー状態キャッシュ =====
+# uid → {"row": (credits,last_open,last_daily), "daily_count": int, "favorites": (slot,...),
+#        "autosell": autosell.Matcher, "base": ((slot,name),...), "vault": (name,...)}
+# 読み出しは read-through、書き込みはコミット後に write-through か無効化する。
+USER_CACHE_SIZE = 4096
+
+_user_cache = LRUCache(USER_CACHE_SIZE)
+# 世代番号。読み出し中に書き込みが挟まったら、その読み出し結果（古い値）はキャッシュしない
+# 世代は読み出し中のユーザーの分だけ持つ（uid → [世代, 読み出し中の数]。終われば消えるので増え続けない）
+_cache_epoch = 0
+_user_gen: Dict[int, List[int]] = {}
+
+def _bump(uid:int):
+    g = _user_gen.get(uid)
+    if g is not None:
+        g[0] += 1
+
+def invalidate_user(uid:Optional[int]=None, *fields:str):
+    """キャッシュを捨てる（uid=None で全員、fields 省略でその人の全項目）"""
+    global _cache_epoch
+    if uid is None:
+        _cache_epoch += 1
+        _user_cache.clear()
+        return
+    _bump(uid)
+    entry = _user_cache.get(uid)
+    if entry is None:
+        return
+    if not fields:
+        _user_cache.pop(uid)
+    for f in fields:
+        entry.pop(f, None)
+
+def _cache_put(uid:int, field:str, value):
+    entry = _user_cache.get(uid)
+    if entry is None:
+        entry = {}
+        _user_cache.put(uid, entry)
+    entry[field] = value
+
+def _patch_row(uid:int, *, credits=None, last_open=None, last_daily=None):
+    """コミット済みの users 更新をキャッシュへ反映（write-through）"""
+    _bump(uid)
+    entry = _user_cache.get(uid)
+    row = entry.get("row") if entry else None
+    if row is None:
+        return
+    entry["row"] = (
+        row[0] if credits is None else credits,
+        row[1] if last_open is None else last_open,
+        row[2] if last_daily is None else last_daily,
+    )
+
+async def _read_through(uid:int, field:str, load):
+    entry = _user_cache.get(uid)
+    if entry is not None and field in entry:
+        return entry[field]
+    g = _user_gen.get(uid)
+    if g is None:
+        g = _user_gen[uid] = [0, 0]
+    g[1] += 1
+    start = (_cache_epoch, g[0])
+    try:
+        async with reader() as db:
+            value = await load(db, uid)
+        # 読み出し開始時から書き込みが無かったときだけ入れる
+        if value is not None and start == (_cache_epoch, g[0]):
+            _cache_put(uid, field, value)
+    finally:
+        g[1] -= 1
+        if g[1] == 0:
+            del _user_gen[uid]
+    return value
+
+# ===== catalog =====
+async def _catalog_id(db:aiosqlite.Connection, name:str) -> int:
+    """キャラ名の char_id（未登録なら catalog に追加）"""
+    cid = catalog.CHAR_ID.get(name)
+    if cid is None:
+        await db.execute("INSERT OR IGNORE INTO catalog(name) VALUES(?)", (name,))
+        r = await _fetchone(db, "SELECT char_id FROM catalog WHERE name=?", (name,))
+        cid = catalog.register(name, r[0])
+    return cid
+
+async def _encode(db:aiosqlite.Connection, name:str) -> Tuple[int, int]:
+    """装飾名 → (char_id, mut_id)"""
+    enc = catalog.encode(name)
+    if enc is None:
+        base, mid = catalog.split(name)
+        enc = (await _catalog_id(db, base), mid)
+    return enc
+
+async def _sync_catalog(db:aiosqlite.Connection):
+    # 新規DBでは catalog.default_names() の順に 1,2,3... と採番される
+    await db.executemany("INSERT OR IGNORE INTO catalog(name) VALUES(?)", [(n,) for n in catalog.default_names()])
+    catalog.load(await db.execute_fetchall("SELECT char_id, name FROM catalog"))
 
 async def init_db():
-    async with aiosqlite.connect(DB_PATH) as db:
-        await db.execute(CREATE_USERS)
-        await db.execute(CREATE_BASE)
-        await db.execute(CREATE_MUT_INDEX)
-        await db.execute(CREATE_USER_META)
+    """起動時に1回だけ呼ぶ。スキーマ変更は migrations.py が持つ"""
+    await open_db()
+    async with writer() as db:
+        await migrations.migrate(db)
+        await _sync_catalog(db)
         # ミューテーションインデックスを反映
         for name, idx in MUTATION_INDEX.items():
             await db.execute(
@@ -42,124 +311,647 @@ async def init_db():
                 "ON CONFLICT(name) DO UPDATE SET idx=excluded.idx",
                 (name, idx)
             )
-        await db.commit()
 
 # users 基本
-async def get_user_row(uid:int):
-    async with aiosqlite.connect(DB_PATH) as db:
-        cur=await db.execute("SELECT credits,last_open,last_daily FROM users WHERE user_id=?", (uid,))
-        r=await cur.fetchone()
-        if not r:
-            await db.execute("INSERT INTO users(user_id,credits,last_open,last_daily) VALUES(?,0,0,0)", (uid,))
-            await db.execute("INSERT INTO user_meta(user_id,daily_count) VALUES(?,0) ON CONFLICT(user_id) DO NOTHING", (uid,))
-            await db.commit()
-            return 0,0,0
-        # user_meta 側が無い古いデータに対処
+# _xxx(db, ...) は接続を受け取る本体。公開関数と EconomyTx の両方から使う。
+async def _load_user_row(db:aiosqlite.Connection, uid:int) -> Optional[Tuple[int, int, int]]:
+    r=await _fetchone(db, "SELECT credits,last_open,last_daily FROM users WHERE user_id=?", (uid,))
+    return None if not r else (r[0], r[1], r[2])
+
+async def _get_user_row(db:aiosqlite.Connection, uid:int):
+    r = await _load_user_row(db, uid)
+    if r is None:
+        await db.execute("INSERT INTO users(user_id,credits,last_open,last_daily) VALUES(?,0,0,0)", (uid,))
         await db.execute("INSERT INTO user_meta(user_id,daily_count) VALUES(?,0) ON CONFLICT(user_id) DO NOTHING", (uid,))
-        await db.commit()
-        return r[0], r[1], r[2]
+        return 0,0,0
+    return r
 
-async def update_user(uid:int,*,credits=None,last_open=None,last_daily=None):
+async def _update_user(db:aiosqlite.Connection, uid:int,*,credits=None,last_open=None,last_daily=None):
     sets=[];params=[]
     if credits is not None: sets.append("credits=?");params.append(credits)
     if last_open is not None: sets.append("last_open=?");params.append(last_open)
     if last_daily is not None: sets.append("last_daily=?");params.append(last_daily)
     if not sets: return
     params.append(uid)
-    async with aiosqlite.connect(DB_PATH) as db:
-        await db.execute(f"UPDATE users SET {', '.join(sets)} WHERE user_id=?", params)
-        await db.commit()
+    await db.execute(f"UPDATE users SET {', '.join(sets)} WHERE user_id=?", params)
+
+async def get_user_row(uid:int):
+    # 既存ユーザーはキャッシュ or 読み取り接続だけで済ませる（書き込みは新規作成時のみ）
+    r = await _read_through(uid, "row", _load_user_row)
+    if r is None:
+        async with writer() as db:
+            r = await _get_user_row(db, uid)
+        _bump(uid)
+        _cache_put(uid, "row", r)
+    return r
+
+async def update_user(uid:int,*,credits=None,last_open=None,last_daily=None):
+    async with writer() as db:
+        await _update_user(db, uid, credits=credits, last_open=last_open, last_daily=last_daily)
+    _patch_row(uid, credits=credits, last_open=last_open, last_daily=last_daily)
+
+# credits 増減（読み→計算→書き戻し をせず、SQL 1回で加減算して新残高を返す）
+async def _adjust_credits(db:aiosqlite.Connection, uid:int, delta:int, min_balance:int=0) -> Optional[int]:
+    sql = ("UPDATE users SET credits = credits + ? "
+           "WHERE user_id=? AND (? >= 0 OR credits + ? >= ?) RETURNING credits")
+    params = (delta, uid, delta, delta, min_balance)
+    r = await _fetchone(db, sql, params)
+    if r is None:
+        # 行が無い新規ユーザーなら作って再試行（残高不足なら None のまま）
+        cur = await db.execute("INSERT INTO users(user_id,credits,last_open,last_daily) VALUES(?,0,0,0) ON CONFLICT(user_id) DO NOTHING", (uid,))
+        if cur.rowcount:
+            r = await _fetchone(db, sql, params)
+    return None if r is None else int(r[0])
+
+async def _transfer_credits(db:aiosqlite.Connection, src:int, dst:int, amount:int) -> Optional[Tuple[int, int]]:
+    s = await _adjust_credits(db, src, -amount)
+    if s is None:
+        return None
+    d = await _adjust_credits(db, dst, amount)
+    return s, d
+
+async def adjust_credits(uid:int, delta:int, *, min_balance:int=0) -> Optional[int]:
+    """credits を delta だけ増減して新残高を返す。減算後に min_balance を下回るなら何もせず None"""
+    async with writer() as db:
+        r = await _adjust_credits(db, uid, delta, min_balance)
+    if r is not None:
+        _patch_row(uid, credits=r)
+    return r
+
+async def transfer_credits(src:int, dst:int, amount:int) -> Optional[Tuple[int, int]]:
+    """src → dst へ amount を移す。(src新残高, dst新残高) を返し、src の残高不足なら None"""
+    async with writer() as db:
+        r = await _transfer_credits(db, src, dst, amount)
+    if r is not None:
+        _patch_row(src, credits=r[0])
+        _patch_row(dst, credits=r[1])
+    return r
 
 # /daily カウント
+async def _get_daily_count(db:aiosqlite.Connection, uid:int) -> int:
+    # 行が無ければ 0 扱い（作成は _increment_daily_count 側で行う）
+    r = await _fetchone(db, "SELECT daily_count FROM user_meta WHERE user_id=?", (uid,))
+    return int(r[0]) if r else 0
+
+async def _increment_daily_count(db:aiosqlite.Connection, uid:int) -> int:
+    await db.execute("INSERT INTO user_meta(user_id,daily_count) VALUES(?,0) ON CONFLICT(user_id) DO NOTHING", (uid,))
+    await db.execute("UPDATE user_meta SET daily_count = daily_count + 1 WHERE user_id=?", (uid,))
+    r = await _fetchone(db, "SELECT daily_count FROM user_meta WHERE user_id=?", (uid,))
+    return int(r[0]) if r else 0
+
 async def get_daily_count(uid:int) -> int:
-    async with aiosqlite.connect(DB_PATH) as db:
-        cur = await db.execute("SELECT daily_count FROM user_meta WHERE user_id=?", (uid,))
-        r = await cur.fetchone()
-        if not r:
-            await db.execute("INSERT INTO user_meta(user_id,daily_count) VALUES(?,0)", (uid,))
-            await db.commit()
-            return 0
-        return int(r[0])
+    return await _read_through(uid, "daily_count", _get_daily_count)
 
 async def increment_daily_count(uid:int) -> int:
     """カウントを+1して新しい値を返す"""
-    async with aiosqlite.connect(DB_PATH) as db:
-        await db.execute("INSERT INTO user_meta(user_id,daily_count) VALUES(?,0) ON CONFLICT(user_id) DO NOTHING", (uid,))
-        await db.execute("UPDATE user_meta SET daily_count = daily_count + 1 WHERE user_id=?", (uid,))
-        await db.commit()
-        cur = await db.execute("SELECT daily_count FROM user_meta WHERE user_id=?", (uid,))
-        r = await cur.fetchone()
-        return int(r[0]) if r else 0
-
-# base
-async def ensure_base(uid:int):
-    async with aiosqlite.connect(DB_PATH) as db:
-        for i in range(1, 26):
-            await db.execute("INSERT INTO base_slots(user_id, slot, name) VALUES(?, ?, NULL) ON CONFLICT(user_id,slot) DO NOTHING", (uid, i))
-        await db.commit()
+    async with writer() as db:
+        n = await _increment_daily_count(db, uid)
+    _bump(uid)
+    _cache_put(uid, "daily_count", n)
+    return n
+
+# ベース合計価値（users.base_value_total）の維持
+async def _add_base_value(db:aiosqlite.Connection, uid:int, delta:int):
+    if not delta: return
+    await db.execute(
+        "INSERT INTO users(user_id,base_value_total) VALUES(?,?) "
+        "ON CONFLICT(user_id) DO UPDATE SET base_value_total = base_value_total + excluded.base_value_total",
+        (uid, delta)
+    )
+
+async def _rebuild_base_value_totals(db:aiosqlite.Connection) -> int:
+    """base_slots から全員分を数え直す。更新した人数を返す"""
+    rows = await db.execute_fetchall("SELECT user_id,char_id,mut_id FROM base_slots")
+    totals: Dict[int, int] = {}
+    for uid, cid, mid in rows:
+        totals[uid] = totals.get(uid, 0) + catalog.value(cid, mid)
+    await db.execute("UPDATE users SET base_value_total=0 WHERE base_value_total<>0")
+    await db.executemany(
+        "INSERT INTO users(user_id,base_value_total) VALUES(?,?) "
+        "ON CONFLICT(user_id) DO UPDATE SET base_value_total=excluded.base_value_total",
+        list(totals.items())
+    )
+    return len(totals)
+
+async def rebuild_base_value_totals() -> int:
+    """
+    base_value_total を全件再計算する（価値表 CHAR_VALUES / MUTATIONS を変えた後などに）。
+    """
+    async with writer() as db:
+        n = await _rebuild_base_value_totals(db)
+        return n
+
+# base（埋まっているスロットだけ行があり、空きは読み出し時に補う）
+async def _list_base(db:aiosqlite.Connection, uid:int) -> List[Tuple[int, Optional[str]]]:
+    rows = await db.execute_fetchall("SELECT slot,char_id,mut_id FROM base_slots WHERE user_id=?", (uid,))
+    by_slot = {slot: catalog.decode(cid, mid) for slot, cid, mid in rows}
+    return [(i, by_slot.get(i)) for i in range(1, BASE_SLOTS + 1)]
+
+async def _free_slots(db:aiosqlite.Connection, uid:int, limit:int=-1) -> List[int]:
+    rows = await db.execute_fetchall("SELECT slot FROM base_slots WHERE user_id=?", (uid,))
+    used = {r[0] for r in rows}
+    frees = [i for i in range(1, BASE_SLOTS + 1) if i not in used]
+    return frees if limit < 0 else frees[:limit]
+
+async def _place_many(db:aiosqlite.Connection, uid:int, names:List[str]) -> Tuple[List[Tuple[str, int]], List[str]]:
+    """空きスロットの小さい順に names をまとめて詰める。([(name, slot)], あふれた names) を返す"""
+    if not names:
+        return [], []
+    slots = await _free_slots(db, uid, len(names))
+    placed = list(zip(names, slots))
+    rows = [(uid, s, *(await _encode(db, n))) for n, s in placed]
+    await db.executemany("INSERT INTO base_slots(user_id, slot, char_id, mut_id) VALUES(?, ?, ?, ?)", rows)
+    await _add_base_value(db, uid, sum(catalog.value(cid, mid) for _, _, cid, mid in rows))
+    return placed, names[len(placed):]
+
+async def _set_slot_value(db:aiosqlite.Connection, uid:int, slot:int, name:Optional[str]):
+    old = await _fetchone(db, "SELECT char_id,mut_id FROM base_slots WHERE user_id=? AND slot=?", (uid, slot))
+    delta = -catalog.value(*old) if old else 0
+    if name is None:
+        await db.execute("DELETE FROM base_slots WHERE user_id=? AND slot=?", (uid, slot))
+    else:
+        cid, mid = await _encode(db, name)
+        await db.execute(
+            "INSERT INTO base_slots(user_id, slot, char_id, mut_id) VALUES(?, ?, ?, ?) "
+            "ON CONFLICT(user_id,slot) DO UPDATE SET char_id=excluded.char_id, mut_id=excluded.mut_id",
+            (uid, slot, cid, mid)
+        )
+        delta += catalog.value(cid, mid)
+    await _add_base_value(db, uid, delta)
+
+async def _get_slot_name(db:aiosqlite.Connection, uid:int, slot:int) -> Optional[str]:
+    row=await _fetchone(db, "SELECT char_id,mut_id FROM base_slots WHERE user_id=? AND slot=?", (uid, slot))
+    return None if not row else catalog.decode(row[0], row[1])
+
+async def _remove_from_slot(db:aiosqlite.Connection, uid:int, slot:int) -> Optional[str]:
+    name = await _get_slot_name(db, uid, slot)
+    if name is None: return None
+    await _set_slot_value(db, uid, slot, None)
+    return name
+
+async def _take_slots(db:aiosqlite.Connection, uid:int, slots:Optional[List[int]]=None) -> List[Tuple[int, int, int]]:
+    """slots（None なら全スロット）のうちお気に入り以外を1文で取り出す。[(slot, char_id, mut_id)] を返す"""
+    sql = ("DELETE FROM base_slots WHERE user_id=? "
+           "AND NOT EXISTS (SELECT 1 FROM favorites f WHERE f.user_id=base_slots.user_id AND f.slot=base_slots.slot)")
+    params: List[int] = [uid]
+    if slots is not None:
+        if not slots:
+            return []
+        sql += f" AND slot IN ({','.join('?' * len(slots))})"
+        params.extend(slots)
+    return sorted(await db.execute_fetchall(sql + " RETURNING slot, char_id, mut_id", params))
+
+async def _sell_slots(db:aiosqlite.Connection, uid:int, slots:Optional[List[int]]=None) -> Tuple[List[Tuple[int, str, int]], int]:
+    """
+    slots（None なら全スロット）のうちお気に入り以外を取り出し、合計価値を入金する。
+    ([(slot, name, value)], 新残高) を返す。売れるものが無ければ ([], 0)
+    """
+    rows = await _take_slots(db, uid, slots)
+    if not rows:
+        return [], 0
+    sold = [(slot, catalog.decode(cid, mid), catalog.value(cid, mid)) for slot, cid, mid in rows]
+    total = sum(v for _, _, v in sold)
+    # 入金とベース合計価値の減算を同じ1文で（スロットがあった以上 users 行はある）
+    r = await _fetchone(
+        db,
+        "UPDATE users SET credits = credits + ?, base_value_total = base_value_total - ? "
+        "WHERE user_id=? RETURNING credits",
+        (total, total, uid)
+    )
+    return sold, int(r[0]) if r else 0
+
+async def _load_base(db:aiosqlite.Connection, uid:int) -> Tuple[Tuple[int, Optional[str]], ...]:
+    return tuple(await _list_base(db, uid))
 
 async def list_base(uid:int) -> List[Tuple[int, Optional[str]]]:
-    await ensure_base(uid)
-    async with aiosqlite.connect(DB_PATH) as db:
-        cur=await db.execute("SELECT slot,name FROM base_slots WHERE user_id=? ORDER BY slot ASC", (uid,))
-        return await cur.fetchall()
+    return list(await _read_through(uid, "base", _load_base))
 
 async def free_slots(uid:int) -> List[int]:
-    rows = await list_base(uid)
-    return [slot for slot, name in rows if name is None]
+    return [slot for slot, name in await list_base(uid) if name is None]
+
+async def place_many(uid:int, names:List[str]) -> Tuple[List[Tuple[str, int]], List[str]]:
+    async with writer() as db:
+        r = await _place_many(db, uid, names)
+    invalidate_user(uid, "base")
+    return r
 
 async def place_in_first_free(uid:int, name:str) -> Optional[int]:
-    frees = await free_slots(uid)
-    if not frees: return None
-    slot = min(frees)
-    async with aiosqlite.connect(DB_PATH) as db:
-        await db.execute("UPDATE base_slots SET name=? WHERE user_id=? AND slot=?", (name, uid, slot))
-        await db.commit()
-    return slot
+    placed, _ = await place_many(uid, [name])
+    return placed[0][1] if placed else None
 
 async def set_slot_value(uid:int, slot:int, name:Optional[str]):
-    async with aiosqlite.connect(DB_PATH) as db:
-        await db.execute("UPDATE base_slots SET name=? WHERE user_id=? AND slot=?", (name, uid, slot))
-        await db.commit()
+    async with writer() as db:
+        await _set_slot_value(db, uid, slot, name)
+    invalidate_user(uid, "base")
 
 async def get_slot_name(uid:int, slot:int) -> Optional[str]:
-    async with aiosqlite.connect(DB_PATH) as db:
-        cur=await db.execute("SELECT name FROM base_slots WHERE user_id=? AND slot=?", (uid, slot))
-        row=await cur.fetchone()
-        return None if not row else row[0]
+    return dict(await list_base(uid)).get(slot)
 
 async def remove_from_slot(uid:int, slot:int) -> Optional[str]:
-    name = await get_slot_name(uid, slot)
-    if name is None: return None
-    await set_slot_value(uid, slot, None)
+    async with writer() as db:
+        name = await _remove_from_slot(db, uid, slot)
+    invalidate_user(uid, "base")
     return name
 
+async def sell_slots(uid:int, slots:Optional[List[int]]=None) -> Tuple[List[Tuple[int, str, int]], int]:
+    """お気に入り以外を売却して ([(slot, name, value)], 新残高)。slots=None で全スロット"""
+    async with writer() as db:
+        sold, credits = await _sell_slots(db, uid, slots)
+    if sold:
+        invalidate_user(uid, "base")
+        _patch_row(uid, credits=credits)
+    return sold, credits
+
+# vault（保管庫：ベースの外に無制限。同じ装飾名は (char_id, mut_id) ごとに1行で count を持つ）
+VAULT_PAGE_SIZE = 15
+
+async def _vault_put(db:aiosqlite.Connection, uid:int, counts:Dict[Tuple[int, int], int]):
+    await db.executemany(
+        "INSERT INTO vault(user_id, char_id, mut_id, count) VALUES(?, ?, ?, ?) "
+        "ON CONFLICT(user_id, char_id, mut_id) DO UPDATE SET count = count + excluded.count",
+        [(uid, cid, mid, c) for (cid, mid), c in counts.items()]
+    )
+
+async def _vault_add(db:aiosqlite.Connection, uid:int, names:List[str]):
+    counts: Dict[Tuple[int, int], int] = {}
+    for n in names:
+        key = await _encode(db, n)
+        counts[key] = counts.get(key, 0) + 1
+    await _vault_put(db, uid, counts)
+
+async def _vault_store(db:aiosqlite.Connection, uid:int, slots:Optional[List[int]]=None) -> List[Tuple[int, str]]:
+    """ベースの slots（None で全部。お気に入りは除く）を保管庫へ移す。[(slot, name)] を返す"""
+    rows = await _take_slots(db, uid, slots)
+    if not rows:
+        return []
+    counts: Dict[Tuple[int, int], int] = {}
+    for _, cid, mid in rows:
+        counts[(cid, mid)] = counts.get((cid, mid), 0) + 1
+    await _vault_put(db, uid, counts)
+    await _add_base_value(db, uid, -sum(catalog.value(cid, mid) for _, cid, mid in rows))
+    return [(slot, catalog.decode(cid, mid)) for slot, cid, mid in rows]
+
+async def _vault_take(db:aiosqlite.Connection, uid:int, name:str, n:int) -> List[Tuple[str, int]]:
+    """保管庫の name を最大 n 体ベースの空きへ移す。[(name, slot)] を返す"""
+    enc = catalog.encode(name)
+    if enc is None or n <= 0:
+        return []
+    slots = await _free_slots(db, uid, n)
+    if not slots:
+        return []
+    r = await _fetchone(db, "SELECT count FROM vault WHERE user_id=? AND char_id=? AND mut_id=?", (uid, *enc))
+    if r is None:
+        return []
+    moved = min(r[0], len(slots))
+    if moved == r[0]:
+        await db.execute("DELETE FROM vault WHERE user_id=? AND char_id=? AND mut_id=?", (uid, *enc))
+    else:
+        await db.execute("UPDATE vault SET count = count - ? WHERE user_id=? AND char_id=? AND mut_id=?", (moved, uid, *enc))
+    placed, _ = await _place_many(db, uid, [name] * moved)
+    return placed
+
+async def _vault_page(db:aiosqlite.Connection, uid:int, after:Optional[Tuple[int, int]]=None,
+                      limit:int=VAULT_PAGE_SIZE) -> List[Tuple[int, int, int]]:
+    """(char_id, mut_id) 順のキーセットページ。after より後ろを limit 件 [(char_id, mut_id, count)]"""
+    if after is None:
+        return await db.execute_fetchall(
+            "SELECT char_id, mut_id, count FROM vault WHERE user_id=? ORDER BY char_id, mut_id LIMIT ?",
+            (uid, limit)
+        )
+    return await db.execute_fetchall(
+        "SELECT char_id, mut_id, count FROM vault WHERE user_id=? AND (char_id, mut_id) > (?, ?) "
+        "ORDER BY char_id, mut_id LIMIT ?",
+        (uid, *after, limit)
+    )
+
+async def _vault_page_before(db:aiosqlite.Connection, uid:int, before:Tuple[int, int],
+                             limit:int=VAULT_PAGE_SIZE) -> List[Tuple[int, int, int]]:
+    rows = await db.execute_fetchall(
+        "SELECT char_id, mut_id, count FROM vault WHERE user_id=? AND (char_id, mut_id) < (?, ?) "
+        "ORDER BY char_id DESC, mut_id DESC LIMIT ?",
+        (uid, *before, limit)
+    )
+    return rows[::-1]
+
+async def _vault_stats(db:aiosqlite.Connection, uid:int) -> Tuple[int, int, int]:
+    """(種類数, 体数, 合計価値)"""
+    rows = await db.execute_fetchall("SELECT char_id, mut_id, count FROM vault WHERE user_id=?", (uid,))
+    return len(rows), sum(c for _, _, c in rows), sum(catalog.value(cid, mid) * c for cid, mid, c in rows)
+
+async def _load_vault_names(db:aiosqlite.Connection, uid:int) -> Tuple[str, ...]:
+    rows = await db.execute_fetchall("SELECT char_id, mut_id FROM vault WHERE user_id=? ORDER BY char_id, mut_id", (uid,))
+    return tuple(catalog.decode(cid, mid) for cid, mid in rows)
+
+async def vault_names(uid:int) -> List[str]:
+    """保管庫にある装飾名（autocomplete 用、キャッシュ）"""
+    return list(await _read_through(uid, "vault", _load_vault_names))
+
+async def vault_page(uid:int, *, after:Optional[Tuple[int, int]]=None, before:Optional[Tuple[int, int]]=None,
+                     limit:int=VAULT_PAGE_SIZE) -> List[Tuple[int, int, int]]:
+    async with reader() as db:
+        if before is not None:
+            return await _vault_page_before(db, uid, before, limit)
+        return await _vault_page(db, uid, after, limit)
+
+async def vault_page_start(uid:int, page:int, size:int=VAULT_PAGE_SIZE) -> Optional[Tuple[int, int]]:
+    """page（1始まり）の直前のキー。1ページ目は None（page は呼び出し側で総ページ数に収めておく）"""
+    if page <= 1:
+        return None
+    async with reader() as db:
+        # 主キー索引だけを読む（WITHOUT ROWID なので本体を引かない）
+        r = await _fetchone(
+            db,
+            "SELECT char_id, mut_id FROM vault WHERE user_id=? ORDER BY char_id, mut_id LIMIT 1 OFFSET ?",
+            (uid, (page - 1) * size - 1)
+        )
+    return None if r is None else (r[0], r[1])
+
+async def vault_stats(uid:int) -> Tuple[int, int, int]:
+    async with reader() as db:
+        return await _vault_stats(db, uid)
+
+async def vault_store(uid:int, slots:Optional[List[int]]=None) -> List[Tuple[int, str]]:
+    async with writer() as db:
+        moved = await _vault_store(db, uid, slots)
+    if moved:
+        invalidate_user(uid, "base", "vault")
+    return moved
+
+async def vault_take(uid:int, name:str, n:int) -> List[Tuple[str, int]]:
+    async with writer() as db:
+        placed = await _vault_take(db, uid, name, n)
+    if placed:
+        invalidate_user(uid, "base", "vault")
+    return placed
+
+# favorites
+async def _get_favorites(db:aiosqlite.Connection, uid:int) -> List[int]:
+    rows = await db.execute_fetchall("SELECT slot FROM favorites WHERE user_id=?", (uid,))
+    return [r[0] for r in rows]
+
+async def _load_favorites(db:aiosqlite.Connection, uid:int) -> Tuple[int, ...]:
+    return tuple(await _get_favorites(db, uid))
+
+async def _remove_favorite(db:aiosqlite.Connection, uid:int, slot:int):
+    await db.execute("DELETE FROM favorites WHERE user_id=? AND slot=?", (uid, slot))
+
+async def get_favorites(uid:int) -> List[int]:
+    return list(await _read_through(uid, "favorites", _load_favorites))
+
+async def add_favorite(uid:int, slot:int):
+    async with writer() as db:
+        await db.execute("INSERT OR IGNORE INTO favorites(user_id, slot) VALUES(?, ?)", (uid, slot))
+    invalidate_user(uid, "favorites")
+
+async def remove_favorite(uid:int, slot:int):
+    async with writer() as db:
+        await _remove_favorite(db, uid, slot)
+    invalidate_user(uid, "favorites")
+
+async def clear_favorites(uid:int):
+    async with writer() as db:
+        await db.execute("DELETE FROM favorites WHERE user_id=?", (uid,))
+    invalidate_user(uid, "favorites")
+
+# autosell（ルールは autosell.Rule、ユーザーごとに autosell.Matcher へまとめてキャッシュ）
+_RULE_COLS = "rule_id, char_id, tier, mut_mask, max_value"
+
+async def _load_autosell(db:aiosqlite.Connection, uid:int) -> autosell.Matcher:
+    rows = await db.execute_fetchall(f"SELECT {_RULE_COLS} FROM autosell_rules WHERE user_id=? ORDER BY rule_id", (uid,))
+    return autosell.Matcher(autosell.Rule(*r) for r in rows)
+
+async def get_autosell_matcher(uid:int) -> autosell.Matcher:
+    return await _read_through(uid, "autosell", _load_autosell)
+
+async def get_autosell_list(uid:int) -> List[str]:
+    """/autosell で登録したキャラ名の一覧"""
+    return (await get_autosell_matcher(uid)).char_names()
+
+async def add_autosell(uid:int, name:str):
+    # /autosell（キャラ選択）からの登録。旧仕様どおりミューテーションなしだけを売る
+    cid = catalog.CHAR_ID.get(name)
+    if cid is None:
+        return
+    async with writer() as db:
+        await db.execute(
+            "INSERT INTO autosell_rules(user_id, char_id, mut_mask) SELECT ?, ?, ? "
+            "WHERE NOT EXISTS (SELECT 1 FROM autosell_rules "
+            "WHERE user_id=? AND char_id=? AND tier IS NULL AND mut_mask=? AND max_value IS NULL)",
+            (uid, cid, autosell.MUT_NONE_ONLY, uid, cid, autosell.MUT_NONE_ONLY)
+        )
+    invalidate_user(uid, "autosell")
+
+async def remove_autosell(uid:int, name:str):
+    # /autosell で作った形のルールだけを消す（/autosell_rule の条件つきルールは残す）
+    cid = catalog.CHAR_ID.get(name)
+    if cid is None:
+        return
+    async with writer() as db:
+        await db.execute(
+            "DELETE FROM autosell_rules WHERE user_id=? AND char_id=? AND tier IS NULL AND mut_mask=? AND max_value IS NULL",
+            (uid, cid, autosell.MUT_NONE_ONLY)
+        )
+    invalidate_user(uid, "autosell")
+
+async def clear_autosell(uid:int):
+    async with writer() as db:
+        await db.execute("DELETE FROM autosell_rules WHERE user_id=?", (uid,))
+    invalidate_user(uid, "autosell")
+
+async def add_autosell_rule(uid:int, *, char_id:Optional[int]=None, tier:Optional[str]=None,
+                            mut_mask:int=autosell.MUT_NONE_ONLY, max_value:Optional[int]=None) -> int:
+    """条件つきルールを追加して rule_id を返す"""
+    async with writer() as db:
+        r = await _fetchone(
+            db,
+            "INSERT INTO autosell_rules(user_id, char_id, tier, mut_mask, max_value) VALUES(?,?,?,?,?) RETURNING rule_id",
+            (uid, char_id, tier, mut_mask, max_value)
+        )
+    invalidate_user(uid, "autosell")
+    return int(r[0])
+
+async def remove_autosell_rule(uid:int, rule_id:int) -> bool:
+    async with writer() as db:
+        cur = await db.execute("DELETE FROM autosell_rules WHERE user_id=? AND rule_id=?", (uid, rule_id))
+        removed = cur.rowcount > 0
+    invalidate_user(uid, "autosell")
+    return removed
+
 async def place_bulk(uid:int, pulls:Dict[str,int]):
+    names = [n for n, c in pulls.items() for _ in range(c)]
+    placed_list, overflow_list = await place_many(uid, names)
     placed, overflow = {}, {}
-    for n, c in pulls.items():
-        for _ in range(c):
-            s = await place_in_first_free(uid, n)
-            if s is None:
-                overflow[n] = overflow.get(n, 0) + 1
-            else:
-                placed[n] = placed.get(n, 0) + 1
+    for n, _ in placed_list:
+        placed[n] = placed.get(n, 0) + 1
+    for n in overflow_list:
+        overflow[n] = overflow.get(n, 0) + 1
     return placed, overflow
 
-# leaderboards
+# ===== トランザクション（複数ステップの経済操作） =====
+class EconomyTx:
+    """economy_tx() 内で使う操作セット。コミットは with を抜けたときに1回だけ"""
+    def __init__(self, db:aiosqlite.Connection):
+        self.db = db
+        # 触ったユーザー（抜けるときにキャッシュを無効化する）
+        self.touched: set = set()
+
+    async def get_user_row(self, uid:int):
+        self.touched.add(uid)
+        return await _get_user_row(self.db, uid)
+
+    async def update_user(self, uid:int, *, credits=None, last_open=None, last_daily=None):
+        self.touched.add(uid)
+        await _update_user(self.db, uid, credits=credits, last_open=last_open, last_daily=last_daily)
+
+    async def adjust_credits(self, uid:int, delta:int, *, min_balance:int=0) -> Optional[int]:
+        self.touched.add(uid)
+        return await _adjust_credits(self.db, uid, delta, min_balance)
+
+    async def transfer_credits(self, src:int, dst:int, amount:int) -> Optional[Tuple[int, int]]:
+        self.touched.update((src, dst))
+        return await _transfer_credits(self.db, src, dst, amount)
+
+    async def get_daily_count(self, uid:int) -> int:
+        return await _get_daily_count(self.db, uid)
+
+    async def increment_daily_count(self, uid:int) -> int:
+        self.touched.add(uid)
+        return await _increment_daily_count(self.db, uid)
+
+    async def list_base(self, uid:int) -> List[Tuple[int, Optional[str]]]:
+        return await _list_base(self.db, uid)
+
+    async def free_slots(self, uid:int) -> List[int]:
+        return await _free_slots(self.db, uid)
+
+    async def place_many(self, uid:int, names:List[str]) -> Tuple[List[Tuple[str, int]], List[str]]:
+        self.touched.add(uid)
+        return await _place_many(self.db, uid, names)
+
+    async def get_slot_name(self, uid:int, slot:int) -> Optional[str]:
+        return await _get_slot_name(self.db, uid, slot)
+
+    async def set_slot_value(self, uid:int, slot:int, name:Optional[str]):
+        self.touched.add(uid)
+        await _set_slot_value(self.db, uid, slot, name)
+
+    async def remove_from_slot(self, uid:int, slot:int) -> Optional[str]:
+        self.touched.add(uid)
+        return await _remove_from_slot(self.db, uid, slot)
+
+    async def sell_slots(self, uid:int, slots:Optional[List[int]]=None) -> Tuple[List[Tuple[int, str, int]], int]:
+        self.touched.add(uid)
+        return await _sell_slots(self.db, uid, slots)
+
+    async def vault_add(self, uid:int, names:List[str]):
+        self.touched.add(uid)
+        await _vault_add(self.db, uid, names)
+
+    async def vault_store(self, uid:int, slots:Optional[List[int]]=None) -> List[Tuple[int, str]]:
+        self.touched.add(uid)
+        return await _vault_store(self.db, uid, slots)
+
+    async def vault_take(self, uid:int, name:str, n:int) -> List[Tuple[str, int]]:
+        self.touched.add(uid)
+        return await _vault_take(self.db, uid, name, n)
+
+    async def get_favorites(self, uid:int) -> List[int]:
+        return await _get_favorites(self.db, uid)
+
+    async def remove_favorite(self, uid:int, slot:int):
+        self.touched.add(uid)
+        await _remove_favorite(self.db, uid, slot)
+
+@asynccontextmanager
+async def economy_tx():
+    """
+    1コマンド分の読み書きを1つのまとまり（書き込みアクター内の SAVEPOINT）で行う。
+    例外で抜けた場合はすべてロールバックされ、正常に抜けたらコミット完了まで待つ。
+    ※ with の中で Discord への応答など時間のかかる処理をしないこと（他の書き込みを塞ぐため）
+    """
+    tx = None
+    try:
+        async with writer() as db:
+            tx = EconomyTx(db)
+            yield tx
+    finally:
+        if tx is not None:
+            for uid in tx.touched:
+                invalidate_user(uid)
+
+# rate limits（ratelimit.py の状態。LAST_OPEN_COMMAND だけは users.last_open に整数秒で持つ）
+LAST_OPEN_COMMAND = "luckyblock"
+
+async def load_rate_limits(now:float) -> List[Tuple[int, str, float]]:
+    """まだ回復しきっていない [(user_id, command, tat)]"""
+    async with reader() as db:
+        rows = await db.execute_fetchall("SELECT user_id, command, tat FROM rate_limits WHERE tat > ?", (now,))
+        opens = await db.execute_fetchall("SELECT user_id, last_open FROM users WHERE last_open > ?", (now,))
+    return list(rows) + [(uid, LAST_OPEN_COMMAND, float(t)) for uid, t in opens]
+
+async def save_rate_limits(rows:List[Tuple[int, str, float]], purge_before:Optional[float]=None):
+    """rows を書き込む。purge_before を渡すと tat がそれ以前の（回復しきった）行も消す"""
+    if not rows and purge_before is None:
+        return
+    opens = [(uid, math.ceil(tat)) for uid, cmd, tat in rows if cmd == LAST_OPEN_COMMAND]
+    others = [(uid, cmd, tat) for uid, cmd, tat in rows if cmd != LAST_OPEN_COMMAND]
+    async with writer() as db:
+        await db.executemany(
+            "INSERT INTO users(user_id,last_open) VALUES(?,?) "
+            "ON CONFLICT(user_id) DO UPDATE SET last_open=excluded.last_open",
+            opens
+        )
+        await db.executemany(
+            "INSERT INTO rate_limits(user_id, command, tat) VALUES(?,?,?) "
+            "ON CONFLICT(user_id, command) DO UPDATE SET tat=excluded.tat",
+            others
+        )
+        if purge_before is not None:
+            await db.execute("DELETE FROM rate_limits WHERE tat <= ?", (purge_before,))
+    for uid, t in opens:
+        _patch_row(uid, last_open=t)
+
+# leaderboards（(値, user_id) の降順。索引 idx_users_*_rank をキーセットで前後に辿る）
+# 種類 → (列, 対象条件)
+BOARDS = {
+    "base": ("base_value_total", "base_value_total > 0"),
+    "cats": ("credits", "1"),
+}
+
+async def board_page(kind:str, *, after:Optional[Tuple[int, int]]=None, before:Optional[Tuple[int, int]]=None,
+                     limit:int=10) -> List[Tuple[int, int]]:
+    """
+    [(user_id, 値)] を上位から limit 件。after=(値, user_id) ならその次から、before ならその直前の limit 件。
+    """
+    col, cond = BOARDS[kind]
+    async with reader() as db:
+        if before is not None:
+            rows = await db.execute_fetchall(
+                f"SELECT user_id, {col} FROM users WHERE {cond} AND ({col}, user_id) > (?, ?) "
+                f"ORDER BY {col}, user_id LIMIT ?", (*before, limit)
+            )
+            return rows[::-1]
+        if after is not None:
+            return await db.execute_fetchall(
+                f"SELECT user_id, {col} FROM users WHERE {cond} AND ({col}, user_id) < (?, ?) "
+                f"ORDER BY {col} DESC, user_id DESC LIMIT ?", (*after, limit)
+            )
+        return await db.execute_fetchall(
+            f"SELECT user_id, {col} FROM users WHERE {cond} ORDER BY {col} DESC, user_id DESC LIMIT ?", (limit,)
+        )
+
+async def board_rank(kind:str, uid:int) -> Optional[Tuple[int, int]]:
+    """(順位, 値)。ランキング対象外なら None。順位は自分より上の件数を索引だけで数える"""
+    col, cond = BOARDS[kind]
+    async with reader() as db:
+        r = await _fetchone(db, f"SELECT {col} FROM users WHERE user_id=? AND {cond}", (uid,))
+        if r is None:
+            return None
+        above = await _fetchone(db, f"SELECT COUNT(*) FROM users WHERE ({col}, user_id) > (?, ?)", (r[0], uid))
+    return above[0] + 1, r[0]
+
 async def top_base_values(limit:int=10):
-    from utils import base_value
-    res=[]
-    async with aiosqlite.connect(DB_PATH) as db:
-        cur=await db.execute("SELECT DISTINCT user_id FROM base_slots")
-        users=[r[0] for r in await cur.fetchall()]
-    for uid in users:
-        rows = await list_base(uid)
-        s = sum(base_value(name) for _, name in rows if name)
-        res.append((uid, s))
-    res.sort(key=lambda x: x[1], reverse=True)
-    return res[:limit]
+    return await board_page("base", limit=limit)
 
 async def top_credits(limit:int=10):
-    async with aiosqlite.connect(DB_PATH) as db:
-        cur=await db.execute("SELECT user_id, credits FROM users ORDER BY credits DESC LIMIT ?", (limit,))
-        return await cur.fetchall()
+    return await board_page("cats", limit=limit)
@@ -0,0 +1,96 @@
+# locks.py
+# ユーザー単位の asyncio ロック。
+# 同じユーザーの経済操作（/luckyblock・/sell・/give・/trade・対戦など）を1本ずつに並べる。別ユーザー同士は並行のまま。
+#   async with user_locks.hold(uid):             # 1人
+#   async with user_locks.hold(uid, other_id):   # 2人（常に user_id の昇順で取るのでデッドロックしない）
+# ロックは WeakValueDictionary に置き、誰も持っていない・待っていないものは自動で消える（ユーザー数ぶん溜まらない）。
+# 同じタスク内でのネストは取り直さずに通す（再入可）。ただし外側より小さいキーを内側で新しく取るのは避けること。
+# ※ economy_tx()/writer() の外側で取ること（内側で待つと書き込みアクターを塞ぐ）。
+import asyncio
+import time
+import weakref
+from contextlib import asynccontextmanager
+from typing import Hashable, NamedTuple, Optional
+
+SLOW_WAIT_SECONDS = 1.0  # これ以上待ったらログに出す
+
+class _Entry:
+    __slots__ = ("lock", "owner", "depth", "__weakref__")
+
+    def __init__(self):
+        self.lock = asyncio.Lock()
+        self.owner: Optional[asyncio.Task] = None
+        self.depth = 0
+
+class LockStats(NamedTuple):
+    acquired: int      # 取得回数（再入は数えない）
+    contended: int     # うち待たされた回数
+    wait_total: float  # 待ち時間の合計（秒）
+    wait_max: float    # 最長の待ち時間（秒）
+    live: int          # いま存在するロック数（保持中・待ち中のもの）
+
+    @property
+    def contention(self) -> float:
+        return self.contended / self.acquired if self.acquired else 0.0
+
+class KeyedLocks:
+    """キーごとの asyncio.Lock の集まり"""
+    def __init__(self, name: str):
+        self.name = name
+        self._locks: "weakref.WeakValueDictionary[Hashable, _Entry]" = weakref.WeakValueDictionary()
+        self._acquired = 0
+        self._contended = 0
+        self._wait_total = 0.0
+        self._wait_max = 0.0
+
+    def _entry(self, key: Hashable) -> _Entry:
+        e = self._locks.get(key)
+        if e is None:
+            e = self._locks[key] = _Entry()
+        return e
+
+    async def _acquire(self, key: Hashable, e: _Entry, task: asyncio.Task):
+        if e.lock.locked():
+            t = time.perf_counter()
+            await e.lock.acquire()
+            waited = time.perf_counter() - t
+            self._contended += 1
+            self._wait_total += waited
+            self._wait_max = max(self._wait_max, waited)
+            if waited >= SLOW_WAIT_SECONDS:
+                print(f"[locks] {self.name}:{key} waited {waited:.2f}s")
+        else:
+            await e.lock.acquire()
+        self._acquired += 1
+        e.owner, e.depth = task, 1
+
+    @asynccontextmanager
+    async def hold(self, *keys: Hashable):
+        """keys をすべて取る（重複は1回、順序はソート順）。抜けると逆順で放す"""
+        task = asyncio.current_task()
+        held = []
+        try:
+            for key in sorted(set(keys)):
+                e = self._entry(key)
+                if e.owner is task:
+                    e.depth += 1
+                else:
+                    await self._acquire(key, e, task)
+                held.append(e)
+            yield
+        finally:
+            for e in reversed(held):
+                e.depth -= 1
+                if e.depth == 0:
+                    e.owner = None
+                    e.lock.release()
+
+    def locked(self, key: Hashable) -> bool:
+        e = self._locks.get(key)
+        return e is not None and e.lock.locked()
+
+    def stats(self) -> LockStats:
+        return LockStats(self._acquired, self._contended, self._wait_total, self._wait_max, len(self._locks))
+
+# 経済操作用（キーは user_id）
+user_locks = KeyedLocks("user")
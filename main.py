@@ -1,12 +1,16 @@
 # main.py (Render用)
+import math
 import os
+import traceback
 from dotenv import load_dotenv
 import discord
 from discord.ext import commands
 from discord import app_commands
 
-from db import init_db
+from db import init_db, close_db
 from constants import GUILD_ID
+from utils import fmt_remain
+import ratelimit
 
 # Render用 keep-alive
 from keep_alive import keep_alive
@@ -21,16 +25,42 @@ INTENTS = discord.Intents.default()
 INTENTS.message_content = True
 INTENTS.members = True
 
-bot = commands.Bot(command_prefix="!", intents=INTENTS)
+class KitsuneBot(commands.Bot):
+    async def close(self):
+        try:
+            await super().close()
+        finally:
+            # レート制限の状態を書き出してから共有DB接続を閉じる
+            try:
+                await ratelimit.stop()
+            finally:
+                await close_db()
+
+bot = KitsuneBot(command_prefix="!", intents=INTENTS)
 
 def guild_decorator():
     return app_commands.guilds(discord.Object(id=int(GUILD_ID))) if GUILD_ID else (lambda f: f)
 
+@bot.tree.error
+async def on_app_command_error(interaction: discord.Interaction, error: app_commands.AppCommandError):
+    if isinstance(error, ratelimit.RateLimited):
+        msg = f"⏳ 少し間をあけてください。あと **{fmt_remain(math.ceil(error.retry_after))}** で使えます。"
+        if interaction.response.is_done():
+            await interaction.followup.send(msg, ephemeral=True)
+        else:
+            await interaction.response.send_message(msg, ephemeral=True)
+        return
+    name = interaction.command.qualified_name if interaction.command else "?"
+    print(f"[app_command] /{name} failed: {error!r}")
+    traceback.print_exception(type(error), error, error.__traceback__)
+
 @bot.event
 async def on_ready():
     await init_db()
+    await ratelimit.start()
 
     await bot.load_extension("cogs.base")
+    await bot.load_extension("cogs.vault")
     await bot.load_extension("cogs.luckyblock")
     await bot.load_extension("cogs.daily")
     await bot.load_extension("cogs.math")
@@ -0,0 +1,170 @@
+# migrations.py
+# スキーマ（DDL）はすべてここで管理する。
+# 適用済みのバージョンは PRAGMA user_version に記録し、起動時（db.init_db）に未適用分だけ順に流す。
+# 変更を加えるときは MIGRATIONS の末尾に関数を足すこと（適用済みの関数は書き換えない）。
+# ※ user_version=0 のまま旧コードで作られたDBもあるため、各関数は「既に適用済みの形」でも壊れないように書く。
+import aiosqlite
+from typing import List, Callable, Awaitable
+
+async def _columns(db: aiosqlite.Connection, table: str) -> List[str]:
+    return [r[1] for r in await db.execute_fetchall(f"PRAGMA table_info({table})")]
+
+# v1: 初期スキーマ（ベーススロットは装飾名を name TEXT に保存、空きは NULL 行）
+async def _v1_initial(db: aiosqlite.Connection):
+    await db.execute("""CREATE TABLE IF NOT EXISTS users (
+ user_id INTEGER PRIMARY KEY,
+ credits INTEGER NOT NULL DEFAULT 0,
+ last_open INTEGER NOT NULL DEFAULT 0,
+ last_daily INTEGER NOT NULL DEFAULT 0
+)""")
+    await db.execute("""CREATE TABLE IF NOT EXISTS base_slots (
+ user_id INTEGER NOT NULL,
+ slot INTEGER NOT NULL,
+ name TEXT, -- NULL=空
+ PRIMARY KEY (user_id, slot)
+)""")
+    await db.execute("""CREATE TABLE IF NOT EXISTS mutation_index (
+ name TEXT PRIMARY KEY,
+ idx INTEGER NOT NULL
+)""")
+    # /daily の受取回数カウンタを持つ
+    await db.execute("""CREATE TABLE IF NOT EXISTS user_meta (
+ user_id INTEGER PRIMARY KEY,
+ daily_count INTEGER NOT NULL DEFAULT 0
+)""")
+    # お気に入りスロット（/sell, /sell_all の対象外）
+    await db.execute("""CREATE TABLE IF NOT EXISTS favorites (
+ user_id INTEGER NOT NULL,
+ slot    INTEGER NOT NULL,
+ PRIMARY KEY(user_id, slot)
+)""")
+    await db.execute("CREATE TABLE IF NOT EXISTS autosell (user_id INTEGER, name TEXT, PRIMARY KEY(user_id, name))")
+
+# v2: 空きスロットの NULL 行を持たない（埋まっているスロットだけ保存）
+async def _v2_lazy_base_slots(db: aiosqlite.Connection):
+    if "name" in await _columns(db, "base_slots"):
+        await db.execute("DELETE FROM base_slots WHERE name IS NULL")
+
+# v3: キャラ/ミューテーションを catalog の整数IDで保存
+async def _v3_catalog_ids(db: aiosqlite.Connection):
+    from db import _sync_catalog, _encode, _catalog_id
+    # キャラ名 ⇔ char_id（ミューテーション側は mutation_index）
+    await db.execute("""CREATE TABLE IF NOT EXISTS catalog (
+ char_id INTEGER PRIMARY KEY,
+ name TEXT NOT NULL UNIQUE
+)""")
+    await _sync_catalog(db)
+
+    if "name" in await _columns(db, "base_slots"):
+        rows = await db.execute_fetchall("SELECT user_id, slot, name FROM base_slots WHERE name IS NOT NULL")
+        await db.execute("DROP TABLE base_slots")
+        # 埋まっているスロットだけ保存（行が無い=空）
+        await db.execute("""CREATE TABLE base_slots (
+ user_id INTEGER NOT NULL,
+ slot INTEGER NOT NULL,
+ char_id INTEGER NOT NULL,
+ mut_id INTEGER NOT NULL DEFAULT 0, -- 0=ミューテーションなし
+ PRIMARY KEY (user_id, slot)
+)""")
+        await db.executemany(
+            "INSERT INTO base_slots(user_id, slot, char_id, mut_id) VALUES(?,?,?,?)",
+            [(uid, slot, *(await _encode(db, name))) for uid, slot, name in rows]
+        )
+
+    if "name" in await _columns(db, "autosell"):
+        rows = await db.execute_fetchall("SELECT user_id, name FROM autosell WHERE name IS NOT NULL")
+        await db.execute("DROP TABLE autosell")
+        await db.execute("""CREATE TABLE autosell (
+ user_id INTEGER NOT NULL,
+ char_id INTEGER NOT NULL,
+ PRIMARY KEY(user_id, char_id)
+)""")
+        await db.executemany(
+            "INSERT OR IGNORE INTO autosell(user_id, char_id) VALUES(?,?)",
+            [(uid, await _catalog_id(db, name)) for uid, name in rows]
+        )
+
+# v4: ベース合計価値を users に持つ（リーダーボード用）
+async def _v4_base_value_total(db: aiosqlite.Connection):
+    from db import _sync_catalog, _rebuild_base_value_totals
+    if "base_value_total" not in await _columns(db, "users"):
+        await db.execute("ALTER TABLE users ADD COLUMN base_value_total INTEGER NOT NULL DEFAULT 0")
+    await _sync_catalog(db)
+    await _rebuild_base_value_totals(db)
+
+# v5: ホットなクエリ用の索引
+async def _v5_indexes(db: aiosqlite.Connection):
+    # /leaderboard_base（top_base_values）
+    await db.execute("CREATE INDEX IF NOT EXISTS idx_users_base_value ON users(base_value_total DESC)")
+    # /leaderboard_cats（top_credits）
+    await db.execute("CREATE INDEX IF NOT EXISTS idx_users_credits ON users(credits DESC)")
+
+# v6: 自動売却をキャラ名の一覧から条件つきルールへ（autosell.py）
+async def _v6_autosell_rules(db: aiosqlite.Connection):
+    await db.execute("""CREATE TABLE IF NOT EXISTS autosell_rules (
+ rule_id INTEGER PRIMARY KEY,
+ user_id INTEGER NOT NULL,
+ char_id INTEGER,                      -- NULL=全キャラ
+ tier TEXT,                            -- NULL=全ティア
+ mut_mask INTEGER NOT NULL DEFAULT 1,  -- 対象 mut_id のビット（1=ミューテーションなしのみ）
+ max_value INTEGER                     -- NULL=上限なし（価値がこれ未満なら売る）
+)""")
+    await db.execute("CREATE INDEX IF NOT EXISTS idx_autosell_rules_user ON autosell_rules(user_id)")
+    tables = [r[0] for r in await db.execute_fetchall("SELECT name FROM sqlite_master WHERE type='table'")]
+    if "autosell" in tables:
+        # 旧仕様は装飾名との完全一致だったので「ミューテーションなしのみ」で移す（挙動を変えない）
+        await db.execute(
+            "INSERT INTO autosell_rules(user_id, char_id, mut_mask) "
+            "SELECT user_id, char_id, 1 FROM autosell ORDER BY user_id, char_id"
+        )
+        await db.execute("DROP TABLE autosell")
+
+# v7: 保管庫（ベースの外。同じ装飾名は1行にまとめて count で持つ）
+async def _v7_vault(db: aiosqlite.Connection):
+    await db.execute("""CREATE TABLE IF NOT EXISTS vault (
+ user_id INTEGER NOT NULL,
+ char_id INTEGER NOT NULL,
+ mut_id  INTEGER NOT NULL,
+ count   INTEGER NOT NULL CHECK(count > 0),
+ PRIMARY KEY(user_id, char_id, mut_id)
+) WITHOUT ROWID""")
+
+# v8: ランキングのキーセット用に (値, user_id) の複合索引へ置き換え
+async def _v8_rank_indexes(db: aiosqlite.Connection):
+    await db.execute("CREATE INDEX IF NOT EXISTS idx_users_base_rank ON users(base_value_total, user_id)")
+    await db.execute("CREATE INDEX IF NOT EXISTS idx_users_credits_rank ON users(credits, user_id)")
+    await db.execute("DROP INDEX IF EXISTS idx_users_base_value")
+    await db.execute("DROP INDEX IF EXISTS idx_users_credits")
+
+# v9: レート制限（ratelimit.py）の状態。/luckyblock の分は users.last_open に持つ
+async def _v9_rate_limits(db: aiosqlite.Connection):
+    await db.execute("""CREATE TABLE IF NOT EXISTS rate_limits (
+ user_id INTEGER NOT NULL,
+ command TEXT NOT NULL,
+ tat     REAL NOT NULL,  -- 次に1回ぶん回復しきる時刻（UNIX 秒）
+ PRIMARY KEY(user_id, command)
+) WITHOUT ROWID""")
+
+MIGRATIONS: List[Callable[[aiosqlite.Connection], Awaitable[None]]] = [
+    _v1_initial,
+    _v2_lazy_base_slots,
+    _v3_catalog_ids,
+    _v4_base_value_total,
+    _v5_indexes,
+    _v6_autosell_rules,
+    _v7_vault,
+    _v8_rank_indexes,
+    _v9_rate_limits,
+]
+
+async def migrate(db: aiosqlite.Connection) -> int:
+    """未適用のマイグレーションを順に流し、適用後のバージョンを返す（トランザクションは呼び出し側で張る）"""
+    rows = await db.execute_fetchall("PRAGMA user_version")
+    current = rows[0][0]
+    for version, step in enumerate(MIGRATIONS, start=1):
+        if version <= current:
+            continue
+        await step(db)
+        await db.execute(f"PRAGMA user_version={version}")
+        print(f"[db] migrated to v{version} ({step.__name__})")
+    return max(current, len(MIGRATIONS))
@@ -0,0 +1,79 @@
+# pull_engine.py
+# 大量開封用の抽選エンジン。
+# sampler のエイリアス表でキャラ番号・ミューテーション番号をまとめて生成し、
+# 価値は前計算した価値行列から引く（装飾名の文字列解析をしない）。
+# NumPy があればベクトル化して計算し、無ければ純 Python で同じ値を返す。
+import random
+from typing import Dict, List, Optional, Sequence, Tuple
+from constants import TIERS
+import catalog
+import sampler
+
+try:
+    import numpy as np
+except ImportError:  # NumPy は任意（requirements には入れない）
+    np = None
+
+# VALUE_MATRIX[tier][キャラ番号] = catalog.VALUES の行（[mut_id] で価値を引く）
+VALUE_MATRIX: Dict[str, List[List[int]]] = {
+    tier: [catalog.VALUES[catalog.CHAR_ID[n]] for n, _ in t["entries"]]
+    for tier, t in TIERS.items()
+}
+
+if np is not None:
+    _rng = np.random.default_rng()
+
+    def _np_table(table: sampler.AliasTable):
+        return np.asarray(table.prob, dtype=np.float64), np.asarray(table.alias, dtype=np.intp)
+
+    _NP_MUT = _np_table(sampler.MUTATION_TABLE)
+    _NP_TIERS = {tier: _np_table(t) for tier, t in sampler.TIER_TABLES.items()}
+    _NP_VALUES = {tier: np.asarray(m, dtype=np.int64) for tier, m in VALUE_MATRIX.items()}
+
+    def _np_gen(rng):
+        # random.Random が渡されたら、その系列から NumPy 側の系列を派生させる
+        return _rng if rng is None else np.random.default_rng(rng.getrandbits(64))
+
+    def _np_sample(gen, prob, alias, n: int):
+        u = gen.random(n) * len(prob)
+        i = u.astype(np.intp)
+        return np.where(u - i < prob[i], i, alias[i])
+
+def seed(s: Optional[int] = None):
+    """抽選の乱数を初期化する（シミュレータのワーカーなど、プロセスごとに別系列にしたいとき）"""
+    global _rng
+    random.seed(s)
+    if np is not None:
+        _rng = np.random.default_rng(s)
+
+# 以下の rng には random.Random（rng.for_interaction の系列）を渡せる。None ならモジュールの乱数
+def pull_indices(tier_name: str, n: int, rng=None) -> Tuple[Sequence[int], Sequence[int]]:
+    """n 回分の (キャラ番号の列, mut_id の列)。NumPy があれば ndarray"""
+    if np is not None:
+        gen = _np_gen(rng)
+        return _np_sample(gen, *_NP_TIERS[tier_name], n), _np_sample(gen, *_NP_MUT, n)
+    return sampler.TIER_TABLES[tier_name].sample_many(n, rng), sampler.MUTATION_TABLE.sample_many(n, rng)
+
+def pull_values(tier_name: str, n: int, rng=None) -> Sequence[int]:
+    """n 回分の価値だけを返す（名前が要らない集計用）"""
+    chars, muts = pull_indices(tier_name, n, rng)
+    if np is not None:
+        return _NP_VALUES[tier_name][chars, muts]
+    vm = VALUE_MATRIX[tier_name]
+    return [vm[c][m] for c, m in zip(chars, muts)]
+
+def round_totals(tier_name: str, rounds: int, count: int, rng=None) -> List[int]:
+    """count 連を rounds 回開けたときの、1回ごとの合計価値"""
+    values = pull_values(tier_name, rounds * count, rng)
+    if np is not None:
+        return values.reshape(rounds, count).sum(axis=1).tolist()
+    return [sum(values[i:i + count]) for i in range(0, rounds * count, count)]
+
+def open_many(tier_name: str, n: int, rng=None) -> List[Tuple[str, int]]:
+    """n 回開けた結果 [(装飾名, 価値), ...]"""
+    chars, muts = pull_indices(tier_name, n, rng)
+    if np is not None:
+        chars, muts = chars.tolist(), muts.tolist()
+    names = sampler._DECORATED[tier_name]
+    vm = VALUE_MATRIX[tier_name]
+    return [(names[c][m], vm[c][m]) for c, m in zip(chars, muts)]
@@ -0,0 +1,115 @@
+# ratelimit.py
+# コマンドごと・ユーザーごとのレート制限（トークンバケット）。
+# 設定は constants.RATE_LIMITS：コマンド名 → (1回ぶん回復する秒数, 連続で使える回数)。
+# バケットは GCRA で持つ：状態は「次に1回ぶん回復しきる時刻」(tat) ひとつだけ。
+#   呼ぶたびに tat を interval 進め、tat が now + interval × burst を超えるなら拒否。
+# 判定はメモリ上だけで行い（DB に触らない）、変わった分を RATE_LIMIT_FLUSH_SECONDS ごとと終了時にまとめて書き出す。
+# 変わった分が無ければ DB には触らない（空のコミットでランキングの更新などを起こさない）。
+# 回復しきった行の削除は書き出しのついでに RATE_LIMIT_PURGE_SECONDS に1回だけ行う。
+# 起動時に回復しきっていない分だけ読み戻すので、再起動しても制限はリセットされない。
+#   @app_commands.command(...)
+#   @ratelimit.limited()
+#   async def luckyblock(...):
+import asyncio
+import time
+from typing import Dict, Optional, Set, Tuple
+
+import discord
+from discord import app_commands
+
+from constants import RATE_LIMITS, RATE_LIMIT_FLUSH_SECONDS, RATE_LIMIT_PURGE_SECONDS
+import db
+
+class RateLimited(app_commands.CheckFailure):
+    """上限超え。retry_after 秒後にもう一度使える"""
+    def __init__(self, command: str, retry_after: float):
+        super().__init__(f"{command} is rate limited, retry after {retry_after:.1f}s")
+        self.command = command
+        self.retry_after = retry_after
+
+class RateLimiter:
+    def __init__(self, limits: Dict[str, Tuple[float, int]]):
+        self.limits = limits
+        self._tat: Dict[Tuple[int, str], float] = {}
+        self._dirty: Set[Tuple[int, str]] = set()
+        self._purged_at = 0.0
+        self.allowed = 0
+        self.rejected = 0
+
+    def hit(self, uid: int, command: str, now: Optional[float] = None) -> float:
+        """1回ぶん使う。使えたら 0、使えなければ待つ秒数（状態は変えない）"""
+        limit = self.limits.get(command)
+        if limit is None:
+            return 0.0
+        interval, burst = limit
+        now = time.time() if now is None else now
+        key = (uid, command)
+        tat = max(self._tat.get(key, 0.0), now) + interval
+        over = tat - now - interval * burst
+        if over > 0:
+            self.rejected += 1
+            return over
+        self._tat[key] = tat
+        self._dirty.add(key)
+        self.allowed += 1
+        return 0.0
+
+    async def load(self):
+        now = time.time()
+        for uid, command, tat in await db.load_rate_limits(now):
+            if command in self.limits:
+                self._tat[(uid, command)] = max(self._tat.get((uid, command), 0.0), tat)
+
+    async def flush(self, now: Optional[float] = None):
+        """変わった分を書き出し、回復しきったものをメモリから捨てる。変わった分が無ければ DB に触らない"""
+        now = time.time() if now is None else now
+        dirty, self._dirty = self._dirty, set()
+        rows = [(uid, cmd, self._tat[(uid, cmd)]) for uid, cmd in dirty if (uid, cmd) in self._tat]
+        if rows:
+            purge = now - self._purged_at >= RATE_LIMIT_PURGE_SECONDS
+            try:
+                await db.save_rate_limits(rows, now if purge else None)
+            except Exception:
+                self._dirty |= dirty  # 次回また書く
+                raise
+            if purge:
+                self._purged_at = now
+        for key in [k for k, t in self._tat.items() if t <= now and k not in self._dirty]:
+            del self._tat[key]
+
+limiter = RateLimiter(RATE_LIMITS)
+_flush_task: Optional[asyncio.Task] = None
+
+def limited(command: Optional[str] = None):
+    """app command のチェック。上限を超えていたら RateLimited（コールバックは呼ばれない）"""
+    async def predicate(interaction: discord.Interaction) -> bool:
+        name = command or interaction.command.qualified_name
+        wait = limiter.hit(interaction.user.id, name)
+        if wait > 0:
+            raise RateLimited(name, wait)
+        return True
+    return app_commands.check(predicate)
+
+async def _flush_loop():
+    while True:
+        await asyncio.sleep(RATE_LIMIT_FLUSH_SECONDS)
+        try:
+            await limiter.flush()
+        except Exception as e:
+            print(f"[ratelimit] flush failed: {e!r}")
+
+async def start():
+    """保存済みの状態を読み込み、定期書き出しを始める（init_db の後に呼ぶ）"""
+    global _flush_task
+    if _flush_task is not None:
+        return
+    await limiter.load()
+    _flush_task = asyncio.create_task(_flush_loop())
+
+async def stop():
+    """定期書き出しを止めて残りを書き出す（close_db の前に呼ぶ）"""
+    global _flush_task
+    if _flush_task is not None:
+        _flush_task.cancel()
+        _flush_task = None
+    await limiter.flush()
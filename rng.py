@@ -0,0 +1,38 @@
+# rng.py
+# インタラクションごとの乱数系列。
+# コマンドごとに seed を1つ決めて random.Random を作り、抽選・出題・報酬はすべてその系列から引く。
+# seed はログ（と結果 embed のフッター）に残すので、replay(seed) で同じ結果を再現できる。
+#   例: pull_engine.open_many("Secret", 10, rng.replay(0x1a2b3c4d5e6f))
+# ※ NumPy の有無で pull_engine の抽選経路が変わるため、再現は同じ環境で行うこと。
+# 環境変数 RNG_SEED を設定すると seed は RNG_SEED と interaction.id から決まる（ベンチを決定的にする）。
+import hashlib
+import random
+from typing import Tuple
+from constants import RNG_SEED
+
+SEED_BITS = 48  # フッターに出すので短め（16進12桁）
+
+_sysrand = random.SystemRandom()
+
+def derive_seed(*parts) -> int:
+    """parts から決まる seed（同じ parts なら常に同じ値）"""
+    h = hashlib.blake2b(repr(parts).encode(), digest_size=8).digest()
+    return int.from_bytes(h, "big") >> (64 - SEED_BITS)
+
+def new_seed(key=None) -> int:
+    if RNG_SEED:
+        return derive_seed(RNG_SEED, key)
+    return _sysrand.getrandbits(SEED_BITS)
+
+def replay(seed: int) -> random.Random:
+    return random.Random(seed)
+
+def fmt_seed(seed: int) -> str:
+    return f"{seed:012x}"
+
+def for_interaction(interaction) -> Tuple[random.Random, int]:
+    """このインタラクション用の (乱数系列, seed)。seed はログに残す"""
+    seed = new_seed(interaction.id)
+    name = interaction.command.qualified_name if interaction.command else "?"
+    print(f"[rng] /{name} user={interaction.user.id} seed={fmt_seed(seed)}")
+    return random.Random(seed), seed
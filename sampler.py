@@ -0,0 +1,91 @@
+# sampler.py
+# ガチャ抽選の前計算テーブル（Vose のエイリアス法）。
+# ティアごとのキャラ表とミューテーション表を import 時に1回だけコンパイルし、1回の抽選を O(1) で行う。
+# 分布が従来の random.choices 版と一致することは tests/test_sampler.py で確認している。
+import random
+from typing import Dict, List, Sequence, Any
+from constants import TIERS, MUTATIONS
+import catalog
+
+class AliasTable:
+    """重み付き抽選テーブル（Vose's alias method）"""
+    __slots__ = ("items", "prob", "alias", "n")
+
+    def __init__(self, items: Sequence[Any], weights: Sequence[float]):
+        n = len(items)
+        total = float(sum(weights))
+        if n == 0 or total <= 0:
+            raise ValueError("AliasTable: 重みの合計が 0 です")
+        self.items = list(items)
+        self.n = n
+        self.prob = [0.0] * n
+        self.alias = list(range(n))
+
+        scaled = [w * n / total for w in weights]
+        small = [i for i, p in enumerate(scaled) if p < 1.0]
+        large = [i for i, p in enumerate(scaled) if p >= 1.0]
+        while small and large:
+            s = small.pop()
+            l = large.pop()
+            self.prob[s] = scaled[s]
+            self.alias[s] = l
+            scaled[l] = (scaled[l] + scaled[s]) - 1.0
+            (small if scaled[l] < 1.0 else large).append(l)
+        # 残りは丸め誤差で 1 付近のもの
+        for i in large + small:
+            self.prob[i] = 1.0
+
+    def sample(self, rng=None) -> Any:
+        u = (rng or random).random() * self.n
+        i = int(u)
+        return self.items[i] if u - i < self.prob[i] else self.items[self.alias[i]]
+
+    def sample_many(self, k: int, rng=None) -> List[Any]:
+        n, prob, alias, items = self.n, self.prob, self.alias, self.items
+        rnd = (rng or random).random
+        out = []
+        for _ in range(k):
+            u = rnd() * n
+            i = int(u)
+            out.append(items[i] if u - i < prob[i] else items[alias[i]])
+        return out
+
+    def probabilities(self) -> List[float]:
+        """テーブルから復元した各 item の確率（検証用）"""
+        p = [pr / self.n for pr in self.prob]
+        for i, pr in enumerate(self.prob):
+            if pr < 1.0:
+                p[self.alias[i]] += (1.0 - pr) / self.n
+        return p
+
+# ===== ミューテーション（0=なし、以降は MUTATION_INDEX と同じ1始まり） =====
+_MUT_NAMES = catalog.MUT_NAMES
+_MUT_WEIGHTS = [max(0.0, 100.0 - sum(p for _, _, p in MUTATIONS))] + [p for _, _, p in MUTATIONS]
+MUTATION_TABLE = AliasTable(range(len(_MUT_NAMES)), _MUT_WEIGHTS)
+
+# ===== ティア（キャラは entries 内の番号で引く） =====
+TIER_TABLES: Dict[str, AliasTable] = {
+    tier: AliasTable(range(len(t["entries"])), [w for _, w in t["entries"]])
+    for tier, t in TIERS.items()
+}
+_BASES: Dict[str, List[str]] = {tier: [n for n, _ in t["entries"]] for tier, t in TIERS.items()}
+# 装飾名表：_DECORATED[tier][キャラ番号] = catalog.NAMES の行（[mut_id] で引く）
+# catalog.load で char_id が振り直されても、名前で決まる行の中身は変わらない
+_DECORATED: Dict[str, List[List[str]]] = {
+    tier: [catalog.NAMES[catalog.CHAR_ID[base]] for base in bases]
+    for tier, bases in _BASES.items()
+}
+
+# rng には random.Random（rng.for_interaction の系列）を渡す。None ならグローバルの random
+def choose(tier_name: str, rng=None) -> str:
+    return _BASES[tier_name][TIER_TABLES[tier_name].sample(rng)]
+
+def roll_mutation(rng=None):
+    return _MUT_NAMES[MUTATION_TABLE.sample(rng)]
+
+def pull_many(tier_name: str, n: int, rng=None) -> List[str]:
+    """tier_name のブロックを n 回開けた結果（装飾名のリスト）"""
+    names = _DECORATED[tier_name]
+    chars = TIER_TABLES[tier_name].sample_many(n, rng)
+    muts = MUTATION_TABLE.sample_many(n, rng)
+    return [names[c][m] for c, m in zip(chars, muts)]
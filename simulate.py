@@ -0,0 +1,143 @@
+# simulate.py
+# ラッキーブロック経済のモンテカルロ・シミュレータ（本番と同じ抽選コードを使う）。
+#   python -m simulate                      # 全ティア 100万回ずつ、表で表示
+#   python -m simulate -t Secret -t Cat -n 5000000 --count 10 --json
+# 1サンプル = count 連を1回開けたときの合計価値。コストは TIERS の cost × count。
+import argparse
+import json
+import os
+import random
+import time
+from collections import Counter
+from multiprocessing import Pool
+from typing import Dict, List, Tuple
+
+from constants import TIERS
+from utils import fmt_compact
+import pull_engine
+
+PERCENTILES = (50, 90, 99, 99.9)
+DEFAULT_CHUNK = 250_000
+
+def _run_chunk(job: Tuple[str, int, int, int]) -> Tuple[str, Counter]:
+    """ワーカー：tier を count 連で rounds 回開け、合計価値ごとの出現回数を返す"""
+    tier, rounds, count, seed = job
+    pull_engine.seed(seed)
+    if pull_engine.np is not None:
+        values = pull_engine.pull_values(tier, rounds * count)
+        if count > 1:
+            values = values.reshape(rounds, count).sum(axis=1)
+        uniq, freq = pull_engine.np.unique(values, return_counts=True)
+        return tier, Counter(dict(zip(uniq.tolist(), freq.tolist())))
+    if count == 1:
+        return tier, Counter(pull_engine.pull_values(tier, rounds))
+    return tier, Counter(pull_engine.round_totals(tier, rounds, count))
+
+def _jobs(tiers: List[str], rounds: int, count: int, chunk: int, seed: int):
+    # 同じ seed・chunk なら結果が再現するように、チャンクごとに決まった seed を振る
+    i = 0
+    for tier in tiers:
+        left = rounds
+        while left > 0:
+            n = min(chunk, left)
+            yield tier, n, count, seed + i
+            left -= n
+            i += 1
+
+def _percentile(hist: List[Tuple[int, int]], total: int, q: float) -> int:
+    # hist は価値の昇順。累積が q% に達した最初の価値
+    need = total * q / 100.0
+    acc = 0
+    for v, c in hist:
+        acc += c
+        if acc >= need:
+            return v
+    return hist[-1][0]
+
+def summarize(tier: str, counts: Counter, count: int, jackpot: float) -> Dict:
+    cost = TIERS[tier]["cost"] * count
+    n = sum(counts.values())
+    hist = sorted(counts.items())
+    mean = sum(v * c for v, c in hist) / n
+    var = sum(c * (v - mean) ** 2 for v, c in hist) / n
+    threshold = cost * jackpot
+    return {
+        "tier": tier,
+        "count": count,
+        "samples": n,
+        "cost": cost,
+        "ev": mean,
+        "ev_cost": mean / cost,
+        "std": var ** 0.5,
+        "percentiles": {str(q): _percentile(hist, n, q) for q in PERCENTILES},
+        "max": hist[-1][0],
+        "p_profit": sum(c for v, c in hist if v >= cost) / n,
+        "jackpot_mult": jackpot,
+        "p_jackpot": sum(c for v, c in hist if v >= threshold) / n,
+    }
+
+def _print_table(rows: List[Dict], elapsed: float, workers: int):
+    head = ["Tier", "cost", "EV", "EV/cost", "std"] + [f"p{q:g}" for q in PERCENTILES] + ["max", "P(>=cost)", "P(jackpot)"]
+    lines = []
+    for r in rows:
+        lines.append([
+            r["tier"], fmt_compact(r["cost"]), fmt_compact(int(r["ev"])), f"{r['ev_cost']:.3f}",
+            fmt_compact(int(r["std"])),
+            *[fmt_compact(r["percentiles"][str(q)]) for q in PERCENTILES],
+            fmt_compact(r["max"]), f"{r['p_profit']:.2%}", f"{r['p_jackpot']:.4%}",
+        ])
+    widths = [max(len(str(x)) for x in col) for col in zip(head, *lines)]
+    fmt = lambda row: "  ".join(str(x).ljust(w) if i == 0 else str(x).rjust(w) for i, (x, w) in enumerate(zip(row, widths)))
+    print(fmt(head))
+    print("  ".join("-" * w for w in widths))
+    for row in lines:
+        print(fmt(row))
+    if rows:
+        r = rows[0]
+        print(f"\n{r['samples']:,} 回 × {len(rows)} ティア（{r['count']} 連）、jackpot = 価値 ≥ コスト×{r['jackpot_mult']:g}、"
+              f"{workers} プロセス、{elapsed:.1f}s、numpy={'on' if pull_engine.np is not None else 'off'}")
+
+def _positive_int(s: str) -> int:
+    try:
+        v = int(s)
+    except ValueError:
+        raise argparse.ArgumentTypeError(f"整数ではありません: {s!r}")
+    if v < 1:
+        raise argparse.ArgumentTypeError(f"1 以上を指定してください: {v}")
+    return v
+
+def main(argv=None):
+    ap = argparse.ArgumentParser(prog="python -m simulate", description="ラッキーブロックの期待値・分布をオフラインで計算する")
+    ap.add_argument("-t", "--tier", action="append", choices=list(TIERS), help="対象ティア（複数可、省略で全ティア）")
+    ap.add_argument("-n", "--rounds", type=_positive_int, default=1_000_000, help="ティアごとの試行回数（既定 100万）")
+    ap.add_argument("-c", "--count", type=_positive_int, default=1, help="1回に開ける数（/luckyblock の count）")
+    ap.add_argument("-j", "--jackpot", type=float, default=10.0, help="価値がコストの何倍以上を jackpot とするか")
+    ap.add_argument("-w", "--workers", type=_positive_int, default=os.cpu_count() or 1, help="プロセス数")
+    ap.add_argument("--chunk", type=_positive_int, default=DEFAULT_CHUNK, help="1ジョブあたりの試行回数")
+    ap.add_argument("--seed", type=int, default=None, help="乱数シード（同じ値なら結果を再現）")
+    ap.add_argument("--json", action="store_true", help="JSON で出力")
+    args = ap.parse_args(argv)
+
+    tiers = args.tier or list(TIERS)
+    seed = args.seed if args.seed is not None else random.SystemRandom().randrange(2**32)
+    merged: Dict[str, Counter] = {t: Counter() for t in tiers}
+
+    start = time.perf_counter()
+    jobs = list(_jobs(tiers, args.rounds, args.count, max(1, args.chunk), seed))
+    if args.workers > 1:
+        with Pool(args.workers) as pool:
+            for tier, counts in pool.imap_unordered(_run_chunk, jobs):
+                merged[tier].update(counts)
+    else:
+        for tier, counts in map(_run_chunk, jobs):
+            merged[tier].update(counts)
+    elapsed = time.perf_counter() - start
+
+    rows = [summarize(t, merged[t], args.count, args.jackpot) for t in tiers]
+    if args.json:
+        print(json.dumps({"seed": seed, "elapsed": elapsed, "results": rows}, ensure_ascii=False, indent=2))
+    else:
+        _print_table(rows, elapsed, args.workers)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,89 @@
+# tests/test_autosell.py
+# 自動売却ルールのコンパイル（ティア・ミューテーション・価値の条件）と、/autosell の一覧UIとの関係。
+import unittest
+
+import catalog
+import db
+from autosell import MUT_ALL, MUT_NONE_ONLY, Matcher, Rule, mut_bit
+from constants import TIERS
+from tests.test_db import TempDBTestCase
+
+SPIONIRO = "Spioniro Golubiro"  # Mythic
+GATTITO = "Gattito Tacoto"      # Taco と Cat の両方に出る
+
+def rule(char=None, tier=None, mask=MUT_NONE_ONLY, below=None, rule_id=1) -> Rule:
+    return Rule(rule_id, catalog.CHAR_ID[char] if char else None, tier, mask, below)
+
+def names(*chars_muts):
+    return {catalog.NAMES[catalog.CHAR_ID[c]][catalog.MUT_ID[m] if m else 0] for c, m in chars_muts}
+
+class MatcherTest(unittest.TestCase):
+    def test_empty(self):
+        m = Matcher([])
+        self.assertFalse(m)
+        self.assertEqual(m.for_tier("Mythic"), frozenset())
+
+    def test_char_rule_sells_only_plain(self):
+        m = Matcher([rule(SPIONIRO)])
+        self.assertEqual(m.for_tier("Mythic"), names((SPIONIRO, None)))
+        self.assertEqual(m.for_tier("Secret"), frozenset())
+
+    def test_mutation_mask(self):
+        m = Matcher([rule(SPIONIRO, mask=mut_bit("Rainbow") | mut_bit("Gold"))])
+        self.assertEqual(m.for_tier("Mythic"), names((SPIONIRO, "Rainbow"), (SPIONIRO, "Gold")))
+        m = Matcher([rule(SPIONIRO, mask=MUT_ALL)])
+        self.assertEqual(len(m.for_tier("Mythic")), len(catalog.MUT_NAMES))
+
+    def test_tier_restriction(self):
+        m = Matcher([rule(GATTITO, tier="Cat")])
+        self.assertEqual(m.for_tier("Cat"), names((GATTITO, None)))
+        self.assertEqual(m.for_tier("Taco"), frozenset())
+
+    def test_max_value(self):
+        below = catalog.VALUE_BY_NAME[f"{SPIONIRO} (Gold)"] + 1
+        m = Matcher([rule(tier="Mythic", mask=MUT_ALL, below=below)])
+        for name in m.for_tier("Mythic"):
+            self.assertLess(catalog.VALUE_BY_NAME[name], below)
+        self.assertIn(f"{SPIONIRO} (Gold)", m.for_tier("Mythic"))
+        self.assertNotIn(f"{SPIONIRO} (Rainbow)", m.for_tier("Mythic"))
+
+    def test_rules_are_ored(self):
+        m = Matcher([rule(SPIONIRO, rule_id=1), rule(SPIONIRO, mask=mut_bit("Rainbow"), rule_id=2)])
+        self.assertEqual(m.for_tier("Mythic"), names((SPIONIRO, None), (SPIONIRO, "Rainbow")))
+
+    def test_split(self):
+        m = Matcher([rule(SPIONIRO)])
+        other = next(n for n, _ in TIERS["Mythic"]["entries"] if n != SPIONIRO)
+        pulls = [(SPIONIRO, 1), (f"{SPIONIRO} (Gold)", 2), (other, 3), (SPIONIRO, 4)]
+        keep, sold = m.split("Mythic", pulls)
+        self.assertEqual(keep, [(f"{SPIONIRO} (Gold)", 2), (other, 3)])
+        self.assertEqual(sold, [(SPIONIRO, 1), (SPIONIRO, 4)])
+
+    def test_char_names_ignores_conditional_rules(self):
+        m = Matcher([
+            rule(SPIONIRO, rule_id=1),
+            rule(GATTITO, mask=mut_bit("Rainbow"), rule_id=2),
+            rule(GATTITO, tier="Cat", rule_id=3),
+            rule(GATTITO, below=10, rule_id=4),
+        ])
+        self.assertEqual(m.char_names(), [SPIONIRO])
+
+class AutosellListTest(TempDBTestCase):
+    """/autosell・/autosell_disable は自分で作った形のルールだけを触る"""
+
+    async def test_add_keeps_existing_mutation_rule(self):
+        rid = await db.add_autosell_rule(1, char_id=catalog.CHAR_ID[SPIONIRO], mut_mask=mut_bit("Rainbow"))
+        await db.add_autosell(1, SPIONIRO)
+        await db.add_autosell(1, SPIONIRO)  # 2回目は増えない
+        m = await db.get_autosell_matcher(1)
+        self.assertEqual(len(m.rules), 2)
+        self.assertEqual(await db.get_autosell_list(1), [SPIONIRO])
+        self.assertEqual(m.for_tier("Mythic"), names((SPIONIRO, None), (SPIONIRO, "Rainbow")))
+
+        await db.remove_autosell(1, SPIONIRO)
+        m = await db.get_autosell_matcher(1)
+        self.assertEqual([r.rule_id for r in m.rules], [rid])
+        self.assertEqual(await db.get_autosell_list(1), [])
+
+if __name__ == "__main__":
+    unittest.main()
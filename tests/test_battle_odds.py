@@ -0,0 +1,57 @@
+# tests/test_battle_odds.py
+# 対戦の勝敗確率（畳み込み）の検算。重いティア・大きい count は避け、軽いものだけで見る。
+import random
+import unittest
+
+import battle_odds
+import pull_engine
+
+class ValueDistributionTest(unittest.TestCase):
+    def test_sums_to_one(self):
+        dist = battle_odds.value_distribution("Mythic")
+        self.assertAlmostEqual(sum(dist.values()), 1.0, places=12)
+
+class ComputeTest(unittest.TestCase):
+    def test_probabilities_add_up(self):
+        for o in battle_odds.compute("Jandel vs Sammy", 3):
+            self.assertAlmostEqual(2 * o.p_win + o.p_draw, 1.0, places=12)
+            self.assertGreaterEqual(o.lost, 0.0)
+
+    def test_single_pull_is_exact(self):
+        o = battle_odds.compute("Mythic", 1)[0]
+        dist = battle_odds.value_distribution("Mythic")
+        self.assertTrue(o.exact)
+        self.assertAlmostEqual(o.p_draw, sum(p * p for p in dist.values()), places=12)
+        self.assertEqual(o.expected_pot, int(round(2 * sum(v * p for v, p in dist.items()))))
+
+    def test_returns_every_count_up_to_requested(self):
+        rows = battle_odds.compute("Hacker", 4)
+        self.assertEqual([o.count for o in rows], [1, 2, 3, 4])
+        self.assertTrue(all(a.p_draw > b.p_draw for a, b in zip(rows, rows[1:])))
+
+    def test_count_out_of_range(self):
+        for count in (0, battle_odds.MAX_COUNT + 1):
+            with self.assertRaises(ValueError):
+                battle_odds.compute("Hacker", count)
+
+    def test_matches_monte_carlo(self):
+        # 実際に開けて対戦させたときの引き分け率が理論値の 4σ 以内か
+        n, count = 50_000, 2
+        o = battle_odds.compute("Hacker", count)[-1]
+        rng = random.Random(11)
+        a = pull_engine.round_totals("Hacker", n, count, rng)
+        b = pull_engine.round_totals("Hacker", n, count, rng)
+        draws = sum(1 for x, y in zip(a, b) if x == y)
+        sigma = (n * o.p_draw * (1 - o.p_draw)) ** 0.5
+        self.assertLess(abs(draws - n * o.p_draw), 4 * sigma + n * o.lost)
+
+class CacheTest(unittest.TestCase):
+    def test_battle_odds_fills_cache(self):
+        self.assertIsNone(battle_odds.cached_odds("Cat", 2))
+        o = battle_odds.battle_odds("Cat", 2)
+        self.assertIs(battle_odds.cached_odds("Cat", 2), o)
+        self.assertIsNotNone(battle_odds.cached_odds("Cat", 1))
+        self.assertIsNone(battle_odds.cached_odds("Cat", 3))
+
+if __name__ == "__main__":
+    unittest.main()
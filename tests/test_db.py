@@ -0,0 +1,164 @@
+# tests/test_db.py
+# db.py を一時ファイルの DB に向けて確かめる。
+import asyncio
+import os
+import sqlite3
+import tempfile
+import unittest
+
+import catalog
+import db
+import migrations
+
+class TempDBTestCase(unittest.IsolatedAsyncioTestCase):
+    async def asyncSetUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.saved_path = db.DB_PATH
+        db.DB_PATH = os.path.join(self.tmp.name, "test.db")
+        db.invalidate_user()
+        await db.init_db()
+
+    async def asyncTearDown(self):
+        await db.close_db()
+        db.invalidate_user()
+        db.DB_PATH = self.saved_path
+        self.tmp.cleanup()
+
+async def _user_ids():
+    async with db.reader() as conn:
+        return [r[0] for r in await conn.execute_fetchall("SELECT user_id FROM users ORDER BY user_id")]
+
+async def _insert(uid: int, fail: bool = False):
+    async with db.writer() as conn:
+        await conn.execute("INSERT INTO users(user_id) VALUES(?)", (uid,))
+        if fail:
+            raise RuntimeError("boom")
+
+class WriterTest(TempDBTestCase):
+    async def test_writer_connection_is_durable(self):
+        async with db.writer() as conn:
+            self.assertEqual((await conn.execute_fetchall("PRAGMA synchronous"))[0][0], 2)  # FULL
+
+    async def test_failing_op_rolls_back_only_itself(self):
+        seq = db.commit_seq()
+        results = await asyncio.gather(_insert(1), _insert(2, fail=True), _insert(3), return_exceptions=True)
+        self.assertIsNone(results[0])
+        self.assertIsInstance(results[1], RuntimeError)
+        self.assertIsNone(results[2])
+        self.assertEqual(db.commit_seq(), seq + 1)  # 3件で1回の COMMIT
+        self.assertEqual(await _user_ids(), [1, 3])
+
+    async def test_failing_statement_rolls_back_only_itself(self):
+        async def bad(conn):
+            await conn.execute("INSERT INTO users(user_id) VALUES(4)")
+            await conn.execute("INSERT INTO users(user_id) VALUES(4)")  # 主キー重複
+
+        loop = asyncio.get_running_loop()
+        op = db._WriteOp(bad, loop.create_future())
+        db._write_queue.put_nowait(op)
+        results = await asyncio.gather(_insert(5), op.done, _insert(6), return_exceptions=True)
+        self.assertIsInstance(results[1], sqlite3.IntegrityError)
+        self.assertEqual(await _user_ids(), [5, 6])
+
+    async def test_handoff_body_error_is_rolled_back(self):
+        with self.assertRaises(RuntimeError):
+            await _insert(7, fail=True)
+        self.assertEqual(await _user_ids(), [])
+        await _insert(8)  # アクターは生きている
+        self.assertEqual(await _user_ids(), [8])
+
+    async def test_close_drains_pending_ops(self):
+        tasks = [asyncio.create_task(_insert(uid)) for uid in range(10, 110)]
+        await asyncio.sleep(0)  # 全部キューに積ませる
+        await db.close_db()
+        await asyncio.gather(*tasks)
+        await db.init_db()
+        self.assertEqual(await _user_ids(), list(range(10, 110)))
+
+class MigrationTest(unittest.IsolatedAsyncioTestCase):
+    """元の db.init_db が作っていた形（user_version=0）から最新まで上げる"""
+
+    async def asyncSetUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.saved_path = db.DB_PATH
+        db.DB_PATH = os.path.join(self.tmp.name, "old.db")
+        conn = sqlite3.connect(db.DB_PATH)
+        conn.executescript("""
+CREATE TABLE users (user_id INTEGER PRIMARY KEY, credits INTEGER NOT NULL DEFAULT 0,
+ last_open INTEGER NOT NULL DEFAULT 0, last_daily INTEGER NOT NULL DEFAULT 0);
+CREATE TABLE base_slots (user_id INTEGER NOT NULL, slot INTEGER NOT NULL, name TEXT, PRIMARY KEY (user_id, slot));
+CREATE TABLE mutation_index (name TEXT PRIMARY KEY, idx INTEGER NOT NULL);
+CREATE TABLE user_meta (user_id INTEGER PRIMARY KEY, daily_count INTEGER NOT NULL DEFAULT 0);
+CREATE TABLE autosell (user_id INTEGER, name TEXT, PRIMARY KEY(user_id, name));
+INSERT INTO users(user_id, credits) VALUES (1, 500), (2, 0);
+INSERT INTO base_slots VALUES (1, 1, 'Pot Hotspot (Gold)'), (1, 2, NULL), (1, 3, 'Meowl'), (2, 1, NULL);
+INSERT INTO autosell VALUES (1, 'Meowl');
+""")
+        conn.commit()
+        conn.close()
+
+    async def asyncTearDown(self):
+        await db.close_db()
+        db.invalidate_user()
+        db.DB_PATH = self.saved_path
+        self.tmp.cleanup()
+
+    async def _snapshot(self):
+        async with db.reader() as conn:
+            version = (await conn.execute_fetchall("PRAGMA user_version"))[0][0]
+            users = await conn.execute_fetchall("SELECT user_id, credits, base_value_total FROM users ORDER BY user_id")
+            slots = await conn.execute_fetchall("SELECT user_id, slot, char_id, mut_id FROM base_slots ORDER BY 1, 2")
+            rules = await conn.execute_fetchall("SELECT user_id, char_id, tier, mut_mask, max_value FROM autosell_rules")
+        return version, [tuple(r) for r in users], [tuple(r) for r in slots], [tuple(r) for r in rules]
+
+    async def test_baseline_to_latest(self):
+        await db.init_db()
+        version, users, slots, rules = await self._snapshot()
+        self.assertEqual(version, len(migrations.MIGRATIONS))
+        base = [(slot, name) for slot, name in await db.list_base(1) if name is not None]
+        self.assertEqual(base, [(1, "Pot Hotspot (Gold)"), (3, "Meowl")])
+        total = catalog.VALUE_BY_NAME["Pot Hotspot (Gold)"] + catalog.VALUE_BY_NAME["Meowl"]
+        self.assertEqual(users, [(1, 500, total), (2, 0, 0)])
+        self.assertEqual(rules, [(1, catalog.CHAR_ID["Meowl"], None, 1, None)])
+
+        # 2回目の起動では何も変わらない
+        await db.close_db()
+        await db.init_db()
+        self.assertEqual(await self._snapshot(), (version, users, slots, rules))
+
+    async def test_rerun_on_migrated_db(self):
+        # user_version=0 のまま最新の形になっている DB でも、全部流し直して壊れない
+        await db.init_db()
+        before = await self._snapshot()
+        async with db.writer() as conn:
+            await conn.execute("PRAGMA user_version=0")
+        await db.close_db()
+        await db.init_db()
+        self.assertEqual(await self._snapshot(), before)
+
+class UserCacheTest(TempDBTestCase):
+    async def test_generations_are_not_kept_after_reads(self):
+        for uid in range(1, 51):
+            await db.get_user_row(uid)
+            await db.adjust_credits(uid, 10)
+        await asyncio.gather(*(db.get_user_row(uid) for uid in range(1, 51)))
+        self.assertEqual(db._user_gen, {})
+
+    async def test_write_during_read_is_not_cached(self):
+        async def load(conn, uid):
+            db._bump(uid)  # 読み出し中に書き込みが挟まった
+            return "old"
+
+        self.assertEqual(await db._read_through(7, "x", load), "old")
+        self.assertIsNone(db._user_cache.get(7))
+        self.assertEqual(db._user_gen, {})
+
+    async def test_read_is_cached(self):
+        async def load(conn, uid):
+            return "v"
+
+        await db._read_through(8, "x", load)
+        self.assertEqual(db._user_cache.get(8), {"x": "v"})
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,56 @@
+# tests/test_locks.py
+# ユーザー単位ロック：同一ユーザーは直列・別ユーザーは並行・2者の逆順取得でもデッドロックしない・再入できる。
+import asyncio
+import time
+import unittest
+
+from locks import KeyedLocks
+
+class KeyedLocksTest(unittest.IsolatedAsyncioTestCase):
+    def setUp(self):
+        self.locks = KeyedLocks("test")
+        self.order = []
+
+    async def op(self, tag, *keys, delay=0.01):
+        async with self.locks.hold(*keys):
+            self.order.append(("in", tag))
+            await asyncio.sleep(delay)
+            self.order.append(("out", tag))
+
+    async def test_same_key_is_serialized(self):
+        await asyncio.gather(self.op("a", 1), self.op("b", 1))
+        self.assertEqual(self.order, [("in", "a"), ("out", "a"), ("in", "b"), ("out", "b")])
+
+    async def test_different_keys_run_in_parallel(self):
+        t = time.perf_counter()
+        await asyncio.gather(*(self.op(i, i, delay=0.05) for i in range(10)))
+        self.assertLess(time.perf_counter() - t, 0.2)
+
+    async def test_opposite_order_pairs_do_not_deadlock(self):
+        ops = (self.op(i, 1, 2) if i % 2 else self.op(i, 2, 1) for i in range(50))
+        await asyncio.wait_for(asyncio.gather(*ops), 5)
+        self.assertEqual(self.locks.stats().acquired, 100)
+
+    async def test_reentrant(self):
+        async with self.locks.hold(3):
+            async with self.locks.hold(3, 4):
+                self.assertTrue(self.locks.locked(3) and self.locks.locked(4))
+            self.assertTrue(self.locks.locked(3))
+            self.assertFalse(self.locks.locked(4))
+        self.assertFalse(self.locks.locked(3))
+
+    async def test_released_on_error(self):
+        with self.assertRaises(RuntimeError):
+            async with self.locks.hold(5, 6):
+                raise RuntimeError
+        self.assertFalse(self.locks.locked(5) or self.locks.locked(6))
+
+    async def test_stats_and_cleanup(self):
+        await asyncio.gather(self.op("a", 1), self.op("b", 1), self.op("c", 2))
+        s = self.locks.stats()
+        self.assertEqual((s.acquired, s.contended), (3, 1))
+        self.assertGreater(s.wait_max, 0.0)
+        self.assertEqual(s.live, 0)  # 誰も持っていないロックは残らない
+
+if __name__ == "__main__":
+    unittest.main()
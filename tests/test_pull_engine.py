@@ -0,0 +1,42 @@
+# tests/test_pull_engine.py
+# 大量開封エンジンの価値が utils.base_value（装飾名からの計算）と一致するか。
+import random
+import unittest
+
+from constants import TIERS
+import pull_engine
+import sampler
+from utils import base_value
+
+class ValueMatrixTest(unittest.TestCase):
+    def test_matches_base_value(self):
+        for tier in TIERS:
+            for row, names in zip(pull_engine.VALUE_MATRIX[tier], sampler._DECORATED[tier]):
+                for v, name in zip(row, names):
+                    self.assertEqual(v, base_value(name), name)
+
+class OpenManyTest(unittest.TestCase):
+    def test_values_match_names(self):
+        for tier in TIERS:
+            for name, v in pull_engine.open_many(tier, 200, random.Random(1)):
+                self.assertEqual(v, base_value(name), name)
+
+    def test_seeded_rng_is_deterministic(self):
+        a = pull_engine.open_many("Secret", 100, random.Random(3))
+        b = pull_engine.open_many("Secret", 100, random.Random(3))
+        self.assertEqual(a, b)
+
+    def test_same_sequence_for_names_and_values(self):
+        opened = pull_engine.open_many("Spooky", 100, random.Random(5))
+        values = pull_engine.pull_values("Spooky", 100, random.Random(5))
+        self.assertEqual([v for _, v in opened], [int(v) for v in values])
+
+class RoundTotalsTest(unittest.TestCase):
+    def test_totals_are_sums_of_values(self):
+        rounds, count = 7, 10
+        values = [int(v) for v in pull_engine.pull_values("Mythic", rounds * count, random.Random(9))]
+        totals = pull_engine.round_totals("Mythic", rounds, count, random.Random(9))
+        self.assertEqual(totals, [sum(values[i:i + count]) for i in range(0, rounds * count, count)])
+
+if __name__ == "__main__":
+    unittest.main()
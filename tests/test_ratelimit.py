@@ -0,0 +1,106 @@
+# tests/test_ratelimit.py
+# レート制限：GCRA の判定と、DB への書き出し（変わった分が無ければ触らない）。
+import os
+import tempfile
+import time
+import unittest
+
+import db
+from constants import RATE_LIMIT_PURGE_SECONDS
+from ratelimit import RateLimiter
+
+class HitTest(unittest.TestCase):
+    def setUp(self):
+        self.lim = RateLimiter({"x": (10, 3)})
+        self.t = 1000.0
+
+    def test_burst_then_interval(self):
+        lim, t = self.lim, self.t
+        self.assertEqual([lim.hit(1, "x", t) for _ in range(3)], [0.0, 0.0, 0.0])
+        self.assertEqual(lim.hit(1, "x", t), 10.0)
+        self.assertGreater(lim.hit(1, "x", t + 9.9), 0)
+        self.assertEqual(lim.hit(1, "x", t + 10), 0.0)
+        self.assertGreater(lim.hit(1, "x", t + 10), 0)
+
+    def test_refills_to_burst(self):
+        lim, t = self.lim, self.t
+        for _ in range(3):
+            lim.hit(1, "x", t)
+        self.assertEqual([lim.hit(1, "x", t + 1000) for _ in range(4)], [0.0, 0.0, 0.0, 10.0])
+
+    def test_separate_buckets(self):
+        lim, t = self.lim, self.t
+        for _ in range(3):
+            lim.hit(1, "x", t)
+        self.assertEqual(lim.hit(2, "x", t), 0.0)  # 別ユーザーは別バケット
+        self.assertEqual(lim.hit(1, "y", t), 0.0)  # 設定のないコマンドは無制限
+
+    def test_rejection_does_not_consume(self):
+        lim, t = self.lim, self.t
+        for _ in range(3):
+            lim.hit(1, "x", t)
+        for _ in range(5):
+            lim.hit(1, "x", t)
+        self.assertEqual(lim.hit(1, "x", t + 10), 0.0)
+        self.assertEqual((lim.allowed, lim.rejected), (4, 5))
+
+class FlushTest(unittest.IsolatedAsyncioTestCase):
+    async def asyncSetUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.saved_path = db.DB_PATH
+        db.DB_PATH = os.path.join(self.tmp.name, "test.db")
+        await db.init_db()
+
+    async def asyncTearDown(self):
+        await db.close_db()
+        db.DB_PATH = self.saved_path
+        self.tmp.cleanup()
+
+    async def test_idle_flush_does_not_commit(self):
+        lim = RateLimiter({"x": (10, 3)})
+        seq = db.commit_seq()
+        await lim.flush()
+        await lim.flush()
+        self.assertEqual(db.commit_seq(), seq)
+
+    async def test_flush_writes_and_load_restores(self):
+        now = time.time()
+        lim = RateLimiter({"x": (60, 1), "luckyblock": (10, 1)})
+        lim.hit(1, "x", now)
+        lim.hit(1, "luckyblock", now)
+        seq = db.commit_seq()
+        await lim.flush(now)
+        self.assertGreater(db.commit_seq(), seq)
+
+        # 書き出した後は何も変わっていないのでコミットしない
+        seq = db.commit_seq()
+        await lim.flush(now)
+        self.assertEqual(db.commit_seq(), seq)
+
+        again = RateLimiter({"x": (60, 1), "luckyblock": (10, 1)})
+        await again.load()
+        self.assertGreater(again.hit(1, "x", now), 0)
+        self.assertGreater(again.hit(1, "luckyblock", now), 0)
+        self.assertEqual(again.hit(2, "x", now), 0.0)
+
+    async def test_expired_rows_are_purged_on_cadence(self):
+        async def stored():
+            async with db.reader() as conn:
+                return sorted(tuple(r) for r in await conn.execute_fetchall("SELECT user_id, command FROM rate_limits"))
+
+        now = time.time()
+        t0 = now - RATE_LIMIT_PURGE_SECONDS - 10
+        lim = RateLimiter({"x": (1, 1), "y": (1000, 1)})
+        lim.hit(1, "x", t0)
+        await lim.flush(t0)
+        # 前回の削除から RATE_LIMIT_PURGE_SECONDS 経っていなければ、回復しきった行も残す
+        lim.hit(2, "y", now - 100)
+        await lim.flush(now - 100)
+        self.assertEqual(await stored(), [(1, "x"), (2, "y")])
+        # 経っていれば書き出しのついでに消す
+        lim.hit(3, "y", now)
+        await lim.flush(now)
+        self.assertEqual(await stored(), [(2, "y"), (3, "y")])
+
+if __name__ == "__main__":
+    unittest.main()
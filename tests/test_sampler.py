@@ -0,0 +1,104 @@
+# tests/test_sampler.py
+# エイリアス表の抽選が置き換え前の random.choices 版と同じ分布になっているか。
+#   python -m unittest discover -s tests
+import random
+import unittest
+from typing import Dict, List
+
+from constants import TIERS, MUTATIONS
+import sampler
+
+N = 100_000  # ティアごと・新旧それぞれの抽選回数
+MIN_EXPECTED = 5.0  # 期待度数がこれ未満のカテゴリは1つにまとめる
+
+def _chi2_critical(df: int, z: float = 3.09) -> float:
+    # Wilson–Hilferty 近似（z=3.09 で上側 0.1%）
+    h = 2.0 / (9.0 * df)
+    return df * (1.0 - h + z * h ** 0.5) ** 3
+
+def _legacy_pull(tier_name: str, rng: random.Random) -> str:
+    # 置き換え前の utils.pull_once と同じ抽選
+    e = TIERS[tier_name]["entries"]
+    base = rng.choices([n for n, _ in e], weights=[w for _, w in e], k=1)[0]
+    total_p = sum(p for _, _, p in MUTATIONS)
+    names = [None] + [n for n, _, _ in MUTATIONS]
+    weights = [max(0.0, 100.0 - total_p)] + [p for _, _, p in MUTATIONS]
+    mut = rng.choices(names, weights=weights, k=1)[0]
+    return f"{base} ({mut})" if mut else base
+
+def _expected(tier_name: str) -> Dict[str, float]:
+    e = TIERS[tier_name]["entries"]
+    tw = sum(w for _, w in e)
+    mw = sum(sampler._MUT_WEIGHTS)
+    out: Dict[str, float] = {}
+    for base, w in e:
+        for m, mp in zip(sampler._MUT_NAMES, sampler._MUT_WEIGHTS):
+            name = f"{base} ({m})" if m else base
+            out[name] = out.get(name, 0.0) + (w / tw) * (mp / mw)
+    return out
+
+def _bins(expected: Dict[str, float], n: int) -> Dict[str, str]:
+    """名前 → ビン。期待度数の小さいものは "*" にまとめる"""
+    return {k: (k if n * p >= MIN_EXPECTED else "*") for k, p in expected.items() if p > 0}
+
+def _count(names: List[str], bins: Dict[str, str]) -> Dict[str, int]:
+    out: Dict[str, int] = {}
+    for name in names:
+        b = bins[name]  # 期待分布に無い名前なら KeyError で落ちる
+        out[b] = out.get(b, 0) + 1
+    return out
+
+class AliasTableTest(unittest.TestCase):
+    def test_tables_reproduce_weights(self):
+        for tier, t in TIERS.items():
+            tw = sum(w for _, w in t["entries"])
+            want = [w / tw for _, w in t["entries"]]
+            got = sampler.TIER_TABLES[tier].probabilities()
+            for a, b in zip(want, got):
+                self.assertAlmostEqual(a, b, delta=1e-12, msg=tier)
+        mw = sum(sampler._MUT_WEIGHTS)
+        for a, b in zip(sampler.MUTATION_TABLE.probabilities(), sampler._MUT_WEIGHTS):
+            self.assertAlmostEqual(a, b / mw, delta=1e-12)
+
+    def test_single_item(self):
+        t = sampler.AliasTable(["x"], [3.0])
+        self.assertEqual(t.sample_many(5), ["x"] * 5)
+
+    def test_zero_weights(self):
+        with self.assertRaises(ValueError):
+            sampler.AliasTable(["x", "y"], [0, 0])
+
+    def test_seeded_rng_is_deterministic(self):
+        a = sampler.pull_many("Secret", 50, random.Random(7))
+        b = sampler.pull_many("Secret", 50, random.Random(7))
+        self.assertEqual(a, b)
+
+class DistributionTest(unittest.TestCase):
+    """新旧それぞれ N 回引き、カイ二乗で比較する（有意水準 0.1%）"""
+
+    def test_matches_legacy(self):
+        new_rng, old_rng = random.Random(1), random.Random(2)
+        for tier in TIERS:
+            with self.subTest(tier=tier):
+                expected = _expected(tier)
+                bins = _bins(expected, N)
+                new = _count(sampler.pull_many(tier, N, new_rng), bins)
+                old = _count([_legacy_pull(tier, old_rng) for _ in range(N)], bins)
+
+                # 2標本の同質性検定（標本数が同じなので (a-b)^2/(a+b) の和）
+                keys = set(new) | set(old)
+                stat = sum((new.get(k, 0) - old.get(k, 0)) ** 2 / (new.get(k, 0) + old.get(k, 0)) for k in keys)
+                crit = _chi2_critical(len(keys) - 1)
+                self.assertLess(stat, crit, f"new vs legacy: chi2={stat:.1f} crit={crit:.1f}")
+
+                # 新しい方は期待分布への適合度も見る
+                exp_bin: Dict[str, float] = {}
+                for k, p in expected.items():
+                    if p > 0:
+                        exp_bin[bins[k]] = exp_bin.get(bins[k], 0.0) + p
+                stat = sum((new.get(k, 0) - N * p) ** 2 / (N * p) for k, p in exp_bin.items())
+                crit = _chi2_critical(len(exp_bin) - 1)
+                self.assertLess(stat, crit, f"new vs expected: chi2={stat:.1f} crit={crit:.1f}")
+
+if __name__ == "__main__":
+    unittest.main()
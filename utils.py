@@ -1,9 +1,11 @@
 # utils.py
-import random
 import re
+import sys
 import unicodedata
 from typing import Optional, Tuple, Dict, Any, List
-from constants import MUTATIONS, MUTATION_MULT, TIERS, CHAR_VALUES
+from constants import CHAR_VALUES
+import sampler
+import catalog
 
 # ======================
 # 表示ユーティリティ
@@ -77,6 +79,33 @@ def parse_int_loose(s: str) -> Optional[int]:
     except ValueError:
         return None
 
+_SLOT_RANGE_RE = re.compile(r"^(\d+)(?:-(\d+))?$")
+
+def parse_slots(s: str, max_slot: int) -> Optional[List[int]]:
+    """
+    スロット指定を昇順・重複なしのリストにする。
+    例: "3" → [3] / "1,3,5-8" → [1, 3, 5, 6, 7, 8] / "１〜５" → [1..5]
+    1〜max_slot の外や書式が不正なら None。
+    """
+    if not s:
+        return None
+    s = unicodedata.normalize("NFKC", s).replace("〜", "-").replace("~", "-").replace("、", ",")
+    out = set()
+    for part in re.split(r"[,\s]+", s.strip()):
+        if not part:
+            continue
+        m = _SLOT_RANGE_RE.match(part)
+        if not m:
+            return None
+        lo = int(m.group(1))
+        hi = int(m.group(2)) if m.group(2) else lo
+        if lo > hi:
+            lo, hi = hi, lo
+        if lo < 1 or hi > max_slot:
+            return None
+        out.update(range(lo, hi + 1))
+    return sorted(out) or None
+
 _HIRA_KEEP = set(list("ーゔ"))  # 例外許容
 
 def sanitize_to_hiragana_core(s: str) -> str:
@@ -114,12 +143,9 @@ def is_hiragana_strict_after_sanitize(s: str) -> bool:
 # ガチャ/価値計算
 # ======================
 
-def roll_mutation() -> Optional[str]:
-    total_p = sum(p for _, _, p in MUTATIONS)
-    none_p = max(0.0, 100.0 - total_p)
-    names = [None] + [n for n, _, _ in MUTATIONS]
-    weights = [none_p] + [p for _, _, p in MUTATIONS]
-    return random.choices(names, weights=weights, k=1)[0]
+# rng: random.Random（rng.for_interaction）。省略時はグローバルの random
+def roll_mutation(rng=None) -> Optional[str]:
+    return sampler.roll_mutation(rng)
 
 def decorate_name(base: str, mutation: Optional[str]) -> str:
     return f"{base} ({mutation})" if mutation else base
@@ -131,18 +157,30 @@ def split_name(name_with_mut: str) -> Tuple[str, Optional[str]]:
             return name_with_mut[:i], name_with_mut[i+2:-1]
     return name_with_mut, None
 
-def choose_character(tier_name: str) -> str:
-    e = TIERS[tier_name]["entries"]
-    return random.choices([n for n,_ in e], weights=[w for _,w in e], k=1)[0]
+def choose_character(tier_name: str, rng=None) -> str:
+    return sampler.choose(tier_name, rng)
 
-def pull_once(tier_name: str) -> str:
-    base = choose_character(tier_name)
-    mut = roll_mutation()
-    return decorate_name(base, mut)
+def pull_once(tier_name: str, rng=None) -> str:
+    return sampler.pull_many(tier_name, 1, rng)[0]
 
-def base_value(name_with_mut: str) -> int:
+def pull_many(tier_name: str, n: int, rng=None) -> List[str]:
+    return sampler.pull_many(tier_name, n, rng)
+
+def _parse_value(name_with_mut: str) -> int:
     base, mut = split_name(name_with_mut)
     v = int(CHAR_VALUES.get(base, 0))
-    if mut and mut in MUTATION_MULT:
-        v = int(v * MUTATION_MULT[mut])
+    if mut and mut in catalog.MUT_ID:
+        v = int(v * catalog.MUT_MULT[catalog.MUT_ID[mut]])
+    return v
+
+# 価値表に無い名前（未知のミューテーション表記など）の計算結果
+_VALUE_MISS: Dict[str, int] = {}
+
+def base_value(name_with_mut: str) -> int:
+    # 既知の装飾名は catalog の価値表から1回の辞書引き
+    v = catalog.VALUE_BY_NAME.get(name_with_mut)
+    if v is None:
+        v = _VALUE_MISS.get(name_with_mut)
+        if v is None:
+            v = _VALUE_MISS[sys.intern(name_with_mut)] = _parse_value(name_with_mut)
     return v